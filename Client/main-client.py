@@ -3,8 +3,27 @@ import network
 import time
 import usocket
 import binascii
-import urequests  # 用于 HTTP 请求
 import gc  # 用于内存管理
+from memctl import MemoryManager
+from uhttp import KeepAliveClient  # 长连接HTTP客户端，替代 urequests
+
+DIAG_INTERVAL = 60  # 串口打印内存诊断信息的间隔（秒）
+
+# 后台服务器配置
+SERVER_HOST = '192.168.2.124'
+SERVER_PORT = 9003
+UPLOAD_PATH = '/api/device/eeg/NB001'
+
+# 聚合模式配置
+AGGREGATE_MODE = False  # True: 按窗口聚合上报，抑制未变化帧和零帧
+AGG_WINDOW_MS = 1000  # 聚合窗口（毫秒），0 表示不聚合，只抑制重复的原始帧
+AGG_HEARTBEAT_MS = 10000  # 数据无变化时的保底上报间隔（毫秒）
+AGG_CONFIG_PORT = 9004  # 下行配置UDP端口，可按设备调整窗口和心跳
+
+# 延迟追踪配置
+TRACE_MODE = False  # True: 每帧通过 X-Trace 头附带UART读取/解析/发送时间戳
+SYNC_PORT = 9005  # 服务器时钟同步UDP端口
+TRACE_WIDTH = 72  # X-Trace 头预留宽度
 
 # 定义EEG频段名称
 EEG_BANDS = ["Delta", "Theta", "LowAlpha", "HighAlpha", "LowBeta", "HighBeta", "LowGamma", "MiddleGamma"]
@@ -21,6 +40,21 @@ audio_out = I2S(1, sck=sck_pin, ws=ws_pin, sd=sd_pin, mode=I2S.TX, bits=16, form
 chip_id = binascii.hexlify(unique_id()).decode('utf-8')  # 获取芯片 ID 并转为十六进制字符串
 print("ESP32 芯片 ID:", chip_id)
 
+# 上传连接在多帧之间复用，断开后自动重连
+uplink = KeepAliveClient(SERVER_HOST, SERVER_PORT, UPLOAD_PATH, trace_width=TRACE_WIDTH if TRACE_MODE else 0)
+
+# 延迟追踪：帧时间戳和时钟同步
+trace = None
+clock_sync = None
+if TRACE_MODE:
+    from trace import Clock, ClockSync, FrameTrace
+    clock = Clock()
+    clock_sync = ClockSync(clock, (SERVER_HOST, SYNC_PORT))
+    trace = FrameTrace(clock)
+
+# 内存管理：按阶段统计分配量，只在帧间空闲时回收
+mem = MemoryManager()
+
 def play_audio(filename):
     """播放指定的WAV文件"""
     try:
@@ -69,7 +103,7 @@ def ping_server():
     try:
         sock = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
         sock.settimeout(5)
-        sock.connect(('192.168.2.124', 9003))
+        sock.connect((SERVER_HOST, SERVER_PORT))
         sock.close()
         print("服务器可达")
         return True
@@ -80,25 +114,34 @@ def ping_server():
 def send_to_server(frame):
     """将二进制数据发送到服务器"""
     try:
-        url = f"http://192.168.2.124:9003/api/device/eeg/NB001"
-        headers = {'Content-Type': 'application/octet-stream'}
-        print(f"发送请求到: {url}")
+        print(f"发送请求到: http://{SERVER_HOST}:{SERVER_PORT}{UPLOAD_PATH}")
         print(f"数据长度: {len(frame)} 字节")
         print(f"数据内容: {' '.join('{:02X}'.format(b) for b in frame)}")
         
-        # 释放内存，避免内存不足
-        gc.collect()
+        # 不再每帧回收内存，由主循环在帧间空闲时统一回收
         print(f"发送前可用内存: {gc.mem_free()} 字节")
         
-        response = urequests.post(url, data=frame, headers=headers)
-        print(f"服务器响应状态码: {response.status_code}")
-        print(f"服务器响应内容: {response.text}")
-        response.close()
+        if trace:
+            trace.stamp_send()
+            uplink.set_trace(trace.header_value(clock_sync))
+        status = uplink.post(memoryview(frame))
+        print(f"服务器响应状态码: {status}")
         return True
     except Exception as e:
         print(f"发送数据到服务器失败: {e}")
         return False
 
+def send_aggregate(agg_uplink, record):
+    """将聚合后的JSON记录发送到服务器的聚合接口"""
+    try:
+        print(f"发送聚合数据: {len(record)} 字节")
+        status = agg_uplink.post(record)
+        print(f"服务器响应状态码: {status}")
+        return True
+    except Exception as e:
+        print(f"发送聚合数据失败: {e}")
+        return False
+
 def parse_frame(frame):
     """检查帧格式是否有效，返回0或1"""
     if len(frame) < 36 or frame[:4] != b'\xAA\xAA\x20\x02' or frame[31] != 0x04 or frame[33] != 0x05:
@@ -126,9 +169,23 @@ def main():
     last_reminder_time = 0  # 上次提醒的时间
     first_valid_frame_detected = False  # 标记是否检测到第一次有效帧
     audio_3_played = False  # 标记语音3是否已播放
+    last_diag_time = time.time()
+
+    # 聚合模式：窗口聚合后发往 <UPLOAD_PATH>/agg，可通过下行UDP配置调整
+    aggregator = None
+    config_listener = None
+    if AGGREGATE_MODE:
+        from aggregator import Aggregator, ConfigListener
+        aggregator = Aggregator(AGG_WINDOW_MS, AGG_HEARTBEAT_MS)
+        config_listener = ConfigListener(aggregator, chip_id, AGG_CONFIG_PORT)
+        agg_uplink = KeepAliveClient(SERVER_HOST, SERVER_PORT, UPLOAD_PATH + '/agg', 'application/json')
 
     while True:
+        mem.begin("uart")
         data = uart.read()
+        mem.end()
+        if data and trace:
+            trace.stamp_uart()
         if data:
             print("串口数据:", ' '.join('{:02X}'.format(b) for b in data))
             buffer.extend(data)
@@ -150,6 +207,8 @@ def main():
 
                 if result:
                     print("\n有效帧检测: 1 (帧格式正确)")
+                    if trace:
+                        trace.stamp_parse()
                     current_time = time.time()
                     is_zero_frame = (frame[32] == 0x00 and frame[34] == 0x00)
                     
@@ -169,7 +228,15 @@ def main():
                     
                     # 判断服务器是否可达，只有可达时才发送数据
                     if server_reachable:
-                        send_to_server(frame)
+                        mem.begin("uplink")
+                        if aggregator is None:
+                            send_to_server(frame)
+                        elif aggregator.add(frame, time.ticks_ms()):
+                            if aggregator.window_ms:
+                                send_aggregate(agg_uplink, aggregator.record(chip_id))
+                            else:
+                                send_to_server(frame)  # 不聚合时仍上传原始帧，只抑制重复
+                        mem.end()
                     else:
                         print("服务器不可达，跳过数据发送")
                         
@@ -187,6 +254,19 @@ def main():
                     play_audio("4.wav")  # 播放语音4
                     last_reminder_time = current_time
 
+        # 帧间空闲窗口：按需回收内存，定期打印诊断信息
+        mem.idle()
+        current_time = time.time()
+        if config_listener:
+            config_listener.poll()
+        if clock_sync:
+            clock_sync.poll(time.ticks_ms())
+        if current_time - last_diag_time >= DIAG_INTERVAL:
+            mem.report()
+            if aggregator:
+                print(f"聚合: 输入 {aggregator.frames_in} 帧, 上报 {aggregator.records_out} 条, 抑制 {aggregator.suppressed} 次")
+            last_diag_time = current_time
+
         time.sleep(0.01)
 
 if __name__ == "__main__":
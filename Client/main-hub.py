@@ -0,0 +1,172 @@
+from machine import UART, Pin, I2S, unique_id
+import network
+import time
+import binascii
+import gc
+import neopixel
+from uart_hub import HubChannel, HubSender
+from memctl import MemoryManager
+
+# 多通道集线器模式：一块ESP32同时读取多个TGAM模块，所有通道共用一个批量发送器
+# 每项为 (通道号, UART编号, TX引脚, RX引脚)，ESP32-S3 的 UART0 默认用于REPL
+HUB_CHANNELS = [
+    (0, 1, 1, 2),
+    (1, 2, 17, 16),
+]
+UART_RXBUF = 2048  # 每个UART的硬件接收缓冲区，覆盖发送期间的数据
+HUB_ADDR = ("255.255.255.255", 9003)  # 多通道数据报目标地址
+HUB_BATCH_FRAMES = 16  # 每个通道每批最多帧数
+HUB_FLUSH_MS = 1000  # 合并发送间隔（毫秒）
+DIAG_INTERVAL = 60  # 串口打印诊断信息的间隔（秒）
+NO_DATA_TIMEOUT_MS = 100000  # 通道超过该时间无有效帧时提醒
+
+# 初始化语音模块引脚
+sck_pin = Pin(4)
+ws_pin = Pin(5)
+sd_pin = Pin(3)
+
+# 初始化I2S音频输出
+audio_out = I2S(1, sck=sck_pin, ws=ws_pin, sd=sd_pin, mode=I2S.TX, bits=16, format=I2S.MONO, rate=16000, ibuf=20000)
+
+# 获取设备 ID
+chip_id = binascii.hexlify(unique_id()).decode('utf-8')
+print("ESP32 芯片 ID:", chip_id)
+
+# 定义 NeoPixel 引脚和数量
+RGB_BUILTIN_PIN = 21  # 数据引脚，确保连接正确
+RGB_BUILTIN_COUNT = 1  # 只有一个 NeoPixel
+
+# 初始化 NeoPixel
+np = neopixel.NeoPixel(Pin(RGB_BUILTIN_PIN), RGB_BUILTIN_COUNT)
+
+# 内存管理：按阶段统计分配量，只在帧间空闲时回收
+mem = MemoryManager()
+
+def neopixel_write(r, g, b):
+    """设置 NeoPixel 的 RGB 亮度"""
+    np[0] = (r, g, b)  # 设置第一个 NeoPixel 的颜色
+    np.write()  # 发送数据更新
+
+def play_audio(filename, idle=None):
+    """播放指定的WAV文件；idle 在每写入一块（约32ms音频）后调用，用于在播放期间继续读取各通道UART"""
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(44)  # 跳过WAV文件头44字节
+            wav_samples = bytearray(1024)
+            wav_samples_mv = memoryview(wav_samples)
+            print(f"开始播放 {filename} ...")
+            
+            while True:
+                num_read = f.readinto(wav_samples_mv)
+                if num_read == 0:  # 文件结束
+                    break
+                num_written = 0
+                while num_written < num_read:
+                    num_written += audio_out.write(wav_samples_mv[num_written:num_read])
+                if idle:
+                    idle()
+            print(f"{filename} 播放完成")
+    except Exception as e:
+        print(f"播放 {filename} 时发生错误: {e}")
+
+def connect_wifi():
+    """连接WiFi网络"""
+    play_audio("1-udp.wav")  # 阶段1：开机连接WiFi，播放语音1
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    wlan.connect('JSZN', 'jszn666666')
+    
+    timeout = 10
+    start_time = time.time()
+    
+    while not wlan.isconnected():
+        if time.time() - start_time > timeout:
+            print("WiFi连接超时！")
+            neopixel_write(0, 255, 0)  # WiFi连接失败，常亮红灯
+            return False
+        time.sleep(0.1)
+    
+    print("WiFi连接成功")
+    print(f"IP地址：{wlan.ifconfig()[0]}")
+    play_audio("2.wav")  # 阶段2：WiFi连接成功，播放语音2
+    neopixel_write(0, 0, 255)  # WiFi连接成功，常亮蓝灯
+    return True
+
+def main():
+    # 通电后常亮蓝灯
+    neopixel_write(0, 0, 255)
+    
+    # 每个通道独立的UART和帧同步状态
+    channels = []
+    for ch, uart_id, tx, rx in HUB_CHANNELS:
+        uart = UART(uart_id, baudrate=57600, tx=Pin(tx), rx=Pin(rx), rxbuf=UART_RXBUF)
+        channels.append(HubChannel(ch, uart, rxbuf=UART_RXBUF))
+        print(f"通道 {ch}: UART{uart_id} 已初始化 (TX={tx}, RX={rx})")
+    
+    # 连接WiFi
+    if not connect_wifi():
+        print("程序因WiFi连接失败而终止")
+        return
+    
+    sender = HubSender(chip_id, [c.ch for c in channels], HUB_ADDR, HUB_BATCH_FRAMES, HUB_FLUSH_MS)
+    first_frame_played = False
+    
+    def poll_channels():
+        """语音播放期间读取所有通道，帧暂存在各通道队列中，播放结束后再交给发送器"""
+        for c in channels:
+            c.poll()
+    last_diag_time = time.time()
+    
+    while True:
+        now = time.ticks_ms()
+        
+        # 轮询所有通道，把新帧交给共用发送器
+        mem.begin("uart")
+        got_frame = False
+        now_us = time.ticks_us()
+        for c in channels:
+            c.poll()
+            frame = c.ring.peek()
+            while frame is not None:
+                got_frame = True
+                # 帧的时间取其读取时间（队列中记录的 ticks_us），换算到 ticks_ms，语音播放期间暂存的帧也保留各自的时间
+                sender.add(c.ch, frame, time.ticks_add(now, -(time.ticks_diff(now_us, c.ring.peek_ts()) // 1000)))
+                c.ring.pop()
+                c.last_frame_ms = now
+                frame = c.ring.peek()
+        mem.end()
+        if got_frame and not first_frame_played:
+            play_audio("3.wav", poll_channels)  # 任一通道收到首个有效帧
+            first_frame_played = True
+        
+        if sender.due(now):
+            mem.begin("uplink")
+            if sender.flush(now):
+                neopixel_write(0, 0, 255)  # 数据上传成功，常亮蓝灯
+            else:
+                neopixel_write(0, 255, 0)  # 数据上传失败，红灯
+            mem.end()
+        
+        # 任一通道长时间无有效帧时提醒
+        for c in channels:
+            if time.ticks_diff(now, c.last_frame_ms) > NO_DATA_TIMEOUT_MS:
+                print(f"通道 {c.ch} 超时无有效帧")
+                play_audio("4.wav", poll_channels)
+                c.last_frame_ms = now
+        
+        # 帧间空闲窗口：按需回收内存，定期打印诊断信息
+        mem.idle()
+        current_time = time.time()
+        if current_time - last_diag_time >= DIAG_INTERVAL:
+            for c in channels:
+                s = c.scanner
+                print(f"通道 {c.ch}: 读取 {s.bytes_read} 字节, 有效帧 {s.frames}, 错误帧 {s.bad_frames}, 队列丢弃 {c.ring.dropped}, "
+                      f"UART溢出 {c.overflows} 次, 最大积压 {c.max_backlog}/{UART_RXBUF} 字节")
+            print(f"发送: {sender.datagrams} 个数据报, {sender.frames_sent} 帧, {sender.bytes_sent} 字节, 失败 {sender.send_errors} 次")
+            mem.report()
+            last_diag_time = current_time
+        
+        time.sleep(0.01)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,50 @@
 from machine import UART, Pin, I2S, unique_id
+import machine
 import network
 import time
 import usocket
 import binascii
 import gc
-import ujson
 import neopixel
+import ujson
+from eeg_state import EEGState
+from memctl import MemoryManager
+from profiler import Profiler
+
+# 运行模式配置
+UART_THREAD_MODE = False  # True: 独立线程读取UART并写入帧队列，主循环只负责网络/语音/灯光
+FRAME_RING_SLOTS = 32  # 帧队列槽位数（2的幂），约32秒的TGAM大包
+DIAG_INTERVAL = 60  # 串口打印内存诊断信息的间隔（秒）
+AGGREGATE_MODE = False  # True: 按窗口聚合上报，抑制未变化帧和零帧
+AGG_WINDOW_MS = 1000  # 聚合窗口（毫秒），0 表示不聚合只做变化抑制
+AGG_HEARTBEAT_MS = 10000  # 数据无变化时的保底上报间隔（毫秒）
+AGG_CONFIG_PORT = 9004  # 下行配置UDP端口，可按设备调整窗口和心跳
+RAW_BANDPOWER_MODE = False  # True: 由512Hz原始波形在设备端计算8频段功率，随TGAM数据一起上报
+RAW_WINDOW = 256  # FFT窗口采样数（2的幂），256点对应0.5秒、2Hz分辨率
+RAW_HOP = 128  # 每新增多少个采样计算一次
+TRACE_MODE = False  # True: 每帧附带UART读取/解析/发送时间戳，并与接收端同步时钟
+SYNC_PORT = 9005  # 接收端时钟同步UDP端口
+CAPTURE_FILE = None  # 例如 "/capture.tgcap"：把UART原始数据连同接收时间录制到文件，供主机端 Host/capture.py 回放
+CAPTURE_SECONDS = 300  # 录制时长（秒），到时写入索引并关闭文件
+BURST_MODE = False  # True: 电池供电省电模式，记录缓存在内存中，射频在两次突发之间进入modem sleep
+BURST_INTERVAL_S = 10  # 突发发送间隔（秒），即数据的最大延迟
+BURST_RADIO_OFF = False  # True: 两次突发之间完全关闭WiFi（每次重新连接约1~3秒），适合60秒以上的间隔；
+                         # 此时主循环中射频始终关闭，接收端发现续约、下行配置、时钟同步和耗时诊断HTTP接口均不轮询，不宜与 MQTT_MODE 同用
+BATTERY_MAH = 1000  # 电池容量，用于按电流模型估算续航
+DISCOVERY_MODE = False  # True: 通过组播查询寻找接收端并改为单播发送，找不到时仍使用广播；每次查询或续约在主循环中最多等待应答0.4秒
+OTA_MODE = False  # True: 启动时从局域网OTA服务增量更新程序和语音文件（接收端以 --ota 运行）
+OTA_SERVER = None  # OTA服务地址，None 表示使用发现的接收端（需开启 DISCOVERY_MODE）
+OTA_PORT = 9003
+MQTT_MODE = False  # True: 帧按批次紧凑编码后以QoS1发布到MQTT主题 eeg/<芯片ID>，替代UDP广播
+MQTT_BROKER = None  # MQTT代理地址，None 表示使用发现的接收端（需开启 DISCOVERY_MODE）
+MQTT_PORT = 1883
+MQTT_BATCH_FRAMES = 10  # 每条消息的帧数
+MQTT_BATCH_MS = 10000  # 批次未满时的最长等待时间（毫秒）
+MQTT_WINDOW = 8  # 在途（未收到PUBACK）消息数上限
+LOOP_BUDGET_MS = 5000  # 一轮主循环的耗时预算（毫秒），超过时不喂看门狗；须大于最长的语音播放和闪灯
+WDT_TIMEOUT_MS = 0  # 例如 30000：启用硬件看门狗，主循环连续这么久没有在预算内完成一轮时复位，0 表示不启用
+PROFILE_PORT = None  # 例如 9007：开启主循环耗时诊断HTTP接口（GET /profile，无认证），None 表示只在串口打印
+                     # 开启后主循环每轮轮询该端口，处理一个请求时最多阻塞1秒（等待请求内容），只在调试时开启
 
 # 定义EEG频段名称
 EEG_BANDS = ["Delta", "Theta", "LowAlpha", "HighAlpha", "LowBeta", "HighBeta", "LowGamma", "MiddleGamma"]
@@ -34,11 +73,46 @@ def neopixel_write(r, g, b):
     np[0] = (r, g, b)  # 设置第一个 NeoPixel 的颜色
     np.write()  # 发送数据更新
 
-# 全局变量，用于存储最新的EEG数据
-latest_eeg_data = {"dataReady": 0, "Attention": 0, "Meditation": 0, "Alpha": 0, "Beta": 0, "Gamma": 0}
+# 最新EEG数据：预分配的双缓冲状态记录，HTTP线程可无锁读取一致快照
+eeg_state = EEGState()
+
+# 内存管理：按阶段统计分配量，只在帧间空闲时回收
+mem = MemoryManager()
+
+# 主循环分阶段耗时直方图和看门狗
+prof = Profiler(LOOP_BUDGET_MS)
+
+# 聚合模式下的窗口聚合器，在main()中创建
+aggregator = None
+
+# 原始波形频段功率计算器，在main()中创建
+bandpower = None
+
+# 延迟追踪：帧时间戳和时钟同步，在main()中创建
+trace = None
+clock_sync = None
+
+# UART抓包写入器，在main()中创建
+capture = None
+capture_deadline = 0
+capture_queue = None  # 双线程模式下读取线程交给主循环写入的抓包数据
+
+# 电流模型和突发上行，在main()中创建
+power = None
+burst = None
+
+# 接收端发现，在main()中创建
+discovery = None
+
+# MQTT上行：持久会话客户端和批量编码器，在main()中创建
+mqtt = None
+mqtt_batch = None
+mqtt_batch_start = 0
+mqtt_dropped = 0
 
 def play_audio(filename):
     """播放指定的WAV文件"""
+    t = prof.start()
     try:
         with open(filename, 'rb') as f:
             f.seek(44)  # 跳过WAV文件头44字节
@@ -56,6 +130,7 @@ def play_audio(filename):
             print(f"{filename} 播放完成")
     except Exception as e:
         print(f"播放 {filename} 时发生错误: {e}")
+    prof.stop("audio", t)
 
 def connect_wifi():
     """连接WiFi网络"""
@@ -83,44 +158,30 @@ def connect_wifi():
     return False
 
 def update_eeg_data(frame):
-    """解析frame[18]、frame[24]、frame[30]、frame[32]和frame[34]并更新全局数据"""
-    global latest_eeg_data
-    is_zero_frame = (frame[32] == 0x00 and frame[34] == 0x00)
-    if is_zero_frame:
-        latest_eeg_data = {"dataReady": 0, "Attention": 0, "Meditation": 0, "Alpha": 0, "Beta": 0, "Gamma": 0}
-    else:
-        attention = int(frame[32])
-        meditation = int(frame[34])
-        alpha = min(max(int(frame[17]), 0), 100)
-        beta = min(max(int(frame[23]), 0), 100)
-        gamma = min(max(int(frame[29]), 0), 100)
-
-        latest_eeg_data = {
-            "dataReady": 1,
-            "Attention": attention,
-            "Meditation": meditation,
-            "Alpha": alpha,
-            "Beta": beta,
-            "Gamma": gamma
-        }
-
-def broadcast_udp_json():
-    """通过UDP广播将JSON格式的EEG数据发送到局域网内的所有设备"""
+    """解析frame[17]、frame[23]、frame[29]、frame[32]和frame[34]并发布到eeg_state，不分配新字典"""
+    eeg_state.update(frame)
+
+def broadcast_udp_json(json_data=None):
+    """通过UDP将JSON格式的EEG数据发送到已发现的接收端，未发现时广播到局域网内的所有设备；未指定数据时发送最新EEG状态"""
     try:
         sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
-        sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_BROADCAST, 1)
-        broadcast_addr = ("255.255.255.255", 9003)
-        json_data = ujson.dumps(latest_eeg_data).encode('utf-8')
+        broadcast_addr = discovery.addr if discovery else ("255.255.255.255", 9003)
+        is_broadcast = broadcast_addr[0] == "255.255.255.255"
+        if is_broadcast:
+            sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_BROADCAST, 1)
+        if json_data is None:
+            json_data = eeg_state.json()  # 数据未变化时复用已序列化的字节串
         
-        print(f"UDP广播JSON数据到 {broadcast_addr}")
+        print(f"UDP{'广播' if is_broadcast else '单播'}JSON数据到 {broadcast_addr}")
         print(f"JSON数据: {json_data.decode('utf-8')}")
         print(f"数据长度: {len(json_data)} 字节")
         
-        gc.collect()
         print(f"发送前可用内存: {gc.mem_free()} 字节")
         
         sock.sendto(json_data, broadcast_addr)
         sock.close()
+        if power:
+            power.tx(len(json_data), is_broadcast)
         print("UDP JSON广播发送成功")
         neopixel_write(0, 0, 255)  # 数据上传成功，常亮蓝灯
         return True
@@ -140,12 +201,139 @@ def parse_frame(frame):
         return 0
     return 1
 
+def blink_frame_error():
+    """帧格式错误，闪烁红灯"""
+    t = prof.start()
+    for _ in range(2):  # 闪烁两次
+        neopixel_write(0, 255, 0)  # 红灯亮
+        time.sleep(0.5)
+        neopixel_write(0, 255, 0)  # 红灯灭
+        time.sleep(0.5)
+    neopixel_write(0, 255, 0)  # 恢复蓝灯
+    prof.stop("led", t)
+
+def handle_valid_frame(frame, frame_status_played):
+    """处理一帧有效数据并上传，返回更新后的语音播放标记"""
+    print("\n有效帧检测: 1 (帧格式正确)")
+    if trace:
+        trace.stamp_parse()
+    is_zero_frame = (frame[32] == 0x00 and frame[34] == 0x00)
+    
+    # 更新EEG数据
+    mem.begin("update")
+    t = prof.start()
+    update_eeg_data(frame)
+    prof.stop("update", t)
+    mem.end()
+    
+    # 只在首次判断帧状态时播放语音
+    if not frame_status_played:
+        if is_zero_frame:
+            play_audio("4.wav")  # 零帧播放语音4
+        else:
+            play_audio("3.wav")  # 非零帧播放语音3
+    
+    mem.begin("uplink")
+    t = prof.start()
+    if mqtt:
+        mqtt_add(frame)
+        prof.stop("uplink", t)
+        mem.end()
+        return True
+    payload = None  # None 表示发送最新EEG状态
+    send = True
+    if bandpower is not None:
+        # 设备端计算的频段功率随TGAM数据一起上报
+        data = eeg_state.as_dict()
+        data["RawBands"] = bandpower.as_dict()
+        payload = ujson.dumps(data).encode('utf-8')
+    elif aggregator is not None:
+        send = aggregator.add(frame, time.ticks_ms())
+        if send:
+            payload = aggregator.record(chip_id)
+    if send:
+        if trace:
+            # 在JSON末尾追加追踪字段，聚合记录中已带有id
+            trace.stamp_send()
+            suffix = trace.json_suffix(clock_sync, None if aggregator else chip_id)
+            payload = (payload or eeg_state.json())[:-1] + suffix.encode('utf-8') + b'}'
+        if burst:
+            burst.add(payload or eeg_state.json())  # 缓存到下一次突发，射频保持休眠
+        else:
+            broadcast_udp_json(payload)
+    prof.stop("uplink", t)
+    mem.end()
+    return True
+
+def mqtt_add(frame):
+    """把一帧加入当前批次，达到批次帧数时发布"""
+    global mqtt_batch_start
+    now = time.ticks_ms()
+    if mqtt_batch.count == 0:
+        mqtt_batch.reset(now)
+        mqtt_batch_start = now
+    mqtt_batch.add(frame, now)
+    if mqtt_batch.count >= MQTT_BATCH_FRAMES:
+        mqtt_flush()
+
+def mqtt_flush():
+    """以QoS1发布当前批次；在途窗口已满或断线时批次继续累积，编码器满时丢弃该批次"""
+    global mqtt_dropped
+    if mqtt.publish("eeg/" + chip_id, mqtt_batch.payload()):
+        mqtt_batch.reset()
+    elif mqtt_batch.full():
+        mqtt_dropped += mqtt_batch.count
+        mqtt_batch.reset()
+
+def capture_data(data, ticks_us=None):
+    """录制一块UART数据，达到录制时长后写入索引并关闭文件"""
+    global capture
+    if capture is None:
+        return
+    capture.write(data, ticks_us)
+    if time.ticks_diff(time.ticks_ms(), capture_deadline) >= 0:
+        capture.close()
+        print(f"抓包完成: {capture.records} 条记录, {capture.bytes} 字节 -> {CAPTURE_FILE}" +
+              (f", 队列满丢弃 {capture_queue.dropped} 字节" if capture_queue and capture_queue.dropped else ""))
+        capture = None
+
+def ota_update():
+    """从OTA服务增量更新文件，更新了程序文件时重启"""
+    host = OTA_SERVER or (discovery.addr[0] if discovery and discovery.unicast else None)
+    if host is None:
+        print("OTA: 未找到OTA服务，跳过更新")
+        return
+    from ota import OtaClient
+    client = OtaClient(host, OTA_PORT)
+    t0 = time.ticks_ms()
+    try:
+        updated = client.update()
+    except OSError as e:
+        print(f"OTA更新失败: {e}")
+        return
+    print(f"OTA: 更新 {len(updated)} 个文件, 下载 {client.downloaded} 字节, 复用 {client.copied} 字节, "
+          f"{client.requests} 个请求, 耗时 {time.ticks_diff(time.ticks_ms(), t0)}ms")
+    if any(p.endswith(".py") for p in updated):
+        print("OTA: 程序已更新，重启")
+        machine.reset()
+
 def main():
+    global aggregator, bandpower, trace, clock_sync, capture, capture_deadline, capture_queue, power, burst, discovery, mqtt, mqtt_batch
     # 通电后常亮蓝灯
     neopixel_write(0, 0, 255)
     
-    # 配置UART1
-    uart = UART(1, baudrate=57600, tx=Pin(1), rx=Pin(2))
+    # 完成上次被中断的OTA提交
+    if OTA_MODE:
+        from ota import recover
+        recover()
+    
+    # 配置UART1，原始波形模式下约5.7KB/s，加大接收缓冲区以覆盖FFT计算时间
+    if RAW_BANDPOWER_MODE:
+        from bandpower import BandPower
+        bandpower = BandPower(RAW_WINDOW, RAW_HOP)
+        uart = UART(1, baudrate=57600, tx=Pin(1), rx=Pin(2), rxbuf=4096)
+    else:
+        uart = UART(1, baudrate=57600, tx=Pin(1), rx=Pin(2))
     print("UART2 已初始化，等待数据...")
     
     # 连接WiFi
@@ -153,6 +341,37 @@ def main():
         print("程序因WiFi连接失败而终止")
         return
     
+    # 接收端发现：组播查询，收到应答后改为单播，接收端无应答时回退到广播
+    if DISCOVERY_MODE:
+        from discovery import Discovery
+        discovery = Discovery(chip_id)
+        discovery.poll(time.ticks_ms())
+    
+    if OTA_MODE:
+        ota_update()
+    
+    # MQTT上行：编码器可容纳4个批次，在途窗口满或断线期间继续累积
+    if MQTT_MODE:
+        from eegcodec import BatchEncoder
+        from mqtt import MQTTClient
+        broker = MQTT_BROKER or (discovery.addr[0] if discovery and discovery.unicast else None)
+        if broker is None:
+            print("MQTT: 未找到代理，使用UDP广播")
+        else:
+            mqtt_batch = BatchEncoder(MQTT_BATCH_FRAMES * 4)
+            mqtt = MQTTClient(chip_id, broker, MQTT_PORT, window=MQTT_WINDOW, max_packet=2048)
+            mqtt.poll()
+            print(f"MQTT上行: {broker}:{MQTT_PORT}, 主题 eeg/{chip_id}, 每批 {MQTT_BATCH_FRAMES} 帧")
+    
+    # 电流模型：按射频状态和发送量估算平均电流和续航；突发模式下射频只在发送时开启
+    from power import PowerModel
+    power = PowerModel(BATTERY_MAH)
+    if BURST_MODE:
+        from power import BurstUplink
+        burst = BurstUplink(BURST_INTERVAL_S * 1000, addr=discovery.addr if discovery else ("255.255.255.255", 9003),
+                            radio_off=BURST_RADIO_OFF, power=power)
+        print(f"突发上行模式: 每 {BURST_INTERVAL_S} 秒发送一次" + ("，间隔内关闭WiFi" if BURST_RADIO_OFF else ""))
+    
     buffer = bytearray()
     start_sequence = b'\xAA\xAA\x20\x02'
     
@@ -160,11 +379,100 @@ def main():
     last_valid_frame_time = time.time()
     last_reminder_time = 0
     frame_status_played = False  # 是否已经播放了帧状态语音
+    last_diag_time = time.time()
+    
+    # 延迟追踪：先以广播寻找接收端，收到应答后改为单播同步
+    if TRACE_MODE:
+        from trace import Clock, ClockSync, FrameTrace
+        clock = Clock()
+        sync_addr = (discovery.addr[0], discovery.sync_port) if discovery and discovery.sync_port else ("255.255.255.255", SYNC_PORT)
+        clock_sync = ClockSync(clock, sync_addr)
+        trace = FrameTrace(clock)
+    
+    # 聚合模式：窗口聚合并抑制重复帧，可通过下行UDP配置调整
+    config_listener = None
+    if AGGREGATE_MODE:
+        from aggregator import Aggregator, ConfigListener
+        aggregator = Aggregator(AGG_WINDOW_MS, AGG_HEARTBEAT_MS)
+        config_listener = ConfigListener(aggregator, chip_id, AGG_CONFIG_PORT)
+    
+    # 抓包：录制原始串口数据，用于在主机上按原始节奏回放
+    if CAPTURE_FILE:
+        from capture import CaptureWriter
+        capture = CaptureWriter(CAPTURE_FILE, 57600)
+        capture_deadline = time.ticks_add(time.ticks_ms(), CAPTURE_SECONDS * 1000)
+        print(f"开始抓包 -> {CAPTURE_FILE}，时长 {CAPTURE_SECONDS} 秒")
+    
+    # 双线程模式：UART由独立线程读取，网络阻塞不会导致串口溢出
+    reader = None
+    if UART_THREAD_MODE:
+        from frame_ring import FrameRing
+        from uart_reader import UartReader
+        ring = FrameRing(FRAME_RING_SLOTS)
+        raw_sink = bandpower.feed if bandpower else None
+        if capture:
+            # 读取线程只把数据复制到预分配的队列，由主循环写入闪存，避免写入阻塞读取导致串口溢出
+            from capture import CaptureQueue
+            capture_queue = CaptureQueue()
+            def raw_sink(data, feed=raw_sink):
+                if capture is not None:
+                    capture_queue.push(data, time.ticks_us())
+                if feed:
+                    feed(data)
+        reader = UartReader(uart, ring, raw_sink=raw_sink)
+        reader.start()
+        bad_frames_seen = 0
+        print("UART读取线程已启动")
+    
+    # 诊断接口：串口定期打印，另可通过HTTP随时获取各阶段耗时直方图
+    profile_server = None
+    if PROFILE_PORT:
+        from profiler import ProfileServer
+        profile_server = ProfileServer(prof, PROFILE_PORT)
+        print(f"耗时诊断: http://<设备IP>:{PROFILE_PORT}/profile")
+    # 看门狗在启动阶段的WiFi连接、OTA等阻塞操作之后启动，此后每轮主循环在预算内完成才喂狗
+    if WDT_TIMEOUT_MS:
+        prof.watchdog(WDT_TIMEOUT_MS)
+        print(f"看门狗已启动: 超时 {WDT_TIMEOUT_MS}ms, 每轮预算 {LOOP_BUDGET_MS}ms")
+    prof.reset()  # 不统计启动阶段
     
     while True:
-        data = uart.read()
+        if reader:
+            t = prof.start()
+            frame = ring.peek()
+            while frame is not None:
+                if trace:
+                    trace.stamp_uart(ring.peek_ts())
+                frame_status_played = handle_valid_frame(frame, frame_status_played)
+                ring.pop()
+                last_valid_frame_time = time.time()
+                frame = ring.peek()
+            if reader.bad_frames != bad_frames_seen:
+                print(f"\n有效帧检测: 0 (帧格式错误 {reader.bad_frames - bad_frames_seen} 帧, 队列丢弃 {ring.dropped} 帧)")
+                bad_frames_seen = reader.bad_frames
+                blink_frame_error()
+            prof.stop("frames", t, outer=True)
+            if capture:
+                t = prof.start()
+                capture_queue.drain(capture_data)
+                prof.stop("capture", t)
+            data = None
+        else:
+            mem.begin("uart")
+            t = prof.start()
+            data = uart.read()
+            prof.stop("uart", t)
+            mem.end()
+            if data and trace:
+                trace.stamp_uart()
+            if data and capture:
+                capture_data(data)
         if data:
-            print("串口数据:", ' '.join('{:02X}'.format(b) for b in data))
+            t = prof.start()
+            if bandpower:
+                bandpower.feed(data)  # 每秒512个原始包，不再逐块打印十六进制
+            else:
+                print("串口数据:", ' '.join('{:02X}'.format(b) for b in data))
             buffer.extend(data)
 
             while len(buffer) >= 36:
@@ -183,33 +491,14 @@ def main():
                 result = parse_frame(frame)
 
                 if result:
-                    print("\n有效帧检测: 1 (帧格式正确)")
-                    is_zero_frame = (frame[32] == 0x00 and frame[34] == 0x00)
-                    
-                    # 更新EEG数据
-                    update_eeg_data(frame)
-                    
-                    # 只在首次判断帧状态时播放语音
-                    if not frame_status_played:
-                        if is_zero_frame:
-                            play_audio("4.wav")  # 零帧播放语音4
-                        else:
-                            play_audio("3.wav")  # 非零帧播放语音3
-                        frame_status_played = True
-                    
-                    broadcast_udp_json()
+                    frame_status_played = handle_valid_frame(frame, frame_status_played)
                     last_valid_frame_time = time.time()
                 else:
                     print("\n有效帧检测: 0 (帧格式错误)")
-                    # 帧格式错误，闪烁红灯
-                    for _ in range(2):  # 闪烁两次
-                        neopixel_write(0, 255, 0)  # 红灯亮
-                        time.sleep(0.5)
-                        neopixel_write(0, 255, 0)  # 红灯灭
-                        time.sleep(0.5)
-                    neopixel_write(0, 255, 0)  # 恢复蓝灯
+                    blink_frame_error()
 
                 buffer = buffer[36:]
+            prof.stop("frames", t, outer=True)
 
         # 超时逻辑：超过100秒没有有效帧时，播放语音4并闪烁红灯
         current_time = time.time()
@@ -217,15 +506,71 @@ def main():
             if current_time - last_reminder_time >= 100:  # 每100秒提醒一次
                 play_audio("4.wav")
                 # 闪烁红灯
+                t = prof.start()
                 for _ in range(2):  # 闪烁两次
                     neopixel_write(255, 0, 0)  # 红灯亮
                     time.sleep(0.5)
                     neopixel_write(0, 0, 0)  # 红灯灭
                     time.sleep(0.5)
                 neopixel_write(0, 0, 255)  # 恢复蓝灯
+                prof.stop("led", t)
                 last_reminder_time = current_time
 
+        # 累积满一个hop的原始采样后计算频段功率
+        if bandpower and bandpower.ready:
+            mem.begin("bandpower")
+            t = prof.start()
+            bandpower.compute()
+            prof.stop("bandpower", t)
+            mem.end()
+
+        # 帧间空闲窗口：按需回收内存，定期打印诊断信息
+        t = prof.start()
+        mem.idle()
+        # 关闭WiFi的突发模式下网络接口在主循环中始终关闭，只使用启动时的发现结果，不轮询网络
+        radio_up = not (burst and BURST_RADIO_OFF)
+        if profile_server and radio_up:
+            profile_server.poll()
+        if config_listener and radio_up:
+            config_listener.poll()
+        if clock_sync and radio_up:
+            clock_sync.poll(time.ticks_ms())
+        if discovery and radio_up and discovery.poll(time.ticks_ms()):
+            if burst:
+                burst.addr = discovery.addr
+            if clock_sync and discovery.sync_port:
+                clock_sync.addr = (discovery.addr[0], discovery.sync_port)
+        # 突发发送和MQTT重连可能阻塞数秒，单独计时以便归因
+        if burst:
+            t1 = prof.start()
+            burst.poll()
+            prof.stop("burst", t1)
+        if mqtt:
+            t1 = prof.start()
+            mqtt.poll()
+            if mqtt_batch.count and time.ticks_diff(time.ticks_ms(), mqtt_batch_start) >= MQTT_BATCH_MS:
+                mqtt_flush()
+            prof.stop("mqtt", t1)
+        prof.stop("idle", t, outer=True)
+        if current_time - last_diag_time >= DIAG_INTERVAL:
+            mem.report()
+            prof.report()
+            if aggregator:
+                print(f"聚合: 输入 {aggregator.frames_in} 帧, 上报 {aggregator.records_out} 条, 抑制 {aggregator.suppressed} 次")
+            if bandpower:
+                print(f"原始波形: {bandpower.samples} 个采样, 坏包 {bandpower.bad_packets} 个, FFT耗时 {bandpower.compute_us}us (最大 {bandpower.compute_max_us}us), 超时 {bandpower.overruns} 次, 重新复制窗口 {bandpower.retries} 次")
+            if discovery:
+                print(f"接收端: {discovery.addr}{'（单播）' if discovery.unicast else '（广播）'}, 查询 {discovery.queries} 次, 回退 {discovery.fallbacks} 次")
+            if mqtt:
+                print(f"MQTT: {mqtt.stats()}, 丢弃 {mqtt_dropped} 帧")
+            ps = power.stats()
+            print(f"电流模型: 平均 {ps['avg_ma']}mA, 射频开启 {ps['radio_on_ms']}/{ps['ms']}ms, 发送 {ps['tx_packets']} 包 {ps['tx_bytes']} 字节, 预计续航 {ps['hours']} 小时")
+            if burst:
+                print(f"突发上行: {burst.bursts} 次, 上次 {burst.last_burst_bytes} 字节/{burst.last_burst_ms}ms, 最大 {burst.max_burst_bytes} 字节, 提前 {burst.early} 次, 失败 {burst.failures} 次, 丢弃 {burst.dropped} 条")
+            last_diag_time = current_time
+
         time.sleep(0.01)
+        prof.end_iteration()
 
 if __name__ == "__main__":
     main()
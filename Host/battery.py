@@ -0,0 +1,107 @@
+"""按固件的电流模型估算各上行模式的平均电流和电池续航，常数与 lib/power.py 对应
+
+用法:
+  python battery.py estimate [--battery 1000] [--rate 1] [--bytes 110] [--intervals 1,5,10,30,60] [--off-intervals 60,300]
+  python battery.py log serial.log     # 读取设备串口日志中的“电流模型”诊断行
+"""
+import argparse
+import math
+import re
+
+CURRENT_BASE = 30
+CURRENT_BOARD = 30
+CURRENT_RADIO = {"none": 70, "performance": 12, "powersave": 3, "connect": 90, "off": 0}
+CURRENT_TX = 250
+TX_TAIL_MS = 20
+BCAST_MBPS = 1
+UCAST_MBPS = 54
+MAC_OVERHEAD = 70
+BURST_WAKE_MS = 30  # 每次突发切换省电模式、创建套接字和发送的固定耗时（射频常开）
+AGE_SUFFIX = 14  # 突发记录追加的 ', "age": NNNNN' 字节数
+MTU = 1400
+
+def airtime_us(nbytes, broadcast=True):
+    """与 lib/power.py 的 airtime_us 相同"""
+    if broadcast:
+        return 192 + 50 + (nbytes + MAC_OVERHEAD) * 8 // BCAST_MBPS
+    return 20 + 34 + 67 + (nbytes + MAC_OVERHEAD) * 8 // UCAST_MBPS + 10 + 44
+
+def per_frame(rate, nbytes, broadcast=True):
+    """现有模式：每帧立即发送，射频保持默认省电（DTIM1），返回每秒的 (电荷mA·ms, 射频开启ms, 空口us)"""
+    air = airtime_us(nbytes, broadcast) * rate
+    charge = 1000 * (CURRENT_BASE + CURRENT_BOARD + CURRENT_RADIO["performance"])
+    charge += air * CURRENT_TX / 1000 + rate * TX_TAIL_MS * CURRENT_RADIO["none"]
+    return charge, rate * TX_TAIL_MS + air / 1000, air
+
+def burst(rate, nbytes, interval_s, broadcast=True, radio_off=False, connect_ms=2000):
+    """突发模式：每interval_s秒发送一次，记录按MTU打包，返回每秒的 (电荷mA·ms, 射频开启ms, 空口us)"""
+    records = rate * interval_s
+    per_dgram = max(1, (MTU + 1) // (nbytes + AGE_SUFFIX + 1))
+    dgrams = math.ceil(records / per_dgram)
+    payload = records * (nbytes + AGE_SUFFIX + 1)
+    air = dgrams * airtime_us(payload / dgrams, broadcast) if dgrams else 0
+    on_ms = BURST_WAKE_MS + air / 1000
+    sleep_state = "off" if radio_off else "powersave"
+    period = interval_s * 1000
+    charge = period * (CURRENT_BASE + CURRENT_BOARD)
+    charge += on_ms * CURRENT_RADIO["none"] + air * CURRENT_TX / 1000
+    if radio_off:
+        charge += connect_ms * CURRENT_RADIO["connect"]
+        on_ms += connect_ms
+    charge += max(period - on_ms, 0) * CURRENT_RADIO[sleep_state]
+    return charge / interval_s, on_ms / interval_s, air / interval_s
+
+def estimate(args):
+    rows = [("逐帧广播（现有）", 1 / args.rate, per_frame(args.rate, args.bytes, not args.unicast))]
+    for s in args.intervals:
+        rows.append((f"突发 {s:g}秒 modem sleep", s, burst(args.rate, args.bytes, s, not args.unicast)))
+    for s in args.off_intervals:
+        rows.append((f"突发 {s:g}秒 关闭WiFi", s + args.connect_ms / 1000,
+                     burst(args.rate, args.bytes, s, not args.unicast, True, args.connect_ms)))
+    print(f"电池 {args.battery}mAh, {args.rate:g} 帧/秒, 每帧 {args.bytes} 字节, "
+          f"{'单播' if args.unicast else '广播'}, 固定电流 {CURRENT_BASE + CURRENT_BOARD}mA")
+    print(f"{'模式':<22}{'最大延迟s':>10}{'平均mA':>10}{'射频开启%':>10}{'空口ms/时':>12}{'续航h':>9}")
+    for name, latency, (charge, on_ms, air_us) in rows:
+        avg_ma = charge / 1000
+        print(f"{name:<22}{latency:>10.1f}{avg_ma:>10.1f}{on_ms / 10:>10.2f}{air_us * 3.6:>12.0f}"
+              f"{args.battery / avg_ma:>9.1f}")
+
+_LOG_RE = re.compile(r"电流模型: 平均 ([\d.]+)mA, 射频开启 (\d+)/(\d+)ms, 发送 (\d+) 包 (\d+) 字节, 预计续航 ([\d.]+) 小时")
+
+def log(args):
+    """汇总设备串口日志中的电流模型诊断行（固件每 DIAG_INTERVAL 秒打印一次累计值）"""
+    last = None
+    with open(args.file, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            m = _LOG_RE.search(line)
+            if m:
+                last = m
+                print(f"运行 {int(m[3]) / 1000:.0f} 秒: 平均 {m[1]}mA, 射频开启 {int(m[2]) / max(int(m[3]), 1) * 100:.2f}%, "
+                      f"{m[4]} 包")
+    if last is None:
+        print("日志中没有电流模型诊断行")
+        return
+    print(f"按 {args.battery}mAh 估算续航 {args.battery / float(last[1]):.1f} 小时")
+
+def main():
+    parser = argparse.ArgumentParser(description="上行模式电池续航估算")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("estimate", help="比较逐帧发送和各突发间隔")
+    p.add_argument("--battery", type=float, default=1000, help="电池容量mAh")
+    p.add_argument("--rate", type=float, default=1, help="每秒帧数（TGAM大包为1）")
+    p.add_argument("--bytes", type=int, default=110, help="每条JSON记录的字节数")
+    p.add_argument("--intervals", type=lambda s: [float(x) for x in s.split(",")], default=[1, 5, 10, 30, 60])
+    p.add_argument("--off-intervals", type=lambda s: [float(x) for x in s.split(",")], default=[60, 300])
+    p.add_argument("--connect-ms", type=float, default=2000, help="关闭WiFi模式下每次重新连接的时间")
+    p.add_argument("--unicast", action="store_true", help="按单播速率计算空口时间")
+    p = sub.add_parser("log", help="读取设备串口日志")
+    p.add_argument("file")
+    p.add_argument("--battery", type=float, default=1000)
+    args = parser.parse_args()
+    if args.cmd == "log":
+        log(args)
+    else:
+        estimate(args)
+
+if __name__ == "__main__":
+    main()
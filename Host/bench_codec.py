@@ -0,0 +1,41 @@
+"""对比原始帧、JSON与批量紧凑编码的压缩率和编解码吞吐量
+
+用法: python bench_codec.py [帧数]
+"""
+import sys
+import time
+
+from eegcodec import decode_batch, decode_batch_py, encode_batch
+from tgam import eeg_json, synth_frames
+
+def timed(fn, repeat=3):
+    """返回多次运行中的最短耗时（秒）和结果"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, result
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    frames = list(synth_frames(n, seed=1, zero_ratio=0.05))
+    timestamps = [k * 1000 for k in range(n)]
+    raw_size = 36 * n
+    json_size = sum(len(eeg_json(f)) for f in frames)
+    print(f"帧数: {n}")
+    print(f"{'格式':<16}{'字节/帧':>10}{'压缩比':>10}{'编码 帧/秒':>14}{'解码(py) 帧/秒':>18}{'解码(numpy) 帧/秒':>20}")
+    print(f"{'原始36字节帧':<16}{36:>10.1f}{1:>10.2f}")
+    print(f"{'UDP JSON':<16}{json_size / n:>10.1f}{raw_size / json_size:>10.2f}")
+    for batch in (1, 8, 32, 128):
+        groups = [(frames[i:i + batch], timestamps[i:i + batch]) for i in range(0, n, batch)]
+        t_enc, encoded = timed(lambda: [encode_batch(f, t) for f, t in groups])
+        size = sum(len(e) for e in encoded)
+        t_py, _ = timed(lambda: [decode_batch_py(e) for e in encoded], repeat=1)
+        t_np, _ = timed(lambda: [decode_batch(e) for e in encoded])
+        print(f"{'紧凑编码 x' + str(batch):<16}{size / n:>10.1f}{raw_size / size:>10.2f}"
+              f"{n / t_enc:>14.0f}{n / t_py:>18.0f}{n / t_np:>20.0f}")
+
+if __name__ == "__main__":
+    main()
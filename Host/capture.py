@@ -0,0 +1,361 @@
+"""TGAM串口抓包文件（.tgcap）的读写、录制和N倍速回放工具，格式见 lib/capture.py
+
+用法:
+  python capture.py record out.tgcap --port /dev/ttyUSB0 [--baud 57600] [--seconds 60]
+  python capture.py info cap.tgcap
+  python capture.py check [cap.tgcap]      # 核对按索引定位读取与从头读取的结果，省略文件时用合成数据
+  python capture.py replay cap.tgcap [--speed 1 | --speed 0] [--start 秒] [--to udp://主机:端口 | serial:/dev/ttyUSB1 | stdout | parse]
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+from tgam import FRAME_LEN, START_SEQUENCE, parse_frame
+
+MAGIC = b'TGCP'
+INDEX_MAGIC = b'TGIX'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHII')  # 魔数, 版本, 标志, 保留, 波特率, 开始时间Unix秒
+RECORD = struct.Struct('<IH')  # 与上一条的时间差us, 长度
+INDEX_ENTRY = struct.Struct('<II')  # 时间ms, 记录偏移
+TRAILER = struct.Struct('<4sII')  # 'TGIX', 索引偏移, 索引条数
+
+class CaptureWriter:
+    """主机端抓包写入器，与设备端 lib/capture.py 格式相同"""
+
+    def __init__(self, path, baud=57600, start_unix=None, index_ms=1000):
+        self.f = open(path, 'wb')
+        start_unix = int(time.time()) if start_unix is None else start_unix
+        self.f.write(HEADER.pack(MAGIC, VERSION, 0, 0, baud, start_unix))
+        self.index_ms = index_ms
+        self._index = []
+        self._offset = HEADER.size
+        self._last_us = None
+        self._elapsed_us = 0
+        self._next_index_ms = 0
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, data, t_us=None):
+        """写入一个数据块，t_us为单调时钟微秒，省略时取当前时间"""
+        if len(data) > 0xFFFF:
+            for i in range(0, len(data), 0xFFFF):
+                self.write(data[i:i + 0xFFFF], t_us)
+            return
+        t_us = time.monotonic_ns() // 1000 if t_us is None else t_us
+        delta = 0 if self._last_us is None else max(0, t_us - self._last_us)
+        self._last_us = t_us
+        self._elapsed_us += delta
+        t_ms = self._elapsed_us // 1000
+        if t_ms >= self._next_index_ms:
+            self._index.append((t_ms, self._offset))
+            self._next_index_ms = t_ms + self.index_ms
+        self.f.write(RECORD.pack(delta, len(data)))
+        self.f.write(data)
+        self._offset += RECORD.size + len(data)
+        self.records += 1
+        self.bytes += len(data)
+
+    def close(self):
+        index_offset = self._offset
+        for entry in self._index:
+            self.f.write(INDEX_ENTRY.pack(*entry))
+        self.f.write(TRAILER.pack(INDEX_MAGIC, index_offset, len(self._index)))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CaptureReader:
+    """抓包读取器：读取文件头和索引（缺失时扫描重建），按时间定位并逐条读取记录"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'rb')
+        head = self.f.read(HEADER.size)
+        magic, version, self.flags, _, self.baud, self.start_unix = HEADER.unpack(head)
+        if magic != MAGIC:
+            raise ValueError(f"{path} 不是TGAM抓包文件")
+        if version != VERSION:
+            raise ValueError(f"不支持的抓包文件版本: {version}")
+        self.size = os.path.getsize(path)
+        self.data_end, self.index = self._load_index()
+
+    def _load_index(self):
+        if self.size >= HEADER.size + TRAILER.size:
+            self.f.seek(self.size - TRAILER.size)
+            magic, index_offset, count = TRAILER.unpack(self.f.read(TRAILER.size))
+            if magic == INDEX_MAGIC and index_offset + count * INDEX_ENTRY.size + TRAILER.size == self.size:
+                self.f.seek(index_offset)
+                raw = self.f.read(count * INDEX_ENTRY.size)
+                return index_offset, [INDEX_ENTRY.unpack_from(raw, i * INDEX_ENTRY.size) for i in range(count)]
+        return self._rebuild_index()
+
+    def _rebuild_index(self, index_ms=1000):
+        """文件未正常关闭时扫描全部记录重建索引，截断末尾不完整的记录"""
+        index = []
+        offset = HEADER.size
+        elapsed = 0
+        next_ms = 0
+        self.f.seek(offset)
+        while offset + RECORD.size <= self.size:
+            delta, n = RECORD.unpack(self.f.read(RECORD.size))
+            if offset + RECORD.size + n > self.size:
+                break
+            elapsed += delta
+            if elapsed // 1000 >= next_ms:
+                index.append((elapsed // 1000, offset))
+                next_ms = elapsed // 1000 + index_ms
+            self.f.seek(n, os.SEEK_CUR)
+            offset += RECORD.size + n
+        return offset, index
+
+    def seek_offset(self, t_s):
+        """返回不晚于t_s秒的最近索引点 (时间us, 偏移)"""
+        best = (0, HEADER.size)
+        start_us = round(t_s * 1e6)  # 按整数微秒比较，避免 1.007*1000 < 1007 之类的浮点误差
+        for t_ms, off in self.index:
+            if t_ms * 1000 > start_us:
+                break
+            best = (t_ms * 1000, off)
+        return best
+
+    def records(self, start_s=0.0):
+        """依次产生 (相对开始的时间us, 数据)，从start_s秒开始（索引精度为毫秒）"""
+        t_us, offset = self.seek_offset(start_s) if start_s else (0, HEADER.size)
+        first = True
+        self.f.seek(offset)
+        start_us = round(start_s * 1e6)
+        while offset + RECORD.size <= self.data_end:
+            delta, n = RECORD.unpack(self.f.read(RECORD.size))
+            data = self.f.read(n)
+            # 索引时间即为该记录自身的时间（文件开头的记录差值为0），读到的第一条记录不累加差值
+            if not first:
+                t_us += delta
+            first = False
+            offset += RECORD.size + n
+            if t_us >= start_us:
+                yield t_us, data
+
+    def info(self):
+        records = nbytes = frames = 0
+        duration = 0
+        scan = bytearray()
+        for t_us, data in self.records():
+            records += 1
+            nbytes += len(data)
+            duration = t_us
+            scan += data
+            frames += count_frames(scan)
+        return {"records": records, "bytes": nbytes, "duration_s": duration / 1e6, "frames": frames,
+                "baud": self.baud, "start_unix": self.start_unix, "index_entries": len(self.index)}
+
+    def close(self):
+        self.f.close()
+
+def count_frames(buffer):
+    """按固件的同步方式统计并移除buffer中的完整有效帧，返回帧数"""
+    n = 0
+    pos = 0
+    while len(buffer) - pos >= FRAME_LEN:
+        idx = buffer.find(START_SEQUENCE, pos)
+        if idx < 0:
+            pos = len(buffer) - 3
+            break
+        if len(buffer) - idx < FRAME_LEN:
+            pos = idx
+            break
+        if parse_frame(buffer[idx:idx + FRAME_LEN]):
+            n += 1
+        pos = idx + FRAME_LEN
+    del buffer[:pos]
+    return n
+
+def replay(reader, sink, speed=1.0, start_s=0.0, loop=False):
+    """把抓包数据按原始节奏的speed倍送入sink(data)；speed为0时尽可能快地回放"""
+    while True:
+        wall0 = time.perf_counter()
+        t0 = None
+        for t_us, data in reader.records(start_s):
+            if t0 is None:
+                t0 = t_us
+            if speed > 0:
+                wait = (t_us - t0) / 1e6 / speed - (time.perf_counter() - wall0)
+                if wait > 0:
+                    time.sleep(wait)
+            sink(data)
+        if not loop:
+            break
+
+class ReplayUART:
+    """模拟 machine.UART 的 read()/readinto()/any()，按回放时钟返回已到达的数据，用于在主机上驱动固件解析代码"""
+
+    def __init__(self, reader, speed=1.0, start_s=0.0):
+        self._records = reader.records(start_s)
+        self.speed = speed
+        self._pending = bytearray()
+        self._next = next(self._records, None)
+        self._t0 = self._next[0] if self._next else 0
+        self._wall0 = time.perf_counter()
+        self.eof = self._next is None
+
+    def _pull(self):
+        if self.speed > 0:
+            now_us = self._t0 + (time.perf_counter() - self._wall0) * 1e6 * self.speed
+            while self._next and self._next[0] <= now_us:
+                self._pending += self._next[1]
+                self._next = next(self._records, None)
+        elif self._next and not self._pending:
+            # 最快速度：每次读取返回一条记录
+            self._pending += self._next[1]
+            self._next = next(self._records, None)
+        self.eof = self._next is None and not self._pending
+
+    def any(self):
+        self._pull()
+        return len(self._pending)
+
+    def read(self, n=-1):
+        self._pull()
+        if not self._pending:
+            return None
+        n = len(self._pending) if n is None or n < 0 else n
+        data = bytes(self._pending[:n])
+        del self._pending[:n]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        if not data:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+def _open_sink(target):
+    """根据 --to 参数返回 (sink函数, 关闭函数)"""
+    if target == "stdout":
+        out = sys.stdout.buffer
+        return out.write, out.flush
+    if target.startswith("udp://"):
+        import socket
+        host, port = target[6:].rsplit(":", 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        addr = (host, int(port))
+        return (lambda data: sock.sendto(data, addr)), sock.close
+    if target.startswith("serial:"):
+        import serial  # pyserial，仅在回放到串口时需要
+        port = serial.Serial(target[7:], 57600)
+        return port.write, port.close
+    raise ValueError(f"未知的回放目标: {target}")
+
+def cmd_record(args):
+    import serial  # pyserial，仅在录制时需要
+    port = serial.Serial(args.port, args.baud, timeout=0.01)
+    deadline = time.monotonic() + args.seconds if args.seconds else None
+    with CaptureWriter(args.file, args.baud) as w:
+        print(f"开始录制 {args.port} -> {args.file}，按 Ctrl+C 结束")
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                data = port.read(4096)
+                if data:
+                    w.write(data)
+        except KeyboardInterrupt:
+            pass
+        print(f"录制结束: {w.records} 条记录, {w.bytes} 字节")
+
+def cmd_info(args):
+    reader = CaptureReader(args.file)
+    for k, v in reader.info().items():
+        print(f"{k}: {v}")
+
+def check_seek(reader):
+    """对每个索引点核对 records(t) 与 records() 从同一记录开始的部分：数据相同，时间相差同一个不足1ms的常数
+    （索引时间按毫秒截断），返回核对的索引点数，不一致时抛出 AssertionError"""
+    full = list(reader.records())
+    starts = {}
+    offset = HEADER.size
+    for i, (_, data) in enumerate(full):
+        starts[offset] = i
+        offset += RECORD.size + len(data)
+    for t_ms, off in reader.index:
+        if not t_ms:
+            continue
+        got = list(reader.records(t_ms / 1000))
+        i = starts[off]
+        tail = full[i:i + len(got)]
+        assert [d for _, d in got] == [d for _, d in full[i:]], f"{t_ms}ms: 数据不一致"
+        skew = {t - g for (g, _), (t, _) in zip(got, tail)}
+        assert len(skew) <= 1 and all(0 <= k < 1000 for k in skew), f"{t_ms}ms: 时间偏差 {sorted(skew)[:3]}us"
+    return len(reader.index)
+
+def cmd_check(args):
+    import random
+    import tempfile
+    path = args.file
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "check.tgcap")
+        rng = random.Random(1)
+        t = 0
+        with CaptureWriter(path, index_ms=200) as w:
+            for _ in range(3000):
+                t += rng.randint(300, 5000)  # 记录间隔为不整毫秒的微秒数
+                w.write(bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 64))), t)
+    reader = CaptureReader(path)
+    n = check_seek(reader)
+    reader.close()
+    print(f"{path}: {n} 个索引点，按索引定位读取与从头读取一致")
+
+def cmd_replay(args):
+    reader = CaptureReader(args.file)
+    if args.to == "parse":
+        buffer = bytearray()
+        stats = {"bytes": 0, "frames": 0}
+
+        def sink(data):
+            stats["bytes"] += len(data)
+            buffer.extend(data)
+            stats["frames"] += count_frames(buffer)
+        close = None
+    else:
+        sink, close = _open_sink(args.to)
+    t0 = time.perf_counter()
+    replay(reader, sink, args.speed, args.start, args.loop)
+    dt = time.perf_counter() - t0
+    if close:
+        close()
+    if args.to == "parse":
+        print(f"回放 {stats['bytes']} 字节, {stats['frames']} 帧, 耗时 {dt:.3f} 秒, "
+              f"{stats['bytes'] / dt / 1e6:.2f} MB/s, {stats['frames'] / dt:.0f} 帧/秒", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="TGAM串口抓包录制与回放")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("record", help="从串口录制")
+    p.add_argument("file")
+    p.add_argument("--port", required=True)
+    p.add_argument("--baud", type=int, default=57600)
+    p.add_argument("--seconds", type=float, default=0, help="录制时长，0表示直到Ctrl+C")
+    p.set_defaults(func=cmd_record)
+    p = sub.add_parser("info", help="显示抓包文件信息")
+    p.add_argument("file")
+    p.set_defaults(func=cmd_info)
+    p = sub.add_parser("check", help="核对按时间定位读取")
+    p.add_argument("file", nargs="?")
+    p.set_defaults(func=cmd_check)
+    p = sub.add_parser("replay", help="回放抓包文件")
+    p.add_argument("file")
+    p.add_argument("--speed", type=float, default=1.0, help="回放倍速，0表示尽可能快")
+    p.add_argument("--start", type=float, default=0.0, help="从第几秒开始")
+    p.add_argument("--loop", action="store_true", help="循环回放")
+    p.add_argument("--to", default="parse", help="udp://主机:端口、serial:设备、stdout 或 parse（按固件方式解析并统计）")
+    p.set_defaults(func=cmd_replay)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""按设备、按天分段的列式存储：每列一个定宽内存映射文件，追加写入，稀疏时间索引，按时间范围零拷贝读取
+
+目录结构: <根目录>/<表>/<设备>/<YYYYMMDD>/<列>.bin + index.bin + meta.json
+  bands: 每条EEG记录一行（ts、dataReady、专注度、放松度、信号质量和8个频段功率），约44字节/行
+  raw:   512Hz原始波形每个采样一行（ts、value），约10字节/采样
+
+用法:
+  python receiver.py --colstore data/     # 接收端把全部记录追加到 bands 表
+  python colstore.py info data/
+  python colstore.py bench [--root /tmp/colstore] [--devices 4] [--hours 24]
+"""
+import argparse
+import calendar
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from tgam import EEG_BANDS, SAMPLE_RATE
+
+SCHEMAS = {
+    "bands": [("ts", "<i8"), ("ready", "u1"), ("attention", "u1"), ("meditation", "u1"), ("signal", "<i2")] +
+             [(b.lower(), "<i4") for b in EEG_BANDS],  # 信号质量和频段功率缺失时为-1
+    "raw": [("ts", "<i8"), ("value", "<i2")],
+}
+CHUNK_ROWS = {"bands": 86400, "raw": SAMPLE_RATE * 3600}  # 文件每次扩展的行数
+DAY_US = 86400 * 1000000
+_NO_BANDS = (-1,) * len(EEG_BANDS)
+
+def day_of(ts_us):
+    return time.strftime("%Y%m%d", time.gmtime(ts_us // 1000000))
+
+def day_number(day):
+    """YYYYMMDD -> 自1970-01-01起的天数"""
+    return calendar.timegm(time.strptime(day, "%Y%m%d")) // 86400
+
+class Segment:
+    """一个设备一天的数据：每列一个内存映射文件，文件按chunk_rows预分配，封存时截断到实际行数"""
+
+    def __init__(self, path, schema, chunk_rows, index_every=1024):
+        self.path = path
+        self.schema = schema
+        self.columns = SCHEMAS[schema]
+        self.chunk_rows = chunk_rows
+        self.index_every = index_every
+        self.lock = threading.Lock()  # 扩容、封存和压缩与追加互斥；读取不加锁
+        os.makedirs(path, exist_ok=True)
+        meta = self._load_meta()
+        self.count = meta.get("count", 0)
+        self.sorted = meta.get("sorted", True)
+        self.sealed = meta.get("sealed", False)
+        self.retired = False  # 已从ColumnStore中移除，持有旧引用的写入方需重新获取段
+        self.cols = {}
+        self.col_list = []  # 按表结构顺序排列的列，供 append_row 使用
+        self.capacity = 0
+        self._map(self.count if self.sealed else max(self.count, chunk_rows))
+        if not meta:
+            self._write_meta(0)
+        self.last_ts = int(self.cols["ts"][self.count - 1]) if self.count else -1
+        self.last_write = time.monotonic()
+        self.flushed = self.count
+        self._load_index()
+
+    def _load_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, count):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"schema": self.schema, "count": count, "sorted": self.sorted, "sealed": self.sealed,
+                       "index_every": self.index_every}, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _map(self, capacity):
+        """把每列映射为capacity行；扩容后旧的映射仍由已返回的视图持有，读者不受影响"""
+        mode = "r" if self.sealed else "r+"
+        for name, dtype in self.columns:
+            fn = os.path.join(self.path, name + ".bin")
+            size = capacity * np.dtype(dtype).itemsize
+            if not self.sealed:
+                with open(fn, "ab") as f:
+                    if f.tell() < size:
+                        f.truncate(size)
+            self.cols[name] = np.memmap(fn, dtype=dtype, mode=mode, shape=(capacity,)) if capacity else \
+                np.empty(0, dtype=dtype)
+        self.col_list = [self.cols[name] for name, _ in self.columns]
+        self.capacity = capacity
+
+    def _load_index(self):
+        fn = os.path.join(self.path, "index.bin")
+        idx = np.fromfile(fn, dtype="<i8").reshape(-1, 2) if os.path.exists(fn) else np.empty((0, 2), "<i8")
+        idx = idx[idx[:, 1] < self.count]
+        self.idx_ts = list(idx[:, 0])
+        self.idx_row = list(idx[:, 1])
+        if len(self.idx_ts) < (self.count + self.index_every - 1) // self.index_every:
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        rows = np.arange(0, self.count, self.index_every)
+        self.idx_row = list(rows)
+        self.idx_ts = list(self.cols["ts"][rows]) if self.count else []
+        pairs = np.array([self.idx_ts, self.idx_row], dtype="<i8").T
+        pairs.tofile(os.path.join(self.path, "index.bin"))
+
+    def append(self, cols, n):
+        """追加n行，cols为 列名 -> 长度为n的数组；未给出的列有符号类型填-1，无符号类型填0；段已移除时返回False"""
+        with self.lock:
+            if self.retired:
+                return False
+            if self.sealed:
+                self._unseal()
+            if self.count + n > self.capacity:
+                grow = -(-(self.count + n - self.capacity) // self.chunk_rows) * self.chunk_rows
+                self._map(self.capacity + grow)
+            start = self.count
+            for name, _ in self.columns:
+                v = cols.get(name)
+                self.cols[name][start:start + n] = (-1 if self.cols[name].dtype.kind == "i" else 0) if v is None else v
+            ts = self.cols["ts"][start:start + n]
+            if self.sorted and (ts[0] < self.last_ts or (n > 1 and np.any(ts[1:] < ts[:-1]))):
+                self.sorted = False  # 乱序写入：读取时退化为全段筛选，封存时排序
+            self.last_ts = max(self.last_ts, int(ts.max()))
+            first = -(-start // self.index_every) * self.index_every
+            new = []
+            for row in range(first, start + n, self.index_every):
+                self.idx_ts.append(int(self.cols["ts"][row]))
+                self.idx_row.append(row)
+                new.append((self.idx_ts[-1], row))
+            self.count = start + n
+            self.last_write = time.monotonic()
+        if new:
+            with open(os.path.join(self.path, "index.bin"), "ab") as f:
+                f.write(np.array(new, dtype="<i8").tobytes())
+        return True
+
+    def append_row(self, row):
+        """追加一行，row按表结构顺序给出各列的值；逐条接收时避免构造数组；段已移除时返回False"""
+        with self.lock:
+            if self.retired:
+                return False
+            if self.sealed:
+                self._unseal()
+            if self.count >= self.capacity:
+                self._map(self.capacity + self.chunk_rows)
+            i = self.count
+            for mm, v in zip(self.col_list, row):
+                mm[i] = v
+            ts = row[0]
+            if ts < self.last_ts:
+                self.sorted = False
+            else:
+                self.last_ts = ts
+            self.count = i + 1
+            self.last_write = time.monotonic()
+        if i % self.index_every == 0:
+            self.idx_ts.append(ts)
+            self.idx_row.append(i)
+            with open(os.path.join(self.path, "index.bin"), "ab") as f:
+                f.write(np.array([ts, i], dtype="<i8").tobytes())
+        return True
+
+    def flush(self):
+        """把已追加的数据写回磁盘，再更新meta中的行数（崩溃后只会丢失未记录的尾部）"""
+        count = self.count
+        if count == self.flushed:
+            return
+        for mm in self.cols.values():
+            if isinstance(mm, np.memmap):
+                mm.flush()
+        self._write_meta(count)
+        self.flushed = count
+
+    def seal(self):
+        """封存：排序乱序数据、重建索引、把文件截断到实际行数并改为只读映射"""
+        with self.lock:
+            if self.sealed:
+                return
+            if not self.sorted:
+                order = np.argsort(self.cols["ts"][:self.count], kind="stable")
+                for mm in self.cols.values():
+                    mm[:self.count] = mm[:self.count][order]
+                self.sorted = True
+                self._rebuild_index()
+            for mm in self.cols.values():
+                mm.flush()
+            for name, dtype in self.columns:
+                with open(os.path.join(self.path, name + ".bin"), "r+b") as f:
+                    f.truncate(self.count * np.dtype(dtype).itemsize)
+            self.sealed = True
+            self._map(self.count)
+            self._write_meta(self.count)
+            self.flushed = self.count
+
+    def _unseal(self):
+        """已封存的段又收到迟到数据时重新打开追加"""
+        self.sealed = False
+        self._map(self.count + self.chunk_rows)
+        self._write_meta(self.count)
+
+    def slice(self, start_us, end_us):
+        """返回 [start_us, end_us) 内各列的视图（有序时零拷贝；乱序段返回筛选后的副本）"""
+        count = self.count
+        cols = self.cols
+        ts = cols["ts"][:count]
+        if not self.sorted:
+            mask = (ts >= start_us) & (ts < end_us)
+            return {name: np.asarray(mm[:count][mask]) for name, mm in cols.items()}
+        # 稀疏索引先确定行区间，再在区间内二分，避免访问整列的页
+        n_idx = len(self.idx_ts)
+        i = np.searchsorted(self.idx_ts[:n_idx], start_us, side="right") - 1
+        lo = self.idx_row[i] if i >= 0 else 0
+        j = np.searchsorted(self.idx_ts[:n_idx], end_us, side="left")
+        hi = self.idx_row[j] if j < n_idx else count
+        lo += np.searchsorted(ts[lo:hi], start_us, side="left")
+        hi = lo + np.searchsorted(ts[lo:hi], end_us, side="left")
+        return {name: mm[lo:hi] for name, mm in cols.items()}
+
+class ColumnStore:
+    """列式段存储；append可在事件循环中调用（只写内存映射），刷盘、封存和压缩由后台线程完成"""
+
+    def __init__(self, root, index_every=1024, flush_s=5.0, seal_after_s=600.0):
+        self.root = root
+        self.index_every = index_every
+        self.flush_s = flush_s
+        self.seal_after_s = seal_after_s  # 非当天的段空闲多久后封存
+        self._segments = {}  # (表, 设备, 日期) -> Segment
+        self._current = {}  # 设备 -> (当天起始us, 次日起始us, bands表的Segment)，逐条写入的快速路径
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.rows = 0
+        self.sealed = 0
+
+    def segment(self, schema, device_id, day, create=True):
+        key = (schema, device_id, day)
+        seg = self._segments.get(key)
+        if seg is None:
+            path = os.path.join(self.root, schema, device_id, day)
+            if not create and not os.path.isdir(path):
+                return None
+            with self._lock:
+                seg = self._segments.get(key)
+                if seg is None:
+                    seg = self._segments[key] = Segment(path, schema, CHUNK_ROWS[schema], self.index_every)
+        return seg
+
+    def append(self, device_id, schema, cols):
+        """追加一批行，cols为 列名 -> 数组（必须含ts，单位us）；跨天的批次按天拆分"""
+        ts = np.asarray(cols["ts"], dtype=np.int64)
+        days = ts // DAY_US
+        if days[0] == days[-1] and (len(days) < 3 or np.all(days == days[0])):
+            parts = [(day_of(int(ts[0])), cols, len(ts))]
+        else:
+            parts = []
+            for d in np.unique(days):
+                m = days == d
+                parts.append((day_of(int(d) * DAY_US), {k: np.asarray(v)[m] for k, v in cols.items()}, int(m.sum())))
+        for day, part, n in parts:
+            while not self.segment(schema, device_id, day).append(part, n):
+                pass  # 段刚被封存移除，重新打开
+        self.rows += len(ts)
+
+    def sink(self, record):
+        """注册到 Ingest.add_sink，把EEGRecord追加到bands表"""
+        ts = record.ts_us
+        row = (ts, record.ready, record.attention, record.meditation, record.signal,
+               *(record.bands if record.bands is not None else _NO_BANDS))
+        cur = self._current.get(record.device_id)
+        while cur is None or not cur[0] <= ts < cur[1] or not cur[2].append_row(row):
+            lo = ts // DAY_US * DAY_US
+            cur = self._current[record.device_id] = (lo, lo + DAY_US, self.segment("bands", record.device_id, day_of(ts)))
+        self.rows += 1
+
+    def days(self, device_id, schema="bands"):
+        path = os.path.join(self.root, schema, device_id)
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    def read(self, device_id, start_us, end_us, schema="bands", copy=True):
+        """读取时间范围内的数据；copy=False时返回每个段的零拷贝视图列表，否则拼接为一组数组"""
+        parts = []
+        first, last = start_us // DAY_US, (max(start_us, end_us - 1)) // DAY_US
+        for day in self.days(device_id, schema):
+            if first <= day_number(day) <= last:
+                seg = self.segment(schema, device_id, day, create=False)
+                part = seg.slice(start_us, end_us)
+                if len(part["ts"]):
+                    parts.append(part)
+        if not copy:
+            return parts
+        names = [name for name, _ in SCHEMAS[schema]]
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in SCHEMAS[schema]}
+        return {name: np.concatenate([p[name] for p in parts]) for name in names}
+
+    def maintain(self, now=None):
+        """刷盘全部活动段，封存空闲的历史段并从内存中移除"""
+        now = time.monotonic() if now is None else now
+        today = day_of(time.time_ns() // 1000)
+        for key, seg in list(self._segments.items()):
+            if seg.sealed:
+                continue
+            seg.flush()
+            if key[2] < today and now - seg.last_write >= self.seal_after_s:
+                seg.seal()
+                self.sealed += 1
+                with self._lock, seg.lock:
+                    if seg.sealed:  # 封存后没有迟到数据才移除
+                        seg.retired = True
+                        self._segments.pop(key, None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="colstore", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.flush_s):
+            self.maintain()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        for seg in list(self._segments.values()):
+            if not seg.sealed:
+                seg.flush()
+
+    def stats(self):
+        active = [s for s in self._segments.values() if not s.sealed]
+        return {"rows": self.rows, "open_segments": len(active), "sealed": self.sealed,
+                "unsorted": sum(1 for s in active if not s.sorted)}
+
+def add_routes(http, store):
+    """在接收端注册 GET /col/range?id=&from=&to=&schema=，返回各列数组"""
+    from receiver import json_response
+
+    def range_handler(req):
+        q = req.query
+        if "id" not in q:
+            return 400, "text/plain", b"missing id", None
+        end = int(q["to"]) if "to" in q else time.time_ns() // 1000 + 1
+        data = store.read(q["id"], int(q.get("from", end - 3600 * 1000000)), end, q.get("schema", "bands"))
+        return json_response({k: v.tolist() for k, v in data.items()})
+
+    http.route("GET", "/col/range", range_handler)
+    http.route("GET", "/col/stats", lambda req: json_response(store.stats()))
+
+def info(root):
+    for schema in sorted(os.listdir(root)):
+        for device_id in sorted(os.listdir(os.path.join(root, schema))):
+            for day in sorted(os.listdir(os.path.join(root, schema, device_id))):
+                path = os.path.join(root, schema, device_id, day)
+                with open(os.path.join(path, "meta.json")) as f:
+                    meta = json.load(f)
+                size = sum(os.path.getsize(os.path.join(path, fn)) for fn in os.listdir(path))
+                state = "封存" if meta["sealed"] else ("乱序" if not meta["sorted"] else "活动")
+                print(f"{schema:6s} {device_id:16s} {day}  {meta['count']:>10d} 行  {size / 1e6:8.1f} MB  {state}")
+
+def bench(args):
+    """写入若干设备若干小时的模拟数据，测量追加速率、范围读取耗时和封存耗时"""
+    if os.path.exists(args.root):
+        shutil.rmtree(args.root)
+    store = ColumnStore(args.root, seal_after_s=0)
+    rng = np.random.default_rng(1)
+    t_start = (time.time_ns() // 1000 // DAY_US - 1) * DAY_US + 12 * 3600 * 1000000  # 昨天中午（UTC）
+    seconds = int(args.hours * 3600)
+    t0 = time.perf_counter()
+    for dev in range(args.devices):
+        device_id = "BENCH%02d" % dev
+        ts = t_start + np.arange(seconds, dtype=np.int64) * 1000000
+        cols = {"ts": ts, "ready": np.ones(seconds, "u1"),
+                "attention": rng.integers(1, 100, seconds), "meditation": rng.integers(1, 100, seconds),
+                "signal": np.zeros(seconds, "<i2")}
+        for b in EEG_BANDS:
+            cols[b.lower()] = rng.integers(0, 1 << 20, seconds)
+        for k in range(0, seconds, 60):  # 每次追加一分钟，模拟批量写入
+            store.append(device_id, "bands", {c: v[k:k + 60] for c, v in cols.items()})
+        if args.raw_minutes:
+            n = int(args.raw_minutes * 60 * SAMPLE_RATE)
+            raw_ts = t_start + (np.arange(n, dtype=np.int64) * 1000000) // SAMPLE_RATE
+            raw = rng.integers(-2048, 2048, n).astype("<i2")
+            for k in range(0, n, SAMPLE_RATE):
+                store.append(device_id, "raw", {"ts": raw_ts[k:k + SAMPLE_RATE], "value": raw[k:k + SAMPLE_RATE]})
+    t_write = time.perf_counter() - t0
+    print(f"追加 {store.rows} 行: {t_write:.2f} 秒, {store.rows / t_write:.0f} 行/秒")
+    t0 = time.perf_counter()
+    store.maintain(now=time.monotonic() + 1)
+    print(f"刷盘并封存 {store.sealed} 个段: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    store = ColumnStore(args.root)
+    t0 = time.perf_counter()
+    views = store.read("BENCH00", t_start + 3600 * 1000000, t_start + 2 * 3600 * 1000000, copy=False)
+    t1 = time.perf_counter()
+    mean = float(views[0]["attention"].mean()) if views else 0.0
+    print(f"读取1小时 {sum(len(v['ts']) for v in views)} 行（零拷贝视图）: {(t1 - t0) * 1000:.2f} ms, 专注度均值 {mean:.1f}")
+    if args.raw_minutes:
+        t0 = time.perf_counter()
+        raw = store.read("BENCH00", t_start, t_start + 10 * 1000000, schema="raw")
+        print(f"读取10秒原始波形 {len(raw['ts'])} 个采样: {(time.perf_counter() - t0) * 1000:.2f} ms")
+    info(args.root)
+
+def main():
+    parser = argparse.ArgumentParser(description="EEG列式段存储")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("info", help="列出全部段")
+    p.add_argument("root")
+    p = sub.add_parser("bench", help="写入和读取性能测试")
+    p.add_argument("--root", default="/tmp/colstore")
+    p.add_argument("--devices", type=int, default=4)
+    p.add_argument("--hours", type=float, default=24)
+    p.add_argument("--raw-minutes", type=float, default=10, help="每台设备写入的原始波形分钟数")
+    args = parser.parse_args()
+    if args.cmd == "info":
+        info(args.root)
+    else:
+        bench(args)
+
+if __name__ == "__main__":
+    main()
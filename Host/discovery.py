@@ -0,0 +1,228 @@
+"""接收端发现：应答设备的组播/广播查询，使设备改为单播发送；另含本地测试用的采集端替身、模拟设备和空口时间估算
+
+协议见 lib/discovery.py。广播和组播帧在WiFi上以基本速率（通常1Mbps）发送、没有ACK重传，并唤醒局域网内所有主机；
+单播帧以协商速率发送，空口时间通常只有广播的几十分之一。
+
+用法:
+  python receiver.py [--discovery-port 9006]      # 接收端默认应答查询，0表示关闭
+  python discovery.py collector [--port 9003] [--iface 127.0.0.1]
+  python discovery.py device [--before 20] [--after 20] [--iface 127.0.0.1] [--broadcast 127.255.255.255]
+  python discovery.py airtime [--bytes 90,110,220,1300]
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import socket
+import struct
+import time
+
+from battery import UCAST_MBPS, airtime_us
+
+QUERY_MAGIC = b'TGDQ'
+ANNOUNCE_MAGIC = b'TGDA'
+VERSION = 1
+_ANNOUNCE = struct.Struct('<4sBHHH')
+GROUP = "239.255.90.3"
+PORT = 9006
+IP_PKTINFO = getattr(socket, "IP_PKTINFO", 8)  # Python 3.12之前socket模块未导出，8为Linux的取值
+
+def parse_query(data):
+    """返回查询中的芯片ID，不是查询报文时返回None"""
+    if len(data) < 6 or data[:4] != QUERY_MAGIC:
+        return None
+    return data[6:6 + data[5]].decode("utf-8", "replace")
+
+def discovery_socket(port=PORT, group=GROUP, iface="0.0.0.0"):
+    """绑定发现端口并加入组播组，同一端口也能收到广播查询"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("", port))
+    mreq = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(iface))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
+
+class AnnounceProtocol(asyncio.DatagramProtocol):
+    """应答查询：单播回复本机的数据端口、时钟同步端口和租期"""
+
+    def __init__(self, data_port=9003, sync_port=9005, lease_s=300):
+        self.reply = _ANNOUNCE.pack(ANNOUNCE_MAGIC, VERSION, data_port, sync_port, lease_s)
+        self.devices = {}  # 芯片ID -> (地址, 最近查询时间)
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        chip_id = parse_query(data)
+        if chip_id is None:
+            return
+        self.queries += 1
+        self.devices[chip_id] = (addr[0], time.time())
+        self.transport.sendto(self.reply, addr)
+
+async def start_announcer(data_port=9003, sync_port=9005, port=PORT, group=GROUP, iface="0.0.0.0", lease_s=300):
+    loop = asyncio.get_running_loop()
+    _, proto = await loop.create_datagram_endpoint(lambda: AnnounceProtocol(data_port, sync_port, lease_s),
+                                                   sock=discovery_socket(port, group, iface))
+    return proto
+
+def is_broadcast(dest):
+    ip = ipaddress.ip_address(dest)
+    return dest.endswith(".255") or ip.is_multicast
+
+class AirtimeStats:
+    """按设备统计收到的数据报：广播/单播数量、字节数，以及实际空口时间和全部按广播发送时的空口时间"""
+
+    def __init__(self):
+        self.devices = {}
+
+    def add(self, data, src, dest):
+        bcast = is_broadcast(dest)
+        device_id = src[0]
+        if data[:1] == b'{':
+            try:
+                device_id = json.loads(data.split(b'\n', 1)[0]).get("id") or src[0]
+            except ValueError:
+                pass
+        d = self.devices.get(device_id)
+        if d is None:
+            d = self.devices[device_id] = {"bcast": 0, "ucast": 0, "bcast_bytes": 0, "ucast_bytes": 0,
+                                           "air_us": 0, "air_bcast_us": 0}
+        n = len(data)
+        kind = "bcast" if bcast else "ucast"
+        d[kind] += 1
+        d[kind + "_bytes"] += n
+        d["air_us"] += airtime_us(n, bcast)
+        d["air_bcast_us"] += airtime_us(n, True)
+
+    def report(self):
+        for dev, d in sorted(self.devices.items()):
+            parts = []
+            for kind, name in (("bcast", "广播"), ("ucast", "单播")):
+                if d[kind]:
+                    per = airtime_us(d[kind + "_bytes"] / d[kind], kind == "bcast")
+                    parts.append(f"{name} {d[kind]} 帧 平均 {d[kind + '_bytes'] / d[kind]:.0f} 字节 {per:.0f}us/帧")
+            saved = 1 - d["air_us"] / d["air_bcast_us"] if d["air_bcast_us"] else 0
+            print(f"  {dev}: " + ", ".join(parts) + f"; 空口 {d['air_us'] / 1000:.1f}ms（全部广播时 "
+                  f"{d['air_bcast_us'] / 1000:.1f}ms，节省 {saved * 100:.0f}%）")
+
+async def collector(args):
+    """采集端替身：应答发现查询，并用IP_PKTINFO区分收到的数据是广播还是单播"""
+    loop = asyncio.get_running_loop()
+    announcer = await start_announcer(args.port, 0, args.discovery_port, args.group, args.iface, args.lease)
+    data = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    data.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    data.setsockopt(socket.IPPROTO_IP, IP_PKTINFO, 1)
+    data.bind(("", args.port))
+    data.setblocking(False)
+    stats = AirtimeStats()
+
+    def on_readable():
+        while True:
+            try:
+                msg, anc, _, src = data.recvmsg(65536, socket.CMSG_SPACE(12))
+            except BlockingIOError:
+                return
+            dest = "0.0.0.0"
+            for level, kind, payload in anc:
+                if level == socket.IPPROTO_IP and kind == IP_PKTINFO:
+                    dest = socket.inet_ntoa(payload[8:12])  # in_pktinfo.ipi_addr：报文的目的地址
+            stats.add(msg, src, dest)
+
+    loop.add_reader(data.fileno(), on_readable)
+    print(f"采集端替身: 数据 UDP {args.port}, 发现 {args.group}:{args.discovery_port}（接口 {args.iface}）")
+    try:
+        while True:
+            await asyncio.sleep(args.report)
+            print(f"[{time.strftime('%H:%M:%S')}] 查询 {announcer.queries} 次, 设备 {sorted(announcer.devices)}")
+            stats.report()
+    finally:
+        loop.remove_reader(data.fileno())
+
+class HostDiscovery:
+    """模拟设备端的发现过程（与 lib/discovery.py 的查询顺序相同），用于本地测试"""
+
+    def __init__(self, chip_id, port=PORT, group=GROUP, iface="0.0.0.0", broadcast="255.255.255.255", timeout=0.2):
+        self.query = QUERY_MAGIC + bytes((VERSION, len(chip_id))) + chip_id.encode()
+        self.targets = [(group, port), (broadcast, port)]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(iface))
+        self.sock.settimeout(timeout)
+
+    def find(self, attempts=5):
+        """返回 (接收端IP, 数据端口, 同步端口, 租期秒)，找不到时返回None"""
+        for attempt in range(1, attempts + 1):
+            for dest in self.targets[:1 if attempt % 2 else 2]:
+                self.sock.sendto(self.query, dest)
+                try:
+                    while True:
+                        data, addr = self.sock.recvfrom(64)
+                        if len(data) >= _ANNOUNCE.size and data[:4] == ANNOUNCE_MAGIC:
+                            _, _, data_port, sync_port, lease_s = _ANNOUNCE.unpack_from(data)
+                            return addr[0], data_port, sync_port, lease_s
+                except socket.timeout:
+                    pass
+        return None
+
+def device(args):
+    """模拟设备：先广播发送若干帧（现有行为），再查询接收端并单播发送若干帧"""
+    from tgam import eeg_json, synth_frames
+    frames = list(synth_frames(args.before + args.after, seed=1))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    payload = lambda i: eeg_json(frames[i])[:-1] + b', "id": "%s"}' % args.id.encode()
+    for i in range(args.before):
+        sock.sendto(payload(i), (args.broadcast, args.port))
+        time.sleep(args.interval)
+    t0 = time.perf_counter()
+    found = HostDiscovery(args.id, args.discovery_port, args.group, args.iface, args.broadcast).find()
+    if found is None:
+        print("未找到接收端，继续广播")
+        addr = (args.broadcast, args.port)
+    else:
+        print(f"发现接收端 {found[0]}:{found[1]}（同步端口 {found[2]}, 租期 {found[3]} 秒），"
+              f"耗时 {(time.perf_counter() - t0) * 1000:.1f} ms")
+        addr = (found[0], found[1])
+    for i in range(args.before, args.before + args.after):
+        sock.sendto(payload(i), addr)
+        time.sleep(args.interval)
+    print(f"已发送: 广播 {args.before} 帧, {'单播' if found else '广播'} {args.after} 帧")
+
+def airtime(args):
+    print(f"{'字节':>6}{'广播1Mbps us':>14}{f'单播{UCAST_MBPS}Mbps us':>16}{'比值':>8}")
+    for n in args.bytes:
+        b, u = airtime_us(n, True), airtime_us(n, False)
+        print(f"{n:>6}{b:>14}{u:>16}{b / u:>8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="接收端发现与空口时间")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name, help in (("collector", "采集端替身"), ("device", "模拟设备")):
+        p = sub.add_parser(name, help=help)
+        p.add_argument("--port", type=int, default=9003, help="数据端口")
+        p.add_argument("--discovery-port", type=int, default=PORT)
+        p.add_argument("--group", default=GROUP)
+        p.add_argument("--iface", default="0.0.0.0", help="组播接口地址，本机测试用127.0.0.1")
+        if name == "collector":
+            p.add_argument("--lease", type=int, default=300, help="租期（秒），设备在租期过半时续约")
+            p.add_argument("--report", type=float, default=5)
+        else:
+            p.add_argument("--id", default="SIM000001")
+            p.add_argument("--broadcast", default="255.255.255.255", help="广播地址，本机测试用127.255.255.255")
+            p.add_argument("--before", type=int, default=20, help="发现之前广播的帧数")
+            p.add_argument("--after", type=int, default=20, help="发现之后发送的帧数")
+            p.add_argument("--interval", type=float, default=0.05)
+    p = sub.add_parser("airtime", help="单个数据报的空口时间估算")
+    p.add_argument("--bytes", type=lambda s: [int(x) for x in s.split(",")], default=[90, 110, 220, 1300])
+    args = parser.parse_args()
+    if args.cmd == "collector":
+        asyncio.run(collector(args))
+    elif args.cmd == "device":
+        device(args)
+    else:
+        airtime(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""多帧EEG批量紧凑编码（版本1）的主机端实现，格式与 lib/eegcodec.py 相同"""
+import struct
+
+import numpy as np
+
+from tgam import frame_values
+
+MAGIC = b'EB'
+VERSION = 1
+FLAG_TS = 0x01
+HEADER = struct.Struct('<2sBBHI')  # 魔数, 版本, 标志, 帧数, 基准时间戳ms
+N_VALUES = 11
+# 解码后各列含义，与设备端编码顺序一致
+COLUMNS = ["PoorSignal", "Delta", "Theta", "LowAlpha", "HighAlpha", "LowBeta", "HighBeta",
+           "LowGamma", "MiddleGamma", "Attention", "Meditation"]
+
+def _put(out, v):
+    v = (v << 1) if v >= 0 else ((-v << 1) - 1)
+    while v >= 0x80:
+        out.append((v & 0x7F) | 0x80)
+        v >>= 7
+    out.append(v)
+
+def encode_batch(frames, timestamps=None):
+    """把多帧编码为一个批次；timestamps为毫秒时间戳列表，省略时不带时间戳"""
+    flags = FLAG_TS if timestamps is not None else 0
+    base_ts = timestamps[0] & 0xFFFFFFFF if timestamps is not None and len(timestamps) else 0
+    out = bytearray(HEADER.pack(MAGIC, VERSION, flags, len(frames), base_ts))
+    prev = [0] * N_VALUES
+    prev_ts = base_ts
+    for k, frame in enumerate(frames):
+        if flags:
+            ts = timestamps[k] & 0xFFFFFFFF
+            _put(out, (ts - prev_ts) & 0xFFFFFFFF)
+            prev_ts = ts
+        cur = frame_values(frame)
+        for i in range(N_VALUES):
+            _put(out, cur[i] - prev[i])
+        prev = cur
+    return bytes(out)
+
+def _parse_header(data):
+    magic, version, flags, count, base_ts = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("不是EEG批量编码数据")
+    if version != VERSION:
+        raise ValueError(f"不支持的编码版本: {version}")
+    return flags, count, base_ts
+
+def decode_batch_py(data):
+    """逐字节解码（参考实现），返回 (时间戳列表或None, 每帧11个数值的列表)"""
+    flags, count, base_ts = _parse_header(data)
+    pos = HEADER.size
+    width = N_VALUES + (1 if flags & FLAG_TS else 0)
+    acc = [0] * width
+    acc_ts = base_ts
+    ts_list = [] if flags & FLAG_TS else None
+    rows = []
+    for _ in range(count):
+        row = []
+        for i in range(width):
+            v = shift = 0
+            while True:
+                b = data[pos]
+                pos += 1
+                v |= (b & 0x7F) << shift
+                shift += 7
+                if b < 0x80:
+                    break
+            row.append((v >> 1) ^ -(v & 1))
+        if ts_list is not None:
+            acc_ts = (acc_ts + row[0]) & 0xFFFFFFFF
+            ts_list.append(acc_ts)
+            row = row[1:]
+        acc = [a + d for a, d in zip(acc, row)]
+        rows.append(acc)
+    return ts_list, rows
+
+def decode_batch(data):
+    """NumPy向量化解码，返回 (时间戳数组uint32或None, 形状为(帧数, 11)的int64数组)"""
+    flags, count, base_ts = _parse_header(data)
+    width = N_VALUES + (1 if flags & FLAG_TS else 0)
+    body = np.frombuffer(data, dtype=np.uint8, offset=HEADER.size)
+    ends = np.flatnonzero(body < 0x80)[:count * width]
+    if len(ends) != count * width:
+        raise ValueError("数据不完整")
+    body = body[:ends[-1] + 1] if count else body[:0]
+    starts = np.empty_like(ends)
+    if count:
+        starts[0] = 0
+        starts[1:] = ends[:-1] + 1
+    # 每个字节在所属varint中的序号，决定左移位数
+    varint_id = np.zeros(len(body), dtype=np.int64)
+    varint_id[starts[1:]] = 1
+    varint_id = np.cumsum(varint_id)
+    pos_in = np.arange(len(body)) - starts[varint_id]
+    contrib = (body & 0x7F).astype(np.int64) << (7 * pos_in)
+    vals = np.add.reduceat(contrib, starts) if count else np.zeros(0, dtype=np.int64)
+    vals = (vals >> 1) ^ -(vals & 1)
+    vals = vals.reshape(count, width)
+    ts = None
+    if flags & FLAG_TS:
+        ts = ((base_ts + np.cumsum(vals[:, 0])) & 0xFFFFFFFF).astype(np.uint32)
+        vals = vals[:, 1:]
+    return ts, np.cumsum(vals, axis=0)
+
+HUB_MAGIC = b'EH'
+HUB_VERSION = 1
+
+def decode_hub_packet(data):
+    """解码多通道上行数据报，返回 (芯片ID, [(通道号, 时间戳数组, 数值数组), ...])"""
+    if data[:2] != HUB_MAGIC:
+        raise ValueError("不是多通道上行数据报")
+    if data[2] != HUB_VERSION:
+        raise ValueError(f"不支持的数据报版本: {data[2]}")
+    sections = data[3]
+    id_len = data[4]
+    chip_id = bytes(data[5:5 + id_len]).decode('utf-8')
+    pos = 5 + id_len
+    result = []
+    for _ in range(sections):
+        ch = data[pos]
+        n = data[pos + 1] | (data[pos + 2] << 8)
+        ts, vals = decode_batch(bytes(data[pos + 3:pos + 3 + n]))
+        result.append((ch, ts, vals))
+        pos += 3 + n
+    return chip_id, result
@@ -0,0 +1,277 @@
+"""实时推送中心：每条记录只序列化一次，按设备过滤后推送给任意数量的SSE/WebSocket订阅者
+
+每个订阅者有独立的有界队列，队列满时丢弃最旧的消息，慢客户端不会阻塞其他订阅者和接收端
+
+用法:
+  python receiver.py --fanout             # 提供 GET /live?id=A,B（SSE）和 GET /ws?id=A,B（WebSocket）
+  python fanout.py bench [--subscribers 1000] [--frames 2000]
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import struct
+import time
+
+from receiver import EEGRecord, json_response
+from tgam import synth_frames
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC11B63"
+_SSE_HEADERS = (b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                b"Connection: keep-alive\r\nAccess-Control-Allow-Origin: *\r\n\r\n")
+
+def ws_frame(payload, opcode=0x1):
+    """服务端发往客户端的WebSocket帧（不加掩码）"""
+    n = len(payload)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return head + payload
+
+class Message:
+    """一条待推送的记录：JSON只生成一次，SSE和WebSocket帧在第一次需要时生成并被所有订阅者共享"""
+
+    __slots__ = ("payload", "_sse", "_ws")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self._sse = None
+        self._ws = None
+
+    def sse(self):
+        if self._sse is None:
+            self._sse = b"data: " + self.payload + b"\n\n"
+        return self._sse
+
+    def ws(self):
+        if self._ws is None:
+            self._ws = ws_frame(self.payload)
+        return self._ws
+
+class Subscriber:
+    """一个订阅连接：有界队列（满时丢弃最旧）和唤醒事件，由自己的发送循环写出"""
+
+    def __init__(self, kind, devices, queue_size):
+        self.kind = kind  # "sse" 或 "ws"
+        self.devices = devices  # 订阅的设备集合，None表示全部
+        self.queue = collections.deque(maxlen=queue_size)
+        self.event = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def push(self, msg):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(msg)
+        self.event.set()
+
+    def take(self):
+        """取出队列中全部消息，拼接为一次写入"""
+        encode = Message.sse if self.kind == "sse" else Message.ws
+        batch = [encode(m) for m in self.queue]
+        self.queue.clear()
+        self.event.clear()
+        self.sent += len(batch)
+        return b"".join(batch)
+
+class FanoutHub:
+    """接收端的推送消费者：sink(record) 在事件循环中调用，只做一次序列化和若干次入队"""
+
+    def __init__(self, queue_size=256, heartbeat_s=15.0):
+        self.queue_size = queue_size
+        self.heartbeat_s = heartbeat_s
+        self.by_device = {}  # 设备 -> 订阅者集合
+        self.all = set()  # 订阅全部设备的订阅者
+        self.published = 0
+        self.serialized = 0
+
+    def subscribe(self, kind, devices=None):
+        sub = Subscriber(kind, devices, self.queue_size)
+        if devices is None:
+            self.all.add(sub)
+        else:
+            for d in devices:
+                self.by_device.setdefault(d, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        if sub.devices is None:
+            self.all.discard(sub)
+        else:
+            for d in sub.devices:
+                subs = self.by_device.get(d)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self.by_device[d]
+
+    def publish(self, device_id, obj):
+        subs = self.by_device.get(device_id)
+        if not subs and not self.all:
+            return
+        msg = Message(json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+        self.serialized += 1
+        for sub in self.all:
+            sub.push(msg)
+        if subs:
+            for sub in subs:
+                sub.push(msg)
+        self.published += 1
+
+    def sink(self, record):
+        """注册到 Ingest.add_sink"""
+        self.publish(record.device_id, record.to_dict())
+
+    def subscribers(self):
+        subs = set(self.all)
+        for s in self.by_device.values():
+            subs |= s
+        return subs
+
+    def stats(self):
+        subs = self.subscribers()
+        return {"subscribers": len(subs), "published": self.published, "serialized": self.serialized,
+                "sent": sum(s.sent for s in subs), "dropped": sum(s.dropped for s in subs),
+                "queued": sum(len(s.queue) for s in subs)}
+
+    async def _pump(self, sub, writer, ping):
+        """订阅者的发送循环：等待新消息或心跳超时，每次把队列中的消息一次写出"""
+        while True:
+            try:
+                await asyncio.wait_for(sub.event.wait(), self.heartbeat_s)
+                data = sub.take()
+            except asyncio.TimeoutError:
+                data = ping  # 心跳，及时发现已断开的客户端
+            writer.write(data)
+            await writer.drain()
+
+    async def serve_sse(self, req):
+        """GET /live[?id=A,B]：Server-Sent Events 推送"""
+        sub = self.subscribe("sse", _devices(req))
+        try:
+            req.writer.write(_SSE_HEADERS)
+            await self._pump(sub, req.writer, b": ping\n\n")
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.unsubscribe(sub)
+        return None
+
+    async def serve_ws(self, req):
+        """GET /ws[?id=A,B]：WebSocket 推送，客户端发来的数据帧被忽略，支持ping/close"""
+        key = req.headers.get("sec-websocket-key")
+        if req.headers.get("upgrade", "").lower() != "websocket" or not key:
+            return 400, "text/plain", b"expected websocket upgrade", None
+        accept = base64.b64encode(hashlib.sha1(key.encode("latin-1") + _WS_GUID).digest()).decode()
+        req.writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        sub = self.subscribe("ws", _devices(req))
+        pump = asyncio.ensure_future(self._pump(sub, req.writer, ws_frame(b"", 0x9)))
+        try:
+            await _ws_read_loop(req.reader, req.writer, pump)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            pump.cancel()
+            self.unsubscribe(sub)
+        return None
+
+def _devices(req):
+    ids = req.query.get("id")
+    return set(ids.split(",")) if ids else None
+
+async def _ws_read_loop(reader, writer, pump):
+    """读取客户端帧直到关闭：应答ping和close，发送循环出错时一并结束"""
+    read = asyncio.ensure_future(reader.readexactly(2))
+    while True:
+        done, _ = await asyncio.wait({read, pump}, return_when=asyncio.FIRST_COMPLETED)
+        if pump in done:
+            read.cancel()
+            pump.result()  # 抛出发送时的连接错误
+            return
+        b0, b1 = read.result()
+        opcode, n = b0 & 0x0F, b1 & 0x7F
+        if n == 126:
+            n = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif n == 127:
+            n = struct.unpack("!Q", await reader.readexactly(8))[0]
+        mask = await reader.readexactly(4) if b1 & 0x80 else b"\0\0\0\0"
+        data = bytes(b ^ mask[i & 3] for i, b in enumerate(await reader.readexactly(n)))
+        if opcode == 0x8:
+            writer.write(ws_frame(data[:2], 0x8))
+            await writer.drain()
+            pump.cancel()
+            return
+        if opcode == 0x9:
+            writer.write(ws_frame(data, 0xA))
+        read = asyncio.ensure_future(reader.readexactly(2))
+
+def add_routes(http, hub):
+    http.route("GET", "/live", hub.serve_sse)
+    http.route("GET", "/ws", hub.serve_ws)
+    http.route("GET", "/live/stats", lambda req: json_response(hub.stats()))
+
+class _NullWriter:
+    """测试用的写端：只统计字节数，可模拟不读取数据的慢客户端"""
+
+    def __init__(self, stalled=False):
+        self.bytes = 0
+        self.stalled = stalled
+
+    def write(self, data):
+        self.bytes += len(data)
+
+    async def drain(self):
+        if self.stalled:
+            await asyncio.sleep(3600)
+
+async def _bench(args):
+    hub = FanoutHub(queue_size=args.queue)
+    frames = list(synth_frames(200, seed=1))
+    pumps, writers = [], []
+    for i in range(args.subscribers):
+        kind = "ws" if i % 2 else "sse"
+        devices = None if i % 4 == 0 else {"DEV%02d" % (i % args.devices)}
+        sub = hub.subscribe(kind, devices)
+        w = _NullWriter(stalled=i < args.slow)
+        writers.append(w)
+        pumps.append(asyncio.ensure_future(hub._pump(sub, w, b"")))
+    await asyncio.sleep(0)
+    t0 = time.perf_counter()
+    t_sink = 0.0
+    for k in range(args.frames):
+        rec = EEGRecord.from_frame(frames[k % len(frames)], "DEV%02d" % (k % args.devices), k)
+        t1 = time.perf_counter()
+        hub.sink(rec)
+        t_sink += time.perf_counter() - t1
+        if k % 100 == 99:
+            await asyncio.sleep(0)  # 让发送循环运行
+    await asyncio.sleep(0.01)
+    dt = time.perf_counter() - t0
+    st = hub.stats()
+    print(f"{args.subscribers} 个订阅者（{args.slow} 个不读取）, {args.frames} 帧: 总耗时 {dt * 1000:.1f} ms, "
+          f"sink平均 {t_sink / args.frames * 1e6:.1f} us/帧")
+    print(f"序列化 {st['serialized']} 次, 推送 {st['sent']} 条, 丢弃 {st['dropped']} 条（均来自慢订阅者）, "
+          f"输出 {sum(w.bytes for w in writers) / 1e6:.1f} MB")
+    for p in pumps:
+        p.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="实时推送中心")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("bench", help="推送性能测试（内存中的订阅者）")
+    p.add_argument("--subscribers", type=int, default=1000)
+    p.add_argument("--devices", type=int, default=20)
+    p.add_argument("--frames", type=int, default=2000)
+    p.add_argument("--queue", type=int, default=256)
+    p.add_argument("--slow", type=int, default=10, help="不读取数据的订阅者数量")
+    args = parser.parse_args()
+    asyncio.run(_bench(args))
+
+if __name__ == "__main__":
+    main()
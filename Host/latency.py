@@ -0,0 +1,99 @@
+"""帧延迟直方图：按设备统计 UART读取→解析→发送→服务器接收 各段耗时"""
+import math
+
+SEGMENTS = ("uart→parse", "parse→send", "send→ingest", "uart→ingest")
+_SUB = 4  # 每个2的幂区间划分的桶数
+_BUCKETS = _SUB * 36  # 覆盖到约 2^36 微秒
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图（微秒），相对误差约19%，记录为O(1)"""
+
+    __slots__ = ("counts", "n", "total", "max", "negative")
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.n = 0
+        self.total = 0
+        self.max = 0
+        self.negative = 0  # 因时钟误差出现的负值个数，按0计入
+
+    def record(self, us):
+        if us < 0:
+            self.negative += 1
+            us = 0
+        b = 0 if us < 1 else min(_BUCKETS - 1, int(math.log2(us) * _SUB) + 1)
+        self.counts[b] += 1
+        self.n += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        """返回第p百分位所在桶的上界（微秒）"""
+        if not self.n:
+            return 0
+        target = self.n * p / 100.0
+        acc = 0
+        for b, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return 0 if b == 0 else min(int(2 ** (b / _SUB)), self.max)
+        return self.max
+
+    def merge(self, other):
+        for b, c in enumerate(other.counts):
+            self.counts[b] += c
+        self.n += other.n
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.negative += other.negative
+
+    def summary(self):
+        return {
+            "n": self.n,
+            "mean_us": self.total // self.n if self.n else 0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "max_us": self.max,
+            "negative": self.negative,
+        }
+
+class LatencyTracker:
+    """按设备和分段维护延迟直方图"""
+
+    def __init__(self):
+        self.devices = {}
+
+    def record(self, device_id, t_uart, t_parse, t_send, t_ingest):
+        """记录一帧的追踪时间戳（均为服务器时钟的Unix微秒）"""
+        hists = self.devices.get(device_id)
+        if hists is None:
+            hists = self.devices[device_id] = [LatencyHistogram() for _ in SEGMENTS]
+        hists[0].record(t_parse - t_uart)
+        hists[1].record(t_send - t_parse)
+        hists[2].record(t_ingest - t_send)
+        hists[3].record(t_ingest - t_uart)
+
+    def summary(self, device_id=None):
+        """返回 {设备: {分段: 统计}}，device_id为None时额外包含全部设备合计 "*"，为 "*" 时只返回合计"""
+        out = {}
+        total = [LatencyHistogram() for _ in SEGMENTS]
+        for dev, hists in self.devices.items():
+            if device_id is None or dev == device_id:
+                out[dev] = {SEGMENTS[i]: hists[i].summary() for i in range(len(SEGMENTS))}
+            for i, h in enumerate(hists):
+                total[i].merge(h)
+        if device_id is None or device_id == "*":
+            out["*"] = {SEGMENTS[i]: total[i].summary() for i in range(len(SEGMENTS))}
+        return out
+
+    def report(self):
+        """生成文本报告"""
+        lines = []
+        for dev, segs in self.summary().items():
+            lines.append(f"设备 {dev}:")
+            for name, s in segs.items():
+                lines.append(f"  {name:<12} n={s['n']:<7} 平均 {s['mean_us'] / 1000:8.2f}ms  p50 {s['p50_us'] / 1000:8.2f}ms  "
+                             f"p90 {s['p90_us'] / 1000:8.2f}ms  p99 {s['p99_us'] / 1000:8.2f}ms  最大 {s['max_us'] / 1000:8.2f}ms")
+        return "\n".join(lines)
@@ -0,0 +1,152 @@
+"""每台设备最新数据的内存缓存：按芯片ID索引，数值变化时才重新生成JSON并递增版本号，支持 ETag/If-None-Match
+
+GET /devices/latest              全部设备 {"<id>": {...}, ...}
+GET /devices/latest?id=A         单个设备，与固件 latest_eeg_data 结构相同，另含 id、version、changed
+GET /devices/latest?id=A,B,C     多个设备，未知设备省略
+
+用法:
+  python latest.py bench [--devices 2000] [--requests 20000]
+"""
+import argparse
+import json
+import time
+import zlib
+
+from tgam import EEG_BANDS
+
+class Entry:
+    """一台设备的缓存项：values用于判断是否变化，body为预先编码的JSON字节串"""
+
+    __slots__ = ("key", "version", "values", "body", "etag", "changed_us", "seen_us")
+
+    def __init__(self, device_id):
+        self.key = json.dumps(device_id, ensure_ascii=False).encode("utf-8")  # 批量响应中的键
+        self.version = 0
+        self.values = None
+        self.body = b""
+        self.etag = ""
+        self.changed_us = 0  # 数值最近一次变化的时间
+        self.seen_us = 0  # 最近一次收到数据的时间
+
+class LatestCache:
+    """接收端消费者：sink(record) 对比数值，未变化时只更新收到时间，不分配新的字节串"""
+
+    def __init__(self):
+        self.entries = {}
+        self.version = 0  # 全局版本，任何设备变化都会递增
+        self.updates = 0
+        self.rebuilds = 0
+        self._all_version = -1
+        self._all_body = b"{}"
+        self.not_modified = 0
+
+    def sink(self, record):
+        """注册到 Ingest.add_sink"""
+        self.updates += 1
+        values = (record.ready, record.attention, record.meditation, record.legacy,
+                  tuple(record.bands) if record.bands is not None else None)
+        e = self.entries.get(record.device_id)
+        if e is None:
+            e = self.entries[record.device_id] = Entry(record.device_id)
+        e.seen_us = record.ts_us
+        if values == e.values:
+            return
+        self.version += 1
+        self.rebuilds += 1
+        e.values = values
+        e.version = self.version
+        e.changed_us = record.ts_us
+        e.etag = '"%x"' % self.version
+        alpha, beta, gamma = record.legacy
+        body = '{"id": %s, "version": %d, "changed": %d, "dataReady": %d, "Attention": %d, "Meditation": %d, ' \
+               '"Alpha": %d, "Beta": %d, "Gamma": %d' % (e.key.decode("utf-8"), self.version, record.ts_us, record.ready,
+                                                          record.attention, record.meditation, alpha, beta, gamma)
+        if record.bands is not None:
+            body += "".join(', "%s": %d' % (name, v) for name, v in zip(EEG_BANDS, record.bands))
+        e.body = (body + "}").encode("utf-8")
+
+    def all_body(self):
+        """全部设备的JSON，只在全局版本变化后第一次请求时重新拼接"""
+        if self._all_version != self.version:
+            parts = [e.key + b": " + e.body for e in self.entries.values()]
+            self._all_body = b"{" + b", ".join(parts) + b"}"
+            self._all_version = self.version
+        return self._all_body
+
+    def lookup(self, ids):
+        """返回 (状态, ETag, 内容)；ids为None表示全部设备"""
+        if ids is None:
+            return 200, '"a%x"' % self.version, self.all_body
+        if len(ids) == 1:
+            e = self.entries.get(ids[0])
+            if e is None:
+                return 404, None, lambda: b"unknown device"
+            return 200, e.etag, lambda: e.body
+        found = [self.entries[dev] for dev in ids if dev in self.entries]
+        # 多设备的ETag由各设备的键和版本号组合而成，任一设备变化都会改变
+        tag = zlib.crc32(b",".join(b"%s:%d" % (e.key, e.version) for e in found))
+        return 200, '"m%x-%x"' % (len(found), tag), lambda: b"{" + b", ".join(e.key + b": " + e.body for e in found) + b"}"
+
+    def handle(self, req):
+        """GET /devices/latest：If-None-Match与当前ETag一致时返回304，不生成内容"""
+        ids = req.query.get("id")
+        status, etag, body = self.lookup(ids.split(",") if ids else None)
+        if etag is None:
+            return status, "text/plain", body(), None
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if req.headers.get("if-none-match") == etag:
+            self.not_modified += 1
+            return 304, "application/json", b"", headers
+        return status, "application/json", body(), headers
+
+    def stats(self):
+        return {"devices": len(self.entries), "version": self.version, "updates": self.updates,
+                "rebuilds": self.rebuilds, "not_modified": self.not_modified}
+
+def add_routes(http, cache):
+    from receiver import json_response
+    http.route("GET", "/devices/latest", cache.handle)
+    http.route("GET", "/devices/latest/stats", lambda req: json_response(cache.stats()))
+
+def bench(args):
+    """模拟设备更新和大量轮询请求，测量处理函数的耗时"""
+    from receiver import EEGRecord, Request
+    from tgam import synth_frames
+    cache = LatestCache()
+    frames = list(synth_frames(500, seed=1, zero_ratio=0.02))
+    now = time.time_ns() // 1000
+    records = []
+    for r in range(10):
+        for d in range(args.devices):
+            # 每台设备的帧每两轮重复一次（专注度/放松度变化缓慢时常见）
+            records.append(EEGRecord.from_frame(frames[(r // 2 + d) % len(frames)], "DEV%05d" % d, now + r * 1000000))
+    t0 = time.perf_counter()
+    for rec in records:
+        cache.sink(rec)
+    dt = time.perf_counter() - t0
+    print(f"更新 {cache.updates} 次: {dt / cache.updates * 1e6:.2f} us/次, 重新编码 {cache.rebuilds} 次")
+    cases = [("单设备", "/devices/latest?id=DEV00001"),
+             ("10个设备", "/devices/latest?id=" + ",".join("DEV%05d" % i for i in range(10))),
+             ("全部设备", "/devices/latest")]
+    for name, target in cases:
+        req = Request("GET", target, {}, b"")
+        status, _, body, headers = cache.handle(req)
+        cond = Request("GET", target, {"if-none-match": headers["ETag"]}, b"")
+        for label, r in (("200", req), ("304", cond)):
+            t0 = time.perf_counter()
+            for _ in range(args.requests):
+                cache.handle(r)
+            us = (time.perf_counter() - t0) / args.requests * 1e6
+            print(f"{name} {label}: {us:.2f} us/请求" + (f", 内容 {len(body)} 字节" if label == "200" else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="设备最新数据缓存")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("bench", help="更新和轮询性能测试")
+    p.add_argument("--devices", type=int, default=2000)
+    p.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    bench(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""设备集群压测工具：模拟N台虚拟设备按TGAM节奏向接收端发送数据，统计实际速率、错误和服务器端延迟
+
+用法:
+  python loadgen.py --devices 2000 --mode udp --duration 60
+  python loadgen.py --devices 500 --mode http --rate 1 --batch 1 --reconnect 0.01
+  python loadgen.py --devices 1000 --mode mixed --trace --host 192.168.2.124
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+
+from latency import LatencyHistogram
+from receiver import UPLOAD_PREFIX, now_us
+from tgam import eeg_json, synth_frames
+
+class Stats:
+    """全部虚拟设备共享的计数器"""
+
+    def __init__(self):
+        self.sent = 0  # 已发送的帧数
+        self.requests = 0  # UDP数据报或HTTP请求数
+        self.bytes = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.late = 0  # 发送时已落后于计划时间一个周期以上的次数
+        self.rtt = LatencyHistogram()  # HTTP请求往返时间（客户端侧）
+
+class UdpPool(asyncio.DatagramProtocol):
+    """UDP发送套接字，多台虚拟设备共用一个"""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        self.stats.errors += 1
+
+class VirtualDevice:
+    """一台虚拟设备：独立的芯片ID、模拟帧序列和发送节奏"""
+
+    def __init__(self, index, args, stats):
+        self.chip_id = "%s%06X" % (args.id_prefix, index)
+        self.args = args
+        self.stats = stats
+        self.rng = random.Random(args.seed * 1000003 + index)
+        self.frames = synth_frames(1 << 62, seed=args.seed * 1000003 + index, zero_ratio=args.zero_ratio)
+        self.seq = 0
+        self.reader = self.writer = None
+        self.connects = 0  # 成功建立的连接数，第一次之后的才计为重连
+        self.path = (UPLOAD_PREFIX + self.chip_id).encode('latin-1')
+
+    def _trace(self):
+        """模拟设备端的读取/解析/发送时间戳（与接收端同机时时钟一致）"""
+        t_send = now_us()
+        t_uart = t_send - self.rng.randint(500, 3000)
+        self.seq += 1
+        return self.seq, t_uart, t_uart + self.rng.randint(100, 400), t_send
+
+    def udp_payload(self, frame):
+        """与固件 broadcast_udp_json 相同的JSON，追加id以便接收端区分共用源地址的虚拟设备"""
+        body = eeg_json(frame)[:-1] + b', "id": "' + self.chip_id.encode() + b'"'
+        if self.args.trace:
+            seq, t_uart, t_parse, t_send = self._trace()
+            body += b', "seq": %d, "tr": [%d, %d, %d], "rtt": 0' % (seq, t_uart, t_parse, t_send)
+        return body + b'}'
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.args.host, self.args.port), self.args.timeout)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def post(self, body):
+        """在长连接上发送一次上传请求并读取响应，失败时断开以便下次重连"""
+        if self.writer is None:
+            await self.connect()
+            if self.connects:
+                self.stats.reconnects += 1  # 之前的连接已断开
+            self.connects += 1
+        head = b"POST " + self.path + b" HTTP/1.1\r\nHost: " + self.args.host.encode() + \
+            b"\r\nContent-Type: application/octet-stream\r\nContent-Length: %d\r\n" % len(body)
+        if self.args.trace:
+            head += b"X-Trace: %d,%d,%d,%d,0\r\n" % self._trace()
+        t0 = time.perf_counter()
+        self.writer.write(head + b"\r\n" + body)
+        status = await asyncio.wait_for(self._read_response(), self.args.timeout)
+        self.stats.rtt.record(int((time.perf_counter() - t0) * 1e6))
+        if status != 200:
+            raise ConnectionError(f"HTTP {status}")
+
+    async def _read_response(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("连接已关闭")
+        status = int(line.split(b" ", 2)[1])
+        length = 0
+        while True:
+            h = await self.reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            if h[:15].lower() == b"content-length:":
+                length = int(h[15:])
+        if length:
+            await self.reader.readexactly(length)
+        return status
+
+    async def run(self, mode, udp, addr, deadline):
+        args = self.args
+        period = args.batch / args.rate
+        # 随机错开启动时间，避免所有设备在同一时刻发送
+        await asyncio.sleep(self.rng.random() * period)
+        next_t = time.monotonic()
+        while next_t < deadline:
+            frames = [next(self.frames) for _ in range(args.batch)]
+            try:
+                if mode == "udp":
+                    for frame in frames:
+                        data = self.udp_payload(frame)
+                        udp.transport.sendto(data, addr)
+                        self.stats.bytes += len(data)
+                    self.stats.requests += len(frames)
+                else:
+                    body = b"".join(frames)
+                    await self.post(body)
+                    self.stats.bytes += len(body)
+                    self.stats.requests += 1
+                    if self.rng.random() < args.reconnect:
+                        self.close()  # 模拟WiFi掉线后重新建立连接
+                self.stats.sent += len(frames)
+            except (OSError, ConnectionError, ValueError, IndexError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                self.stats.errors += 1
+                self.close()
+            # 下一次发送时间：按周期推进并叠加抖动，落后太多时不追赶
+            next_t += period * (1 + self.rng.uniform(-args.jitter, args.jitter))
+            now = time.monotonic()
+            if next_t < now - period:
+                self.stats.late += 1
+                next_t = now
+            await asyncio.sleep(max(0.0, next_t - now))
+        self.close()
+
+async def http_get_json(host, port, path, timeout=5):
+    """向接收端发送一次GET请求并解析JSON响应"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+        data = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return json.loads(data.partition(b"\r\n\r\n")[2])
+
+async def report_loop(stats, args, interval):
+    target = args.devices * args.rate
+    last_sent, last_t = 0, time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        rate = (stats.sent - last_sent) / (now - last_t)
+        last_sent, last_t = stats.sent, now
+        line = (f"[{time.strftime('%H:%M:%S')}] 发送 {stats.sent} 帧 ({rate:.0f}/秒, 目标 {target:.0f}/秒), "
+                f"错误 {stats.errors}, 重连 {stats.reconnects}, 落后 {stats.late}")
+        if stats.rtt.n:
+            s = stats.rtt.summary()
+            line += f", 请求往返 p50 {s['p50_us'] / 1000:.2f}ms p99 {s['p99_us'] / 1000:.2f}ms"
+        print(line)
+
+async def server_report(args, stats):
+    """压测结束后读取接收端的 /stats 和 /latency，对比发送量估算丢失率"""
+    try:
+        server = await http_get_json(args.host, args.port, "/stats")
+        latency = (await http_get_json(args.host, args.port, "/latency?id=*")).get("*") if args.trace else None
+    except (OSError, ValueError, asyncio.TimeoutError) as e:
+        print(f"无法读取接收端统计: {e}")
+        return
+    print(f"接收端: 记录 {server['records']} 条, 错误 {server['errors']}, 来源 {server['counts']}")
+    if not args.fresh:
+        print("（接收端计数包含本次压测之前的数据，使用 --fresh 表示接收端为新启动）")
+    elif stats.sent:
+        print(f"丢失率: {max(0, stats.sent - server['records']) / stats.sent:.2%}")
+    if latency:
+        for seg, s in latency.items():
+            if s["n"]:
+                print(f"  {seg:12s} p50 {s['p50_us'] / 1000:8.2f}ms  p99 {s['p99_us'] / 1000:8.2f}ms  max {s['max_us'] / 1000:8.2f}ms")
+
+async def amain(args):
+    stats = Stats()
+    loop = asyncio.get_running_loop()
+    addr = (args.host, args.port)
+    pools = []
+    for _ in range(max(1, args.udp_sockets) if args.mode != "http" else 0):
+        _, proto = await loop.create_datagram_endpoint(lambda: UdpPool(stats), family=socket.AF_INET)
+        pools.append(proto)
+    devices = [VirtualDevice(i, args, stats) for i in range(args.devices)]
+    deadline = time.monotonic() + args.duration
+    tasks = []
+    for i, dev in enumerate(devices):
+        mode = args.mode if args.mode != "mixed" else ("udp" if i % 2 == 0 else "http")
+        tasks.append(asyncio.create_task(dev.run(mode, pools[i % len(pools)] if pools else None, addr, deadline)))
+    print(f"启动 {args.devices} 台虚拟设备 ({args.mode}) -> {args.host}:{args.port}，"
+          f"每台 {args.rate}帧/秒，时长 {args.duration} 秒")
+    reporter = asyncio.create_task(report_loop(stats, args, args.report))
+    t0 = time.monotonic()
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - t0
+    reporter.cancel()
+    for p in pools:
+        p.transport.close()
+    print(f"完成: {elapsed:.1f} 秒内发送 {stats.sent} 帧 ({stats.sent / elapsed:.0f}/秒), "
+          f"{stats.requests} 个请求, {stats.bytes / 1e6:.2f} MB, 错误 {stats.errors}, 重连 {stats.reconnects}")
+    if stats.rtt.n:
+        s = stats.rtt.summary()
+        print(f"请求往返: p50 {s['p50_us'] / 1000:.2f}ms p99 {s['p99_us'] / 1000:.2f}ms max {s['max_us'] / 1000:.2f}ms")
+    await asyncio.sleep(0.5)  # 等待接收端处理完最后的数据
+    await server_report(args, stats)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="EEG接收端压测：模拟大量虚拟设备")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9003)
+    parser.add_argument("--devices", type=int, default=1000, help="虚拟设备数量")
+    parser.add_argument("--mode", choices=("udp", "http", "mixed"), default="udp",
+                        help="udp: 广播JSON；http: 帧上传接口；mixed: 各一半")
+    parser.add_argument("--rate", type=float, default=1.0, help="每台设备每秒帧数（TGAM为1）")
+    parser.add_argument("--batch", type=int, default=1, help="每次发送的帧数，HTTP模式下合并为一个请求")
+    parser.add_argument("--jitter", type=float, default=0.1, help="发送间隔的随机抖动比例")
+    parser.add_argument("--reconnect", type=float, default=0.0, help="HTTP模式下每次请求后断开重连的概率")
+    parser.add_argument("--zero-ratio", type=float, default=0.02, help="零帧（未佩戴）比例")
+    parser.add_argument("--trace", action="store_true", help="附带追踪时间戳，接收端统计各段延迟")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长（秒）")
+    parser.add_argument("--timeout", type=float, default=5, help="HTTP连接和响应超时（秒）")
+    parser.add_argument("--udp-sockets", type=int, default=16, help="UDP发送套接字数量")
+    parser.add_argument("--id-prefix", default="LG", help="虚拟设备芯片ID前缀")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", type=float, default=5, help="进度报告间隔（秒）")
+    parser.add_argument("--fresh", action="store_true", help="接收端为新启动，结束时计算丢失率")
+    return parser
+
+def main():
+    args = build_parser().parse_args()
+    try:
+        asyncio.run(amain(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
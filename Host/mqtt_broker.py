@@ -0,0 +1,530 @@
+"""MQTT 3.1.1 代理替身（asyncio，QoS0/1），用于在一台Linux机器上测试设备的MQTT上行（lib/mqtt.py）的吞吐和重发行为
+
+只实现设备和接收端用到的部分：CONNECT（持久会话）、PUBLISH/PUBACK、SUBSCRIBE（+ 和 # 通配符）、UNSUBSCRIBE、PINGREQ、DISCONNECT。
+不支持保留消息、遗嘱、QoS2和认证；会话只保存在内存中。
+持久会话（clean_session=0）在断线期间保留订阅和发往该客户端的消息（队列满时丢弃最旧的），重连后先重发未确认的消息（DUP）。
+
+用法:
+  python mqtt_broker.py serve [--port 1883] [--drop-acks 0.01] [--kill-every 5]
+  python receiver.py --mqtt 127.0.0.1:1883          # 接收端订阅 eeg/+，负载为批量紧凑编码
+  python mqtt_broker.py bench [--devices 20] [--batches 200] [--window 8] [--drop-acks 0.01] [--kill-every 2]
+"""
+import argparse
+import asyncio
+import random
+import struct
+import time
+from collections import OrderedDict, deque
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 0x10, 0x20, 0x30, 0x40
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 0x80, 0x90, 0xA0, 0xB0
+PINGREQ, PINGRESP, DISCONNECT = 0xC0, 0xD0, 0xE0
+DUP = 0x08
+
+def encode_length(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        out.append(b | 0x80 if n else b)
+        if not n:
+            return bytes(out)
+
+def packet(first, body=b""):
+    return bytes((first,)) + encode_length(len(body)) + body
+
+def _str(s):
+    b = s.encode() if isinstance(s, str) else s
+    return struct.pack(">H", len(b)) + b
+
+def publish_packet(topic, payload, pid=0, qos=1, dup=False):
+    body = _str(topic) + (struct.pack(">H", pid) if qos else b"") + payload
+    return packet(PUBLISH | (qos << 1) | (DUP if dup else 0), body)
+
+async def read_packet(reader):
+    """返回 (首字节, 报文体)，连接关闭时抛出 asyncio.IncompleteReadError"""
+    first = (await reader.readexactly(1))[0]
+    n = shift = 0
+    while True:
+        b = (await reader.readexactly(1))[0]
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise ValueError("剩余长度超过4字节")
+    return first, (await reader.readexactly(n) if n else b"")
+
+def parse_publish(first, body):
+    """返回 (主题, 报文ID, 负载)，QoS0时报文ID为0"""
+    n = struct.unpack_from(">H", body)[0]
+    topic = body[2:2 + n].decode()
+    pos = 2 + n
+    pid = 0
+    if first & 0x06:
+        pid = struct.unpack_from(">H", body, pos)[0]
+        pos += 2
+    return topic, pid, body[pos:]
+
+def topic_matches(pattern, topic):
+    p = pattern.split("/")
+    t = topic.split("/")
+    for i, part in enumerate(p):
+        if part == "#":
+            return True
+        if i >= len(t) or (part != "+" and part != t[i]):
+            return False
+    return len(p) == len(t)
+
+class Session:
+    """一个客户端ID的会话：订阅、发往该客户端的在途消息和离线队列"""
+
+    def __init__(self, client_id, queue_limit):
+        self.client_id = client_id
+        self.subs = {}  # 主题过滤器 -> QoS
+        self.inflight = OrderedDict()  # 报文ID -> (主题, 负载)
+        self.queue = deque()
+        self.queue_limit = queue_limit
+        self.next_pid = 1
+        self.writer = None
+        self.clean = False
+        self.dropped = 0
+
+    def qos_for(self, topic):
+        """匹配的订阅中最高的QoS，没有匹配时返回None"""
+        best = None
+        for pattern, qos in self.subs.items():
+            if topic_matches(pattern, topic) and (best is None or qos > best):
+                best = qos
+        return best
+
+class Broker:
+    """代理替身；drop_acks 按概率不回复发布者的PUBACK，kill_every 定期断开所有连接，用于测试重发"""
+
+    def __init__(self, window=32, queue_limit=10000, drop_acks=0.0, kill_every=0.0, seed=None):
+        self.window = window  # 每个订阅者的在途消息数上限
+        self.queue_limit = queue_limit
+        self.drop_acks = drop_acks
+        self.kill_every = kill_every
+        self.rng = random.Random(seed)
+        self.sessions = {}
+        self.stats = {"connects": 0, "resumed": 0, "published": 0, "dup_in": 0, "acks_dropped": 0,
+                      "delivered": 0, "redelivered": 0, "queued": 0, "dropped": 0, "kills": 0}
+
+    async def serve(self, host="0.0.0.0", port=1883):
+        server = await asyncio.start_server(self.handle, host, port)
+        if self.kill_every:
+            asyncio.get_running_loop().create_task(self._killer())
+        return server
+
+    async def _killer(self):
+        while True:
+            await asyncio.sleep(self.kill_every)
+            self.stats["kills"] += 1
+            for s in self.sessions.values():
+                if s.writer:
+                    s.writer.transport.abort()
+
+    async def handle(self, reader, writer):
+        session = None
+        try:
+            first, body = await asyncio.wait_for(read_packet(reader), 10)
+            if first & 0xF0 != CONNECT:
+                return
+            session, keepalive = self._connect(body, writer)
+            timeout = keepalive * 1.5 if keepalive else None
+            while True:
+                first, body = await asyncio.wait_for(read_packet(reader), timeout)
+                kind = first & 0xF0
+                if kind == PUBLISH:
+                    self._on_publish(writer, first, body)
+                elif kind == PUBACK:
+                    session.inflight.pop(struct.unpack(">H", body)[0], None)
+                    self._drain(session)
+                elif kind == SUBSCRIBE:
+                    self._on_subscribe(session, writer, body)
+                elif kind == UNSUBSCRIBE:
+                    pos = 2
+                    while pos < len(body):
+                        n = struct.unpack_from(">H", body, pos)[0]
+                        session.subs.pop(body[pos + 2:pos + 2 + n].decode(), None)
+                        pos += 2 + n
+                    writer.write(packet(UNSUBACK, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(packet(PINGRESP))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ValueError, struct.error):
+            pass
+        finally:
+            if session is not None and session.writer is writer:
+                session.writer = None
+                if session.clean:
+                    del self.sessions[session.client_id]
+            writer.close()
+
+    def _connect(self, body, writer):
+        n = struct.unpack_from(">H", body)[0]
+        pos = 2 + n
+        level, flags, keepalive = struct.unpack_from(">BBH", body, pos)
+        if level != 4:
+            writer.write(packet(CONNACK, b"\x00\x01"))  # 不支持的协议版本
+            raise ValueError("协议版本 %d" % level)
+        pos += 4
+        n = struct.unpack_from(">H", body, pos)[0]
+        client_id = body[pos + 2:pos + 2 + n].decode() or "anon-%x" % id(writer)
+        clean = bool(flags & 0x02)
+        session = self.sessions.get(client_id)
+        present = session is not None and not clean
+        if session is not None and session.writer is not None:
+            session.writer.transport.abort()  # 同一客户端ID的新连接接管会话
+        if not present:
+            session = self.sessions[client_id] = Session(client_id, self.queue_limit)
+        session.clean = clean
+        session.writer = writer
+        self.stats["connects"] += 1
+        self.stats["resumed"] += present
+        writer.write(packet(CONNACK, bytes((1 if present else 0, 0))))
+        # 按原顺序重发未确认的消息，再发送离线期间排队的消息
+        for pid, (topic, payload) in session.inflight.items():
+            writer.write(publish_packet(topic, payload, pid, 1, dup=True))
+            self.stats["redelivered"] += 1
+        self._drain(session)
+        return session, keepalive
+
+    def _on_publish(self, writer, first, body):
+        topic, pid, payload = parse_publish(first, body)
+        self.stats["published"] += 1
+        self.stats["dup_in"] += bool(first & DUP)
+        if first & 0x06:
+            if self.drop_acks and self.rng.random() < self.drop_acks:
+                self.stats["acks_dropped"] += 1
+            else:
+                writer.write(packet(PUBACK, struct.pack(">H", pid)))
+        # QoS1只保证至少一次：重发的消息（DUP）同样转发，由订阅者去重
+        for s in self.sessions.values():
+            qos = s.qos_for(topic)
+            if qos is None:
+                continue
+            if qos == 0:
+                if s.writer:
+                    s.writer.write(publish_packet(topic, payload, qos=0))
+                    self.stats["delivered"] += 1
+                continue
+            if len(s.queue) >= s.queue_limit:
+                s.queue.popleft()
+                s.dropped += 1
+                self.stats["dropped"] += 1
+            s.queue.append((topic, payload))
+            self.stats["queued"] += 1
+            self._drain(s)
+
+    def _drain(self, s):
+        """在途窗口有空位时把排队的消息发给在线的订阅者"""
+        while s.writer is not None and s.queue and len(s.inflight) < self.window:
+            topic, payload = s.queue.popleft()
+            pid = s.next_pid
+            while pid in s.inflight:
+                pid = pid % 65535 + 1
+            s.next_pid = pid % 65535 + 1
+            s.inflight[pid] = (topic, payload)
+            s.writer.write(publish_packet(topic, payload, pid, 1))
+            self.stats["delivered"] += 1
+
+    def _on_subscribe(self, session, writer, body):
+        pid = body[:2]
+        pos = 2
+        granted = bytearray()
+        while pos < len(body):
+            n = struct.unpack_from(">H", body, pos)[0]
+            pattern = body[pos + 2:pos + 2 + n].decode()
+            qos = min(body[pos + 2 + n], 1)
+            session.subs[pattern] = qos
+            granted.append(qos)
+            pos += 3 + n
+        writer.write(packet(SUBACK, pid + bytes(granted)))
+
+class AsyncClient:
+    """主机端MQTT客户端：发布部分与 lib/mqtt.py 的语义相同（持久会话、在途窗口、重连后按顺序DUP重发、确认超时时重连），
+    也可订阅，收到的QoS1消息在回调返回后确认"""
+
+    def __init__(self, client_id, host="127.0.0.1", port=1883, window=8, keepalive=60, ack_timeout=10.0,
+                 retry_s=5.0, on_message=None, subscriptions=()):
+        self.client_id = client_id
+        self.host = host
+        self.port = port
+        self.window = window
+        self.keepalive = keepalive
+        self.ack_timeout = ack_timeout
+        self.retry_s = retry_s
+        self.on_message = on_message  # 回调 (主题, 负载, 是否DUP)
+        self.subscriptions = list(subscriptions)
+        self.inflight = OrderedDict()  # 报文ID -> [报文, 发送时间]，发送时间为None表示断线期间发布、尚未发送
+        self._next_pid = 1
+        self._space = asyncio.Event()
+        self._space.set()
+        self._writer = None
+        self._closing = False
+        self.connects = 0
+        self.published = 0
+        self.acked = 0
+        self.redelivered = 0
+        self.received = 0
+        self.errors = 0
+
+    async def publish(self, topic, payload):
+        """窗口满时等待；断线期间消息留在窗口中，重连后发送"""
+        while len(self.inflight) >= self.window:
+            self._space.clear()
+            await self._space.wait()
+        pid = self._next_pid
+        while pid in self.inflight:
+            pid = pid % 65535 + 1
+        self._next_pid = pid % 65535 + 1
+        pkt = publish_packet(topic, payload, pid, 1)
+        self.inflight[pid] = [pkt, None]
+        self.published += 1
+        if self._writer is not None:
+            self._writer.write(pkt)
+            self.inflight[pid][1] = time.monotonic()
+
+    async def drain(self, timeout=30.0):
+        """等待所有在途消息被确认"""
+        deadline = time.monotonic() + timeout
+        while self.inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return not self.inflight
+
+    def close(self):
+        self._closing = True
+        if self._writer is not None:
+            self._writer.write(packet(DISCONNECT))
+            self._writer.close()
+
+    async def run(self):
+        """连接并处理报文，断线后按 retry_s 间隔重连，直到 close()"""
+        while not self._closing:
+            try:
+                await self._session()
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+                self.errors += 1
+                if self._closing:
+                    break
+                if self.connects == 0 and self.errors == 1:
+                    print(f"MQTT连接失败 {self.client_id}: {e!r}")
+            self._writer = None
+            if not self._closing:
+                await asyncio.sleep(self.retry_s)
+
+    async def _session(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            body = _str("MQTT") + bytes((4, 0)) + struct.pack(">H", self.keepalive) + _str(self.client_id)
+            writer.write(packet(CONNECT, body))
+            first, body = await asyncio.wait_for(read_packet(reader), 5)
+            if first != CONNACK or body[1] != 0:
+                raise ValueError("CONNACK错误: %r" % body)
+            self.connects += 1
+            now = time.monotonic()
+            for entry in self.inflight.values():
+                if entry[1] is not None:
+                    entry[0] = bytes((entry[0][0] | DUP,)) + entry[0][1:]
+                    self.redelivered += 1
+                entry[1] = now
+                writer.write(entry[0])
+            if self.subscriptions:
+                writer.write(packet(SUBSCRIBE | 0x02, b"\x00\x01" + b"".join(_str(t) + b"\x01" for t in self.subscriptions)))
+            self._writer = writer
+            await writer.drain()
+            while True:
+                timeout = self.keepalive / 2
+                if self.inflight:
+                    oldest = next(iter(self.inflight.values()))[1]
+                    timeout = min(timeout, max(oldest + self.ack_timeout - time.monotonic(), 0.001))
+                try:
+                    first, body = await asyncio.wait_for(read_packet(reader), timeout)
+                except asyncio.TimeoutError:
+                    if self.inflight and time.monotonic() - next(iter(self.inflight.values()))[1] >= self.ack_timeout:
+                        raise OSError("PUBACK超时")
+                    writer.write(packet(PINGREQ))
+                    continue
+                kind = first & 0xF0
+                if kind == PUBACK:
+                    if self.inflight.pop(struct.unpack(">H", body)[0], None) is not None:
+                        self.acked += 1
+                        self._space.set()
+                elif kind == PUBLISH:
+                    topic, pid, payload = parse_publish(first, body)
+                    self.received += 1
+                    if self.on_message:
+                        self.on_message(topic, payload, bool(first & DUP))
+                    if pid:
+                        writer.write(packet(PUBACK, struct.pack(">H", pid)))
+                await writer.drain()
+        finally:
+            self._writer = None
+            writer.close()
+
+    def stats(self):
+        return {"connects": self.connects, "published": self.published, "acked": self.acked,
+                "inflight": len(self.inflight), "redelivered": self.redelivered, "received": self.received,
+                "errors": self.errors}
+
+# 比设备最新批次早不超过该时间的批次视为重发：设备在途窗口最多8批、每批最长10秒，重发的批次不会早这么多；
+# 更早的批次视为设备重启（ticks_ms 从0开始）或计数回绕，按新批次处理
+REPLAY_WINDOW_MS = 300000
+
+class ReplayFilter:
+    """QoS1至少送达一次，订阅者按设备记录最新批次的基准时间戳（设备毫秒计数），丢弃不晚于它的批次；
+    未收到过的重发批次（DUP）按设备时钟从上一批的接收时间推算时间，而不是使用重发到达的时间"""
+
+    def __init__(self, window_ms=REPLAY_WINDOW_MS):
+        from eegcodec import HEADER
+        self._header = HEADER
+        self.window_ms = window_ms
+        self.last = {}  # 设备 -> [最新批次的基准时间戳ms, 其接收时间us]
+        self.duplicates = 0
+        self.anchored = 0
+
+    def accept(self, device_id, payload, dup, recv_us):
+        """返回批次的接收时间us，重复的批次返回None"""
+        try:
+            base = self._header.unpack_from(payload)[4]
+        except struct.error:
+            return recv_us  # 交给 Ingest.handle_batch 计为错误
+        last = self.last.get(device_id)
+        if last is not None:
+            if (last[0] - base) & 0xFFFFFFFF < self.window_ms:
+                self.duplicates += 1
+                return None
+            if dup:
+                t = last[1] + ((base - last[0]) & 0xFFFFFFFF) * 1000
+                if t < recv_us:
+                    recv_us = t
+                    self.anchored += 1
+        self.last[device_id] = [base, recv_us]
+        return recv_us
+
+class MqttSource:
+    """接收端的MQTT数据来源：订阅 eeg/+，去掉重发的批次后按批量紧凑编码解码送入 Ingest"""
+
+    def __init__(self, ingest, host, port=1883, topic="eeg/+", client_id="receiver"):
+        self.ingest = ingest
+        self.filter = ReplayFilter()
+        self.client = AsyncClient(client_id, host, port, retry_s=2.0, on_message=self.on_message,
+                                  subscriptions=[topic])
+
+    def on_message(self, topic, payload, dup):
+        from receiver import now_us
+        device_id = topic.rsplit("/", 1)[-1]
+        recv_us = self.filter.accept(device_id, payload, dup, now_us())
+        if recv_us is not None:
+            self.ingest.handle_batch(device_id, payload, recv_us)
+
+    def start(self):
+        return asyncio.get_running_loop().create_task(self.client.run())
+
+    def close(self):
+        self.client.close()
+
+async def serve(args):
+    broker = Broker(drop_acks=args.drop_acks, kill_every=args.kill_every)
+    server = await broker.serve(args.host, args.port)
+    print(f"MQTT代理: {args.host}:{args.port}" + (f", 丢弃PUBACK概率 {args.drop_acks}" if args.drop_acks else "") +
+          (f", 每 {args.kill_every} 秒断开所有连接" if args.kill_every else ""))
+    async with server:
+        while True:
+            await asyncio.sleep(args.report)
+            print(f"[{time.strftime('%H:%M:%S')}] 会话 {len(broker.sessions)}, {broker.stats}")
+
+async def bench(args):
+    """N个模拟设备以QoS1发布批次，一个持久会话的订阅者统计吞吐、重复和丢失；批次序号编码在批次的基准时间戳中"""
+    from eegcodec import HEADER, encode_batch
+    from tgam import synth_frames
+    broker = Broker(window=args.sub_window, drop_acks=args.drop_acks, kill_every=args.kill_every, seed=1)
+    server = await broker.serve("127.0.0.1", args.port)
+    port = server.sockets[0].getsockname()[1]
+    frames = list(synth_frames(args.frames, seed=1))
+    seen = {}
+    counts = {"messages": 0, "duplicates": 0, "dup_flag": 0, "passed_dup": 0}
+    replay = ReplayFilter()
+
+    def on_message(topic, payload, dup):
+        seq = HEADER.unpack_from(payload)[4] // args.frames
+        s = seen.setdefault(topic, set())
+        counts["messages"] += 1
+        counts["dup_flag"] += dup
+        kept = replay.accept(topic, payload, dup, time.time_ns() // 1000) is not None
+        if seq in s:
+            counts["duplicates"] += 1
+            counts["passed_dup"] += kept
+        s.add(seq)
+
+    sub = AsyncClient("bench-sub", "127.0.0.1", port, retry_s=0.05, on_message=on_message, subscriptions=["eeg/+"])
+    tasks = [asyncio.create_task(sub.run())]
+    while not sub.connects:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)  # 等待SUBACK
+    pubs = [AsyncClient("SIM%06d" % i, "127.0.0.1", port, window=args.window, ack_timeout=args.ack_timeout,
+                        retry_s=0.05) for i in range(args.devices)]
+    tasks += [asyncio.create_task(p.run()) for p in pubs]
+
+    async def device(p):
+        topic = "eeg/" + p.client_id
+        for seq in range(args.batches):
+            ts = [seq * args.frames + k for k in range(args.frames)]
+            await p.publish(topic, encode_batch(frames, ts))
+
+    payload_bytes = len(encode_batch(frames, list(range(args.frames))))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(device(p) for p in pubs))
+    await asyncio.gather(*(p.drain(args.timeout) for p in pubs))
+    expected = args.devices * args.batches
+    deadline = time.monotonic() + args.timeout
+    while sum(len(s) for s in seen.values()) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    dt = time.perf_counter() - t0
+    for p in pubs:
+        p.close()
+    sub.close()
+    await asyncio.sleep(0.05)
+    for t in tasks:
+        t.cancel()
+    server.close()
+
+    unique = sum(len(s) for s in seen.values())
+    ps = {k: sum(p.stats()[k] for p in pubs) for k in ("published", "acked", "redelivered", "connects")}
+    print(f"设备 {args.devices} 个 x {args.batches} 批 x {args.frames} 帧（每批 {payload_bytes} 字节），窗口 {args.window}，"
+          f"丢弃PUBACK概率 {args.drop_acks}，断开间隔 {args.kill_every or '-'} 秒")
+    print(f"  耗时 {dt:.2f} 秒: {unique / dt:.0f} 批/秒, {unique * args.frames / dt:.0f} 帧/秒")
+    print(f"  发布者: {ps}")
+    print(f"  订阅者: 收到 {counts['messages']} 条, 重复 {counts['duplicates']} 条（DUP标志 {counts['dup_flag']}）, "
+          f"丢失 {expected - unique} 批, 连接 {sub.connects} 次")
+    print(f"  去重: 丢弃 {replay.duplicates} 条, 漏过的重复 {counts['passed_dup']} 条, 按原时间推算 {replay.anchored} 条")
+    print(f"  代理: {broker.stats}")
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT代理替身与上行基准测试")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve", help="运行代理")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=1883)
+    p.add_argument("--report", type=float, default=10)
+    p2 = sub.add_parser("bench", help="本机吞吐与重发测试")
+    p2.add_argument("--port", type=int, default=0, help="代理端口，0表示自动选择")
+    p2.add_argument("--devices", type=int, default=20)
+    p2.add_argument("--batches", type=int, default=200, help="每个设备发布的批次数")
+    p2.add_argument("--frames", type=int, default=10, help="每批帧数")
+    p2.add_argument("--window", type=int, default=8, help="发布者在途窗口")
+    p2.add_argument("--sub-window", type=int, default=64, help="代理发往订阅者的在途窗口")
+    p2.add_argument("--ack-timeout", type=float, default=1.0, help="发布者等待PUBACK的超时（秒），超时后重连重发")
+    p2.add_argument("--timeout", type=float, default=60)
+    for q in (p, p2):
+        q.add_argument("--drop-acks", type=float, default=0.0, help="不回复PUBACK的概率")
+        q.add_argument("--kill-every", type=float, default=0.0, help="每隔若干秒断开所有连接，0表示不断开")
+    args = parser.parse_args()
+    asyncio.run(serve(args) if args.cmd == "serve" else bench(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""局域网OTA更新服务：按内容哈希生成清单，设备只下载变化的文件，文件内只下载变化的块（HTTP Range），协议见 lib/ota.py
+
+设备端路径与仓库文件的对应:
+  /main.py   <- Client/main.py
+  /lib/*.py  <- lib/*.py
+  /*.wav     <- Client-wav/*.wav
+
+GET /ota/manifest            {"version": "...", "block": 4096, "files": {"/main.py": [大小, "sha256"], ...}}，支持 If-None-Match
+GET /ota/blocks?path=/1.wav  每块sha256的前8字节，按块顺序拼接的二进制
+GET /ota/file?path=/1.wav    文件内容，支持 Range: bytes=起始-结束
+
+用法:
+  python receiver.py --ota ..                        # 在接收端提供OTA接口，参数为仓库根目录
+  python ota_server.py serve [--root ..] [--port 9003]
+  python ota_server.py sync 目标目录 [--server 127.0.0.1:9003] [--dry-run]   # 按设备端算法把目录更新到最新
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import http.client
+import json
+import os
+import time
+
+BLOCK = 4096  # 与ESP32 flash扇区大小相同
+DIGEST = 8  # 每块哈希保留的字节数
+LAYOUT = (("/main.py", "Client/main.py"), ("/lib/", "lib/*.py"), ("/", "Client-wav/*.wav"))
+
+def block_hashes(data, block=BLOCK):
+    return b"".join(hashlib.sha256(data[i:i + block]).digest()[:DIGEST] for i in range(0, len(data), block))
+
+class FileEntry:
+    __slots__ = ("path", "src", "size", "mtime", "sha256", "blocks")
+
+class OtaRepo:
+    """扫描仓库中需要下发的文件，只对大小或修改时间变化的文件重新计算哈希"""
+
+    def __init__(self, root, layout=LAYOUT, block=BLOCK, rescan_s=1.0):
+        self.root = root
+        self.layout = layout
+        self.block = block
+        self.rescan_s = rescan_s
+        self.files = {}
+        self.version = ""
+        self._manifest = b"{}"
+        self._scanned = 0.0
+        self.requests = {"manifest": 0, "not_modified": 0, "blocks": 0, "range": 0, "full": 0}
+        self.bytes_served = 0
+        self.scan()
+
+    def _sources(self):
+        for dest, pattern in self.layout:
+            for src in sorted(glob.glob(os.path.join(self.root, pattern))):
+                yield (dest + os.path.basename(src) if dest.endswith("/") else dest), src
+
+    def scan(self):
+        """重新扫描，内容有变化时重新生成清单和版本号"""
+        self._scanned = time.monotonic()
+        files = {}
+        for path, src in self._sources():
+            st = os.stat(src)
+            e = self.files.get(path)
+            if e is None or e.src != src or e.size != st.st_size or e.mtime != st.st_mtime_ns:
+                with open(src, "rb") as f:
+                    data = f.read()
+                e = FileEntry()
+                e.path, e.src, e.size, e.mtime = path, src, st.st_size, st.st_mtime_ns
+                e.sha256 = hashlib.sha256(data).hexdigest()
+                e.blocks = block_hashes(data, self.block)
+            files[path] = e
+        listing = {p: [e.size, e.sha256] for p, e in sorted(files.items())}
+        version = hashlib.sha256(json.dumps(listing).encode()).hexdigest()[:16]
+        self.files = files
+        if version != self.version:
+            self.version = version
+            self._manifest = json.dumps({"version": version, "block": self.block, "files": listing}).encode()
+
+    def manifest(self):
+        if time.monotonic() - self._scanned >= self.rescan_s:
+            self.scan()
+        return self.version, self._manifest
+
+    def read(self, path, start=0, end=None):
+        e = self.files[path]
+        end = e.size - 1 if end is None else min(end, e.size - 1)
+        with open(e.src, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def stats(self):
+        return {"version": self.version, "files": len(self.files), "bytes": sum(e.size for e in self.files.values()),
+                "requests": self.requests, "bytes_served": self.bytes_served}
+
+def _range(header, size):
+    """解析单个 bytes=a-b / bytes=a- / bytes=-n，无法满足时返回None"""
+    unit, _, spec = header.partition("=")
+    start, _, end = spec.partition("-")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    if start == "":
+        n = int(end)
+        start, end = max(size - n, 0), size - 1
+    else:
+        start, end = int(start), int(end) if end else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+def add_routes(http, repo):
+    from receiver import json_response
+
+    def manifest(req):
+        version, body = repo.manifest()
+        etag = '"%s"' % version
+        repo.requests["manifest"] += 1
+        if req.headers.get("if-none-match") in (etag, version):
+            repo.requests["not_modified"] += 1
+            return 304, "application/json", b"", {"ETag": etag}
+        repo.bytes_served += len(body)
+        return 200, "application/json", body, {"ETag": etag}
+
+    def blocks(req):
+        e = repo.files.get(req.query.get("path"))
+        if e is None:
+            return 404, "text/plain", b"unknown file", None
+        repo.requests["blocks"] += 1
+        repo.bytes_served += len(e.blocks)
+        return 200, "application/octet-stream", e.blocks, {"X-Block-Size": str(repo.block)}
+
+    def file(req):
+        e = repo.files.get(req.query.get("path"))
+        if e is None:
+            return 404, "text/plain", b"unknown file", None
+        headers = {"Accept-Ranges": "bytes", "ETag": '"%s"' % e.sha256}
+        if "range" in req.headers:
+            r = _range(req.headers["range"], e.size)
+            if r is None:
+                return 416, "text/plain", b"bad range", {"Content-Range": "bytes */%d" % e.size}
+            body = repo.read(e.path, *r)
+            headers["Content-Range"] = "bytes %d-%d/%d" % (r[0], r[1], e.size)
+            repo.requests["range"] += 1
+            repo.bytes_served += len(body)
+            return 206, "application/octet-stream", body, headers
+        body = repo.read(e.path)
+        repo.requests["full"] += 1
+        repo.bytes_served += len(body)
+        return 200, "application/octet-stream", body, headers
+
+    http.route("GET", "/ota/manifest", manifest)
+    http.route("GET", "/ota/blocks", blocks)
+    http.route("GET", "/ota/file", file)
+    http.route("GET", "/ota/stats", lambda req: json_response(repo.stats()))
+
+async def serve(args):
+    from receiver import HttpServer, Ingest
+    repo = OtaRepo(args.root)
+    http = HttpServer(Ingest())
+    add_routes(http, repo)
+    server = await asyncio.start_server(http.handle, args.host, args.port)
+    print(f"OTA服务: http://{args.host}:{args.port}/ota/manifest, 版本 {repo.version}, "
+          f"{len(repo.files)} 个文件 {sum(e.size for e in repo.files.values())} 字节")
+    async with server:
+        await server.serve_forever()
+
+class SyncClient:
+    """设备端更新算法（lib/ota.py）的主机端实现：用于测试服务、预置设备文件或估算下载量"""
+
+    def __init__(self, server, dest):
+        host, _, port = server.partition(":")
+        self.conn = http.client.HTTPConnection(host, int(port or 9003), timeout=10)
+        self.dest = dest
+        self.downloaded = 0
+        self.copied = 0
+        self.requests = 0
+
+    def get(self, path, headers=None):
+        self.conn.request("GET", path, headers=headers or {})
+        resp = self.conn.getresponse()
+        body = resp.read()
+        self.requests += 1
+        self.downloaded += len(body)
+        return resp.status, body
+
+    def plan(self, path, size, block):
+        """返回 [(是否下载, 源偏移, 长度)]：本地已有相同哈希的块从旧文件复制，相邻的下载块合并为一个Range"""
+        _, remote = self.get("/ota/blocks?path=" + path)
+        local = {}
+        old = os.path.join(self.dest, path.lstrip("/"))
+        if os.path.exists(old):
+            with open(old, "rb") as f:
+                data = f.read()
+            for off in range(0, len(data), block):
+                local.setdefault(hashlib.sha256(data[off:off + block]).digest()[:DIGEST], off)
+        ops = []
+        for i in range(0, len(remote), DIGEST):
+            start = i // DIGEST * block
+            length = min(block, size - start)
+            src = local.get(remote[i:i + DIGEST])
+            if src is None and ops and ops[-1][0] and ops[-1][1] + ops[-1][2] == start:
+                ops[-1] = (True, ops[-1][1], ops[-1][2] + length)
+            else:
+                ops.append((src is None, start if src is None else src, length))
+        return ops
+
+    def sync(self, dry_run=False):
+        _, body = self.get("/ota/manifest")
+        manifest = json.loads(body)
+        changed = []
+        for path, (size, sha) in manifest["files"].items():
+            local = os.path.join(self.dest, path.lstrip("/"))
+            if os.path.exists(local) and os.path.getsize(local) == size:
+                with open(local, "rb") as f:
+                    if hashlib.sha256(f.read()).hexdigest() == sha:
+                        continue
+            changed.append((path, size, sha))
+        for path, size, sha in changed:
+            ops = self.plan(path, size, manifest["block"])
+            fetch = sum(n for is_fetch, _, n in ops if is_fetch)
+            print(f"  {path}: {size} 字节, 下载 {fetch} 字节（{sum(1 for o in ops if o[0])} 个Range）, 复制 {size - fetch} 字节")
+            if dry_run:
+                continue
+            local = os.path.join(self.dest, path.lstrip("/"))
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            old = open(local, "rb") if os.path.exists(local) else None
+            h = hashlib.sha256()
+            with open(local + ".ota", "wb") as out:
+                pos = 0
+                for is_fetch, src, n in ops:
+                    if is_fetch:
+                        _, chunk = self.get("/ota/file?path=" + path, {"Range": "bytes=%d-%d" % (src, src + n - 1)})
+                    else:
+                        old.seek(src)
+                        chunk = old.read(n)
+                        self.copied += n
+                    out.write(chunk)
+                    h.update(chunk)
+                    pos += n
+            if old:
+                old.close()
+            if h.hexdigest() != sha:
+                os.remove(local + ".ota")
+                raise ValueError(f"{path} 校验失败")
+            os.replace(local + ".ota", local)
+        return manifest["version"], changed
+
+def main():
+    parser = argparse.ArgumentParser(description="局域网OTA更新服务")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve", help="独立运行OTA服务")
+    p.add_argument("--root", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=9003)
+    p = sub.add_parser("sync", help="按设备端算法更新本地目录")
+    p.add_argument("dest")
+    p.add_argument("--server", default="127.0.0.1:9003")
+    p.add_argument("--dry-run", action="store_true", help="只显示需要下载的字节数")
+    args = parser.parse_args()
+    if args.cmd == "serve":
+        asyncio.run(serve(args))
+        return
+    client = SyncClient(args.server, args.dest)
+    t0 = time.perf_counter()
+    version, changed = client.sync(args.dry_run)
+    dt = time.perf_counter() - t0
+    print(f"版本 {version}: {len(changed)} 个文件变化, 下载 {client.downloaded} 字节（{client.requests} 个请求）, "
+          f"复制 {client.copied} 字节, {dt * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
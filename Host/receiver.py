@@ -0,0 +1,408 @@
+"""EEG数据接收端：UDP 9003（广播JSON、多通道数据报）、HTTP 9003（帧上传接口）、UDP 9005（时钟同步）
+
+用法: python receiver.py [--port 9003] [--sync-port 9005] [--discovery-port 9006] [--report 10] [--db eeg.db] [--colstore data/] [--rollup] [--fanout] [--ota ..] [--workers 4]
+"""
+import argparse
+import asyncio
+import json
+import struct
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from eegcodec import HUB_MAGIC, decode_batch, decode_hub_packet
+from latency import LatencyTracker
+from tgam import EEG_BANDS, FRAME_LEN, frame_values, parse_frame
+
+UPLOAD_PREFIX = "/api/device/eeg/"
+SYNC_MAGIC = b'SYNC'
+_SYNC_REQ = struct.Struct('<4sq')
+_SYNC_RESP = struct.Struct('<4sqqq')
+
+def now_us():
+    """服务器时钟（Unix微秒）"""
+    return time.time_ns() // 1000
+
+def _legacy_from_bands(bands):
+    """固件取帧中 HighAlpha、HighBeta、MiddleGamma 的中间字节（上限100）作为 Alpha、Beta、Gamma"""
+    return min((bands[3] >> 8) & 0xFF, 100), min((bands[5] >> 8) & 0xFF, 100), min((bands[7] >> 8) & 0xFF, 100)
+
+class EEGRecord:
+    """规范化后的一条EEG数据，各种上行格式都转换为该结构后再交给消费者"""
+
+    __slots__ = ("device_id", "ts_us", "ready", "attention", "meditation", "signal", "bands", "legacy", "seq")
+
+    def __init__(self, device_id, ts_us, ready, attention, meditation, signal=-1, bands=None, legacy=None, seq=0):
+        self.device_id = device_id
+        self.ts_us = ts_us  # 采集时间（有追踪信息时为UART读取时间，否则为接收时间）
+        self.seq = seq  # 在所属请求/数据报/批次中的位置，同一请求中的多帧共用接收时间，(设备, ts_us, seq) 唯一标识一条记录
+        self.ready = ready
+        self.attention = attention
+        self.meditation = meditation
+        self.signal = signal  # 信号质量，-1 表示上行数据中没有
+        self.bands = bands  # 8个频段功率列表，上行数据中没有时为None
+        if legacy is None:
+            legacy = _legacy_from_bands(bands) if ready and bands is not None else (0, 0, 0)
+        self.legacy = legacy  # 固件 latest_eeg_data 中的 (Alpha, Beta, Gamma)
+
+    @classmethod
+    def from_frame(cls, frame, device_id, ts_us, seq=0):
+        vals = frame_values(frame)
+        ready = 0 if vals[9] == 0 and vals[10] == 0 else 1
+        legacy = (min(frame[17], 100), min(frame[23], 100), min(frame[29], 100)) if ready else (0, 0, 0)
+        return cls(device_id, ts_us, ready, vals[9], vals[10], vals[0], vals[1:9], legacy, seq)
+
+    @classmethod
+    def from_values(cls, vals, device_id, ts_us, seq=0):
+        """由批量编码解码出的11个数值构造"""
+        ready = 0 if vals[9] == 0 and vals[10] == 0 else 1
+        return cls(device_id, ts_us, ready, int(vals[9]), int(vals[10]), int(vals[0]), [int(v) for v in vals[1:9]],
+                   seq=seq)
+
+    @classmethod
+    def from_json(cls, obj, device_id, ts_us, seq=0):
+        """由 broadcast_udp_json 或聚合记录构造；聚合记录取各频段平均值"""
+        bands = None
+        agg = obj.get("agg")
+        if agg:
+            bands = [agg[b][1] for b in EEG_BANDS]
+        return cls(device_id, ts_us, int(obj.get("dataReady", 0)), int(obj.get("Attention", 0)),
+                   int(obj.get("Meditation", 0)), -1, bands,
+                   (int(obj.get("Alpha", 0)), int(obj.get("Beta", 0)), int(obj.get("Gamma", 0))), seq)
+
+    def to_dict(self):
+        d = {"id": self.device_id, "ts": self.ts_us, "dataReady": self.ready,
+             "Attention": self.attention, "Meditation": self.meditation}
+        if self.signal >= 0:
+            d["Signal"] = self.signal
+        if self.bands is not None:
+            for name, value in zip(EEG_BANDS, self.bands):
+                d[name] = value
+        return d
+
+class Ingest:
+    """接收端公共入口：解析各种上行格式、记录延迟，并把EEGRecord分发给注册的消费者"""
+
+    def __init__(self):
+        self.sinks = []
+        self.latency = LatencyTracker()
+        self.counts = {"udp_json": 0, "udp_hub": 0, "http_frame": 0, "http_agg": 0, "mqtt": 0}
+        self.records = 0
+        self.errors = 0
+
+    def add_sink(self, sink):
+        """注册消费者，sink(record) 在事件循环线程中被调用，不应阻塞"""
+        self.sinks.append(sink)
+
+    def emit(self, record):
+        self.records += 1
+        for sink in self.sinks:
+            sink(record)
+
+    def _trace(self, device_id, tr, recv_us):
+        """tr = [uart, parse, send]，服务器时钟微秒"""
+        if tr and len(tr) >= 3:
+            self.latency.record(device_id, int(tr[0]), int(tr[1]), int(tr[2]), recv_us)
+            return int(tr[0])
+        return recv_us
+
+    def handle_datagram(self, data, addr, recv_us):
+        if data[:2] == HUB_MAGIC:
+            try:
+                self._handle_hub(data, recv_us)
+            except (ValueError, KeyError, IndexError, struct.error):  # 截断的集线器数据报
+                self.errors += 1
+        elif data[:1] == b'{':
+            # 突发上行模式下一个数据报包含多条以换行分隔的记录，逐条处理，一条出错不影响其余记录
+            for seq, line in enumerate(data.split(b'\n')):
+                if not line.strip():
+                    continue
+                try:
+                    self._handle_json(json.loads(line), addr, recv_us, seq)
+                except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                    self.errors += 1
+        else:
+            self.errors += 1
+
+    def _handle_json(self, obj, addr, recv_us, seq=0):
+        device_id = obj.get("id") or addr[0]
+        if "age" in obj and "tr" not in obj:
+            recv_us -= int(obj["age"]) * 1000  # 设备缓存的毫秒数
+        ts_us = self._trace(device_id, obj.get("tr"), recv_us)
+        self.counts["udp_json"] += 1
+        self.emit(EEGRecord.from_json(obj, device_id, ts_us, seq))
+
+    def _handle_hub(self, data, recv_us):
+        chip_id, sections = decode_hub_packet(data)
+        self.counts["udp_hub"] += 1
+        for ch, ts, vals in sections:
+            self._emit_batch(f"{chip_id}-{ch}", ts, vals, recv_us)
+
+    def _emit_batch(self, device_id, ts, vals, recv_us):
+        # 批次内时间戳为设备毫秒计数，以最后一帧对齐到接收时间
+        last = int(ts[-1]) if ts is not None and len(ts) else 0
+        for k in range(len(vals)):
+            ts_us = recv_us - ((last - int(ts[k])) & 0xFFFFFFFF) * 1000 if ts is not None else recv_us
+            self.emit(EEGRecord.from_values(vals[k], device_id, ts_us, k))
+
+    def handle_batch(self, device_id, data, recv_us):
+        """处理一个批量紧凑编码批次（MQTT消息负载）"""
+        try:
+            ts, vals = decode_batch(data)
+        except (ValueError, IndexError, struct.error):
+            self.errors += 1
+            return
+        self.counts["mqtt"] += 1
+        self._emit_batch(device_id, ts, vals, recv_us)
+
+    def handle_upload(self, device_id, body, headers, recv_us):
+        """处理 POST /api/device/eeg/<id>：一个或多个连续的36字节帧"""
+        tr = None
+        if "x-trace" in headers:
+            parts = headers["x-trace"].split(",")
+            tr = parts[1:4]
+        ts_us = self._trace(device_id, tr, recv_us)
+        n = 0
+        for off in range(0, len(body) - FRAME_LEN + 1, FRAME_LEN):
+            frame = body[off:off + FRAME_LEN]
+            if parse_frame(frame):
+                self.emit(EEGRecord.from_frame(frame, device_id, ts_us, off // FRAME_LEN))
+                n += 1
+        self.counts["http_frame"] += n
+        return n
+
+    def handle_agg(self, device_id, body, recv_us):
+        """处理 POST /api/device/eeg/<id>/agg：聚合后的JSON记录"""
+        obj = json.loads(body)
+        ts_us = self._trace(device_id, obj.get("tr"), recv_us)
+        self.counts["http_agg"] += 1
+        self.emit(EEGRecord.from_json(obj, obj.get("id") or device_id, ts_us))
+
+class UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def datagram_received(self, data, addr):
+        self.ingest.handle_datagram(data, addr, now_us())
+
+class SyncProtocol(asyncio.DatagramProtocol):
+    """时钟同步应答：回送设备时间t0以及服务器收到(t1)和发出(t2)的时间"""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        t1 = now_us()
+        if len(data) != _SYNC_REQ.size or data[:4] != SYNC_MAGIC:
+            return
+        _, t0 = _SYNC_REQ.unpack(data)
+        self.transport.sendto(_SYNC_RESP.pack(SYNC_MAGIC, t0, t1, now_us()), addr)
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body", "reader", "writer")
+
+    def __init__(self, method, target, headers, body, reader=None, writer=None):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+        self.reader = reader  # 接管连接的处理函数（推送流、WebSocket）直接使用
+        self.writer = writer
+
+def json_response(obj, status=200, headers=None):
+    return status, "application/json", json.dumps(obj, ensure_ascii=False).encode('utf-8'), headers
+
+_REASONS = {200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 416: "Range Not Satisfiable", 500: "Internal Server Error"}
+
+class HttpServer:
+    """HTTP/1.1 keep-alive 服务器；处理函数返回 (状态码, 类型, 内容, 附加头) 或 None（表示已接管连接）"""
+
+    def __init__(self, ingest):
+        self.ingest = ingest
+        self.routes = []  # (方法, 路径, 是否前缀匹配, 处理函数)
+        self.route("POST", UPLOAD_PREFIX, self._upload, prefix=True)
+        self.route("GET", "/latency", lambda req: json_response(self.ingest.latency.summary(req.query.get("id"))))
+        self.route("GET", "/stats", lambda req: json_response(
+            {"records": self.ingest.records, "errors": self.ingest.errors, "counts": self.ingest.counts}))
+
+    def route(self, method, path, handler, prefix=False):
+        self.routes.append((method, path, prefix, handler))
+
+    def _upload(self, req):
+        rest = req.path[len(UPLOAD_PREFIX):]
+        recv_us = now_us()
+        if rest.endswith("/agg"):
+            self.ingest.handle_agg(rest[:-4], req.body, recv_us)
+        else:
+            self.ingest.handle_upload(rest, req.body, req.headers, recv_us)
+        return 200, "text/plain", b"ok", None
+
+    def _find(self, method, path):
+        allowed = False
+        for m, p, prefix, handler in self.routes:
+            if path == p or (prefix and path.startswith(p)):
+                if m == method:
+                    return handler, True
+                allowed = True
+        return None, allowed
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, _ = line.decode('latin-1').split(" ", 2)
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode('latin-1').partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                body = await reader.readexactly(length) if length else b""
+                req = Request(method, target, headers, body, reader, writer)
+                handler, allowed = self._find(method, req.path)
+                if handler is None:
+                    resp = (405, "text/plain", b"405 - Method Not Allowed", None) if allowed else \
+                        (404, "text/plain", b"404 - Not Found", None)
+                else:
+                    try:
+                        resp = handler(req)
+                        if asyncio.iscoroutine(resp):
+                            resp = await resp
+                    except Exception as e:
+                        self.ingest.errors += 1
+                        resp = (500, "text/plain", str(e).encode('utf-8'), None)
+                if resp is None:
+                    return  # 处理函数已接管连接（例如推送流）
+                self.write_response(writer, *resp)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def write_response(writer, status, ctype, body, extra=None):
+        head = f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\n"
+        if extra:
+            head += "".join(f"{k}: {v}\r\n" for k, v in extra.items())
+        writer.write(head.encode('latin-1') + b"\r\n" + body)
+
+async def start(ingest, host="0.0.0.0", port=9003, sync_port=9005, http=None):
+    """启动UDP、HTTP和时钟同步服务，返回HttpServer以便注册更多接口"""
+    loop = asyncio.get_running_loop()
+    await loop.create_datagram_endpoint(lambda: UdpProtocol(ingest), local_addr=(host, port))
+    if sync_port:
+        await loop.create_datagram_endpoint(SyncProtocol, local_addr=(host, sync_port))
+    http = http or HttpServer(ingest)
+    await asyncio.start_server(http.handle, host, port)
+    return http
+
+async def report_loop(ingest, interval):
+    last = ingest.records
+    while True:
+        await asyncio.sleep(interval)
+        rate = (ingest.records - last) / interval
+        last = ingest.records
+        print(f"[{time.strftime('%H:%M:%S')}] 记录 {ingest.records} 条 ({rate:.1f}/秒), 错误 {ingest.errors}, 来源 {ingest.counts}")
+        if ingest.latency.devices:
+            print(ingest.latency.report())
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="EEG数据接收端")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9003, help="UDP和HTTP端口")
+    parser.add_argument("--sync-port", type=int, default=9005, help="时钟同步UDP端口，0表示关闭")
+    parser.add_argument("--discovery-port", type=int, default=9006, help="应答设备发现查询的UDP端口，0表示关闭")
+    parser.add_argument("--discovery-iface", default="0.0.0.0", help="加入发现组播组的接口地址")
+    parser.add_argument("--report", type=float, default=10, help="统计报告间隔（秒）")
+    parser.add_argument("--db", help="SQLite数据库文件，指定后持久化全部记录")
+    parser.add_argument("--db-batch", type=int, default=5000, help="每个事务最多写入的记录数")
+    parser.add_argument("--colstore", help="列式存储根目录，指定后按设备/天追加全部记录")
+    parser.add_argument("--rollup", action="store_true", help="增量维护1秒/10秒/1分钟/1小时聚合，提供 /rollup 查询")
+    parser.add_argument("--fanout", action="store_true", help="实时推送：GET /live（SSE）和 GET /ws（WebSocket）")
+    parser.add_argument("--fanout-queue", type=int, default=256, help="每个订阅者的队列长度，满时丢弃最旧的消息")
+    parser.add_argument("--ota", metavar="ROOT", help="仓库根目录，指定后提供设备OTA更新接口 /ota/*")
+    parser.add_argument("--mqtt", metavar="HOST:PORT", help="MQTT代理地址，指定后订阅 eeg/+ 接收设备的批量上行")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数，大于1时以SO_REUSEPORT多进程分片接收")
+    return parser
+
+async def amain(args):
+    ingest = Ingest()
+    http = await start(ingest, args.host, args.port, args.sync_port)
+    from latest import LatestCache, add_routes as add_latest_routes
+    latest = LatestCache()
+    ingest.add_sink(latest.sink)
+    add_latest_routes(http, latest)
+    if args.discovery_port:
+        from discovery import start_announcer
+        try:
+            await start_announcer(args.port, args.sync_port, args.discovery_port, iface=args.discovery_iface)
+        except OSError as e:
+            print(f"设备发现应答未启动（{e}），设备将继续广播")
+    if args.ota:
+        from ota_server import OtaRepo, add_routes as add_ota_routes
+        add_ota_routes(http, OtaRepo(args.ota))
+    mqtt = None
+    if args.mqtt:
+        from mqtt_broker import MqttSource
+        host, _, port = args.mqtt.partition(":")
+        mqtt = MqttSource(ingest, host, int(port or 1883))
+        mqtt.start()
+    storage = None
+    if args.db:
+        from storage import Storage, add_routes as add_storage_routes
+        storage = Storage(args.db, batch=args.db_batch).start()
+        ingest.add_sink(storage.sink)
+        add_storage_routes(http, storage)
+    colstore = None
+    if args.colstore:
+        from colstore import ColumnStore, add_routes as add_colstore_routes
+        colstore = ColumnStore(args.colstore).start()
+        ingest.add_sink(colstore.sink)
+        add_colstore_routes(http, colstore)
+    if args.rollup:
+        from rollup import RollupEngine, add_routes as add_rollup_routes
+        rollup = RollupEngine()
+        ingest.add_sink(rollup.sink)
+        add_rollup_routes(http, rollup)
+    if args.fanout:
+        from fanout import FanoutHub, add_routes as add_fanout_routes
+        hub = FanoutHub(args.fanout_queue)
+        ingest.add_sink(hub.sink)
+        add_fanout_routes(http, hub)
+    print(f"接收端已启动: UDP/HTTP {args.host}:{args.port}, 时钟同步 UDP {args.sync_port}" +
+          (f", 数据库 {args.db}" if storage else "") + (f", 列式存储 {args.colstore}" if colstore else ""))
+    try:
+        await report_loop(ingest, args.report)
+    finally:
+        if mqtt:
+            mqtt.close()
+        if storage:
+            storage.close()
+        if colstore:
+            colstore.close()
+
+def main():
+    args = build_parser().parse_args()
+    if args.workers > 1:
+        from shard import run
+        run(args)
+        return
+    try:
+        asyncio.run(amain(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""未对齐串口数据的向量化重同步解析：在任意字节流中找出全部有效的ThinkGear包及其字节偏移
+
+ThinkGear包格式: AA AA PLENGTH(0~169) 负载[PLENGTH] 校验和（~sum(负载) & 0xFF）
+固件按 buffer.find 逐个查找同步字节，Python实现每秒只能处理几MB；这里对整块数据一次完成:
+  1. 相邻两个字节都是 0xAA 的位置作为候选（AA AA AA 中第二个候选的长度字节为0xAA，自然被排除）
+  2. 按字节步长的uint64视图一次取出各候选的前8字节（AA AA PLENGTH 负载...），丢弃 PLENGTH >= 170 和超出数据末尾的候选
+  3. 原始波形包（PLENGTH=4，占绝大多数）的负载和校验和都在这8字节中，按列uint8相加后比较；
+     其余候选的负载按8字节一组掩码后按字节累加
+  4. 有效包相互重叠时（负载中偶然出现校验正确的 AA AA），与逐字节查找相同，保留先出现的包，只对重叠的少数候选逐个处理
+输入按块处理（默认64MB，每块多读173字节使跨块的包完整），文件用内存映射读取，可处理远大于内存的抓包；
+.tgcap 抓包文件的各条记录依次复制到同一块缓冲区中解析，不拼接整个文件。
+
+用法:
+  python resync.py scan dump.bin [--out packets.npz] [--chunk-mb 64]    # 原始二进制，.tgcap抓包文件自动识别
+  python resync.py scan dump.txt --hex                                  # UART/uart.py 打印的十六进制文本
+  python resync.py bench [--mb 256] [--verify-mb 4]                     # 合成数据: 吞吐量并与逐字节查找核对
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from tgam import build_frame, synth_frames
+
+SYNC = 0xAA
+MAX_PLENGTH = 169
+MAX_PACKET = 4 + MAX_PLENGTH
+CHUNK = 64 << 20
+BIG_PLENGTH = 0x20  # 36字节频段功率包
+RAW_PLENGTH = 0x04  # 原始波形包: 80 02 高字节 低字节
+
+class ScanResult:
+    """解析结果：各类包的字节偏移和数值，以及拒绝原因的计数"""
+
+    def __init__(self):
+        self.offsets = []  # 全部有效包的起始偏移
+        self.plengths = []
+        self.frame_offsets = []
+        self.frames = []  # (n, 11)：信号质量、8个频段功率、专注度、放松度，与 tgam.frame_values 相同
+        self.raw_offsets = []
+        self.raw = []  # int16 原始波形采样
+        self.stats = {"bytes": 0, "candidates": 0, "bad_length": 0, "truncated": 0, "bad_checksum": 0,
+                      "overlapped": 0, "packets": 0, "frames": 0, "raw": 0, "other": 0, "garbage_bytes": 0}
+        self.other_codes = {}  # 其他包的第一个数据码 -> 数量
+
+    def finish(self):
+        for name, dtype, shape in (("offsets", np.int64, ()), ("plengths", np.uint8, ()),
+                                   ("frame_offsets", np.int64, ()), ("frames", np.int32, (11,)),
+                                   ("raw_offsets", np.int64, ()), ("raw", np.int16, ())):
+            parts = getattr(self, name)
+            setattr(self, name, np.concatenate(parts) if parts else np.zeros((0,) + shape, dtype))
+        s = self.stats
+        s["packets"] = len(self.offsets)
+        s["frames"] = len(self.frame_offsets)
+        s["raw"] = len(self.raw_offsets)
+        s["other"] = s["packets"] - s["frames"] - s["raw"]
+        s["garbage_bytes"] = s["bytes"] - int(self.plengths.sum(dtype=np.int64)) - 4 * s["packets"]
+        return self
+
+    def save(self, path, **extra):
+        np.savez(path, offsets=self.offsets, plengths=self.plengths, frame_offsets=self.frame_offsets,
+                 frames=self.frames, raw_offsets=self.raw_offsets, raw=self.raw, **extra)
+
+def _without(x, drop):
+    """去掉少数几个位置的元素：按段复制，比布尔掩码快"""
+    parts = [x[:drop[0]]]
+    for i, j in zip(drop, drop[1:] + [len(x)]):
+        parts.append(x[i + 1:j])
+    return np.concatenate(parts)
+
+def _greedy(s, plen):
+    """重叠的有效包中按起始位置保留先出现的，返回要去掉的位置列表；只对与前一个候选重叠的少数位置逐个处理"""
+    drop = []
+    n = len(s)
+    done = 0
+    for i in (np.flatnonzero(np.diff(s) < plen[:-1] + 4) + 1).tolist():
+        if i < done:
+            continue
+        # i-1 不与更早的候选重叠，一定被保留；向后处理直到不再与本组任何候选重叠
+        last_end = run_end = int(s[i - 1]) + 4 + int(plen[i - 1])
+        j = i
+        while j < n and s[j] < run_end:
+            end = int(s[j]) + 4 + int(plen[j])
+            run_end = max(run_end, end)
+            if s[j] < last_end:
+                drop.append(j)
+            else:
+                last_end = end
+            j += 1
+        done = j
+    return drop
+
+_LANES = np.uint64(0x00FF00FF00FF00FF)
+_KEEP = np.array([(1 << (8 * k)) - 1 for k in range(9)], dtype=np.uint64)  # 保留低k个字节的掩码
+_U8, _U16, _U32 = np.uint64(8), np.uint64(16), np.uint64(32)
+
+def _byte_sum(x):
+    """uint64数组中每个元素8个字节之和（结果的低8位有效）"""
+    y = (x & _LANES) + ((x >> _U8) & _LANES)
+    y += y >> _U16
+    y += y >> _U32
+    return y
+
+def _unaligned(buf, dtype, n):
+    """从buf每个字节偏移开始的多字节整数视图（步长1字节），一次索引取出任意偏移处的8个字节"""
+    return np.ndarray((n,), dtype=dtype, buffer=buf, strides=(1,))
+
+def _long_checksum_ok(buf, w64, s, plen):
+    """负载不是4字节的候选（频段功率包和垃圾中的候选，数量很少）：负载按8字节一组累加后与校验和比较"""
+    acc = np.zeros(len(s), dtype=np.uint64)
+    sel = np.arange(len(s))
+    for off in range(0, MAX_PLENGTH, 8):
+        sel = sel[plen[sel] > off]
+        if not len(sel):
+            break
+        acc[sel] += _byte_sum(w64[s[sel] + 3 + off] & _KEEP[np.minimum(plen[sel] - off, 8)])
+    return (acc.astype(np.uint8) ^ 0xFF) == buf[s + 3 + plen]
+
+def scan(data, chunk=CHUNK, result=None):
+    """data 为一维uint8数组（可以是 np.memmap）或bytes，返回 ScanResult"""
+    if not isinstance(data, np.ndarray):
+        data = np.frombuffer(data, dtype=np.uint8)
+    r = result or ScanResult()
+    n = len(data)
+    last_end = 0  # 上一个有效包的结束偏移，之前开始的候选被它覆盖
+    # 每块复制到固定缓冲区，末尾多留8字节，按8字节整字读取时不越界（超出负载的字节都会被掩码去掉）
+    buf = np.zeros(min(chunk, n) + MAX_PACKET + 8, dtype=np.uint8)
+    w64 = _unaligned(buf, '<u8', len(buf) - 7)
+    for base in range(0, n, chunk):
+        limit = min(chunk, n - base)  # 本块负责起始位置在 [base, base+limit) 的候选
+        m = min(limit + MAX_PACKET, n - base)
+        buf[:m] = data[base:base + m]
+        last_end = _scan_chunk(buf, w64, m, limit, base, last_end, r)
+    return r.finish() if result is None else r
+
+def scan_blocks(blocks, chunk=CHUNK, result=None):
+    """按顺序解析任意大小的数据块（例如 .tgcap 的各条记录），内存占用只有一块；blocks 产生 (任意标记, 数据)，
+    返回 (ScanResult, 每个频段功率帧校验和字节所在数据块的标记数组)"""
+    r = result or ScanResult()
+    buf = np.zeros(chunk + MAX_PACKET + 8, dtype=np.uint8)
+    w64 = _unaligned(buf, '<u8', len(buf) - 7)
+    fill = 0
+    base = 0
+    last_end = 0
+    starts, tags = [], []  # 缓冲区中各数据块的起始偏移和标记（加上开始于缓冲区之前的最后一块）
+    frame_tags = []
+
+    def flush(limit, m):
+        nframes = len(r.frame_offsets)
+        end = _scan_chunk(buf, w64, m, limit, base, last_end, r)
+        if len(r.frame_offsets) > nframes:
+            fo = np.concatenate(r.frame_offsets[nframes:])
+            frame_tags.append(np.asarray(tags)[np.searchsorted(starts, fo + 35, side="right") - 1])
+        return end
+
+    for tag, data in blocks:
+        data = np.frombuffer(data, dtype=np.uint8)
+        starts.append(base + fill)
+        tags.append(tag)
+        pos = 0
+        while pos < len(data):
+            k = min(len(data) - pos, chunk + MAX_PACKET - fill)
+            buf[fill:fill + k] = data[pos:pos + k]
+            fill += k
+            pos += k
+            if fill == chunk + MAX_PACKET:
+                last_end = flush(chunk, fill)
+                # 最后 MAX_PACKET 字节移到开头，作为下一块的前部
+                buf[:MAX_PACKET] = buf[chunk:fill]
+                base += chunk
+                fill = MAX_PACKET
+                i = np.searchsorted(starts, base, side="right") - 1
+                del starts[:i], tags[:i]
+    if fill:
+        last_end = flush(fill, fill)
+    if result is None:
+        r.finish()
+    times = np.concatenate(frame_tags) if frame_tags else np.zeros(0, np.int64)
+    return r, times
+
+def _scan_chunk(buf, w64, m, limit, base, last_end, r):
+    """解析 buf[:m]（数据偏移 base 开始）中起始位置在 [0, limit) 的候选，返回最后一个有效包的结束偏移"""
+    st = r.stats
+    st["bytes"] += limit
+    buf[m:m + 8] = 0  # 数据末尾的 AA AA 读到的长度为0，计为截断
+    k = min(limit, m - 1)
+    pair = buf[:k + 1] == SYNC
+    pair[:k] &= pair[1:]
+    s = np.flatnonzero(pair[:k])
+    st["candidates"] += len(s)
+    s = s[np.searchsorted(s, last_end - base):]  # 被上一块最后一个包覆盖的候选
+    # 每个候选的前8字节 AA AA PLENGTH 负载...，按列取各字节（跨步视图，不复制）；原始波形包整个在这8字节中
+    w = w64[s]
+    b = w.view(np.uint8).reshape(-1, 8)
+    plen = b[:, 2]
+    valid = plen <= MAX_PLENGTH
+    st["bad_length"] += len(s) - int(valid.sum())
+    # 只有块末尾的候选可能越过数据末尾
+    tail = np.searchsorted(s, m - 4 - MAX_PLENGTH)
+    short = valid[tail:] & (s[tail:] + 3 + plen[tail:] >= m)
+    st["truncated"] += int(short.sum())
+    valid[tail:] &= ~short
+    p4 = plen == 4
+    ok = valid & p4 & ((b[:, 3] + b[:, 4] + b[:, 5] + b[:, 6]) ^ 0xFF == b[:, 7])  # uint8相加自然按256取模
+    other = np.flatnonzero(valid & ~p4)
+    if len(other):
+        ok[other] = _long_checksum_ok(buf, w64, s[other], plen[other].astype(np.int64))
+    st["bad_checksum"] += int(valid.sum()) - int(ok.sum())
+    s, w = s[ok], w[ok]
+    if not len(s):
+        return last_end
+    plen = w.view(np.uint8).reshape(-1, 8)[:, 2].copy()
+    drop = _greedy(s, plen)
+    if len(drop):
+        st["overlapped"] += len(drop)
+        s, w, plen = (_without(x, drop) for x in (s, w, plen))
+    r.offsets.append(s + base)
+    r.plengths.append(plen)
+    _classify(buf, s, plen, w, base, r)
+    return base + int(s[-1]) + 4 + int(plen[-1])
+
+def _classify(a, s, plen, w, base, r):
+    """按包类型提取数值：36字节频段功率包、原始波形包，其余按第一个数据码计数；w 为各包的前8字节"""
+    b = w.view(np.uint8).reshape(-1, 8)
+    big = plen == BIG_PLENGTH
+    fb = s[big]
+    if len(fb):
+        f = a[fb[:, None] + np.arange(36)]
+        valid = (f[:, 3] == 0x02) & (f[:, 5] == 0x83) & (f[:, 6] == 0x18) & (f[:, 31] == 0x04) & (f[:, 33] == 0x05)
+        big[big] = valid
+        f = f[valid].astype(np.int32)
+        vals = np.empty((len(f), 11), dtype=np.int32)
+        vals[:, 0] = f[:, 4]
+        j = 7 + 3 * np.arange(8)
+        vals[:, 1:9] = (f[:, j] << 16) | (f[:, j + 1] << 8) | f[:, j + 2]
+        vals[:, 9] = f[:, 32]
+        vals[:, 10] = f[:, 34]
+        r.frame_offsets.append(fb[valid] + base)
+        r.frames.append(vals)
+    raw = (plen == RAW_PLENGTH) & (b[:, 3] == 0x80) & (b[:, 4] == 0x02)
+    if raw.any():
+        rb = w[raw].view(np.uint8).reshape(-1, 8)  # 先按uint64压缩再取列，比按行布尔索引二维数组快得多
+        r.raw_offsets.append(s[raw] + base)
+        r.raw.append(((rb[:, 5].astype(np.uint16) << 8) | rb[:, 6]).view(np.int16))
+    other = ~(big | raw) & (plen > 0)
+    if other.any():
+        codes, counts = np.unique(b[other, 3], return_counts=True)
+        for code, cnt in zip(codes.tolist(), counts.tolist()):
+            r.other_codes[code] = r.other_codes.get(code, 0) + cnt
+
+def scan_py(buf):
+    """逐字节查找的参考实现（与固件同步方式相同并增加校验和），返回 [(偏移, PLENGTH)]，用于核对"""
+    out = []
+    pos = 0
+    n = len(buf)
+    while True:
+        i = buf.find(b'\xAA\xAA', pos)
+        if i < 0 or i + 2 >= n:
+            return out
+        plen = buf[i + 2]
+        if plen > MAX_PLENGTH or i + 3 + plen >= n or (~sum(buf[i + 3:i + 3 + plen])) & 0xFF != buf[i + 3 + plen]:
+            pos = i + 1
+            continue
+        out.append((i, plen))
+        pos = i + 4 + plen
+
+def load(path, hex_text=False):
+    """返回 uint8数组（原始二进制用内存映射），.tgcap 抓包文件返回 CaptureReader，由 scan_blocks 逐条记录解析"""
+    if hex_text:
+        with open(path, 'rb') as f:
+            tokens = re.findall(rb'(?<![0-9A-Fa-f])[0-9A-Fa-f]{2}(?![0-9A-Fa-f])', f.read())
+        return np.frombuffer(bytes.fromhex(b''.join(tokens).decode()), dtype=np.uint8)
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic == b'TGCP':
+        from capture import CaptureReader
+        return CaptureReader(path)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r')
+
+def cmd_scan(args):
+    data = load(args.file, args.hex)
+    extra = {}
+    t0 = time.perf_counter()
+    if isinstance(data, np.ndarray):
+        r = scan(data, args.chunk_mb << 20)
+    else:
+        # 抓包文件：帧的时间取其校验和字节所在记录的接收时间
+        r, extra["frame_times_us"] = scan_blocks(data.records(), args.chunk_mb << 20)
+        data.close()
+    dt = time.perf_counter() - t0
+    for k, v in r.stats.items():
+        print(f"{k}: {v}")
+    if r.other_codes:
+        print("other: " + ", ".join(f"0x{c:02X}={n}" for c, n in sorted(r.other_codes.items())))
+    print(f"耗时 {dt:.3f} 秒, {r.stats['bytes'] / dt / 1e6:.0f} MB/s")
+    if args.out:
+        r.save(args.out, **extra)
+        print(f"已保存 {args.out}")
+
+def synth_stream(nbytes, seed=1):
+    """合成未对齐的串口数据：每帧前有若干原始波形包，夹杂垃圾字节、截断的包、其他类型的包和含 AA AA 的噪声"""
+    rng = random.Random(seed)
+    frames = list(synth_frames(64, seed=seed))
+    out = bytearray(rng.randbytes(rng.randint(0, 40)))
+    k = 0
+    while len(out) < nbytes:
+        for _ in range(rng.randint(20, 60)):
+            v = rng.randint(-2048, 2047) & 0xFFFF
+            p = bytes((0x80, 0x02, v >> 8, v & 0xFF))
+            out += b'\xAA\xAA\x04' + p + bytes((~sum(p) & 0xFF,))
+        out += frames[k % len(frames)]
+        k += 1
+        x = rng.random()
+        if x < 0.05:
+            out += rng.randbytes(rng.randint(1, 200))  # 垃圾
+        elif x < 0.08:
+            out += build_frame([0] + [rng.randint(0, 1 << 20) for _ in range(8)] + [50, 50])[:rng.randint(3, 35)]  # 截断
+        elif x < 0.10:
+            out += b'\xAA\xAA\xAA\xAA' + bytes((rng.randint(0, 255),)) * 3  # 连续同步字节
+        elif x < 0.12:
+            p = bytes((0x16, rng.randint(0, 255)))  # 其他类型（眨眼强度）
+            out += b'\xAA\xAA\x02' + p + bytes((~sum(p) & 0xFF,))
+    return bytes(out[:nbytes])
+
+def cmd_bench(args):
+    block = synth_stream(min(args.mb, 8) << 20)
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "bench.bin")
+        with open(path, "wb") as f:
+            for _ in range(max(args.mb // 8, 1)):
+                f.write(block)
+        size = os.path.getsize(path)
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        t0 = time.perf_counter()
+        r = scan(data, args.chunk_mb << 20)
+        dt = time.perf_counter() - t0
+        print(f"向量化: {size / 1e6:.0f} MB, {dt:.2f} 秒, {size / dt / 1e6:.0f} MB/s; {r.stats}")
+        del data
+    ref = block[:args.verify_mb << 20]
+    t0 = time.perf_counter()
+    expect = scan_py(ref)
+    dt = time.perf_counter() - t0
+    got = scan(ref, chunk=1 << 20)  # 小块，同时检查跨块的包
+    same = list(zip(got.offsets.tolist(), got.plengths.tolist())) == expect
+    print(f"逐字节查找: {len(ref) / 1e6:.0f} MB, {dt:.2f} 秒, {len(ref) / dt / 1e6:.1f} MB/s; "
+          f"{len(expect)} 个包, 与向量化结果{'一致' if same else '不一致'}")
+    if not same:
+        raise SystemExit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="未对齐串口数据的向量化重同步解析")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("scan", help="解析文件")
+    p.add_argument("file")
+    p.add_argument("--hex", action="store_true", help="输入为十六进制文本")
+    p.add_argument("--out", help="保存偏移和数值的 .npz 文件")
+    p.set_defaults(func=cmd_scan)
+    p2 = sub.add_parser("bench", help="合成数据吞吐量测试")
+    p2.add_argument("--mb", type=int, default=256)
+    p2.add_argument("--verify-mb", type=int, default=4, help="与逐字节查找核对的数据量")
+    p2.set_defaults(func=cmd_bench)
+    for q in (p, p2):
+        q.add_argument("--chunk-mb", type=int, default=CHUNK >> 20)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""多分辨率预聚合：每台设备按1秒、10秒、1分钟、1小时维护各通道的最小值/平均值/最大值，长时间范围查询只读粗粒度桶
+
+用法:
+  python receiver.py --rollup             # 接收端增量聚合，提供 GET /rollup?id=&from=&to=&points=&ch=
+  python rollup.py bench [--devices 10] [--hours 24]
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from tgam import EEG_BANDS
+
+CHANNELS = ["Attention", "Meditation"] + EEG_BANDS
+_C = len(CHANNELS)
+_INF = float("inf")
+
+# (分辨率秒, 保留桶数，None表示不限)
+LEVELS = ((1, 86400), (10, 7 * 8640), (60, 90 * 1440), (3600, None))
+
+class Bucket:
+    """一个未结束的聚合桶；零帧（未佩戴）只计数，不参与各通道统计"""
+
+    __slots__ = ("start", "n", "sum", "min", "max", "zero")
+
+    def __init__(self, start):
+        self.start = start
+        self.n = [0] * _C
+        self.sum = [0.0] * _C
+        self.min = [_INF] * _C
+        self.max = [-_INF] * _C
+        self.zero = 0
+
+    def add(self, values):
+        n, s, lo, hi = self.n, self.sum, self.min, self.max
+        for i, v in enumerate(values):
+            if v is None:
+                continue
+            n[i] += 1
+            s[i] += v
+            if v < lo[i]:
+                lo[i] = v
+            if v > hi[i]:
+                hi[i] = v
+
+    def merge(self, other):
+        for i in range(_C):
+            if other.n[i]:
+                self.n[i] += other.n[i]
+                self.sum[i] += other.sum[i]
+                if other.min[i] < self.min[i]:
+                    self.min[i] = other.min[i]
+                if other.max[i] > self.max[i]:
+                    self.max[i] = other.max[i]
+        self.zero += other.zero
+
+class Series:
+    """一个分辨率下已结束的桶，按时间顺序存放在可增长的NumPy数组中，超出保留数量时丢弃最旧的一半"""
+
+    def __init__(self, retention, capacity=64):
+        self.retention = retention
+        self.size = 0
+        self.ts = np.zeros(capacity, np.int64)
+        self.n = np.zeros((capacity, _C), np.int32)
+        self.sum = np.zeros((capacity, _C))
+        self.min = np.zeros((capacity, _C))
+        self.max = np.zeros((capacity, _C))
+        self.zero = np.zeros(capacity, np.int32)
+
+    def _arrays(self):
+        return ("ts", "n", "sum", "min", "max", "zero")
+
+    def append(self, b):
+        if self.size == len(self.ts):
+            if self.retention and self.size >= 2 * self.retention:
+                keep = self.retention
+                for name in self._arrays():
+                    a = getattr(self, name)
+                    a[:keep] = a[self.size - keep:self.size]
+                self.size = keep
+            else:
+                for name in self._arrays():
+                    a = getattr(self, name)
+                    grown = np.zeros((len(a) * 2,) + a.shape[1:], a.dtype)
+                    grown[:self.size] = a[:self.size]
+                    setattr(self, name, grown)
+        i = self.size
+        self.ts[i] = b.start
+        self.n[i] = b.n
+        self.sum[i] = b.sum
+        self.min[i] = b.min
+        self.max[i] = b.max
+        self.zero[i] = b.zero
+        self.size = i + 1
+
+    def oldest(self):
+        return int(self.ts[0]) if self.size else None
+
+class DeviceRollup:
+    """一台设备的全部分辨率；只有1秒桶逐帧更新，结束的桶逐级并入上一级"""
+
+    def __init__(self, levels):
+        self.res = [r * 1000000 for r, _ in levels]
+        self.series = [Series(keep) for _, keep in levels]
+        self.open = [None] * len(levels)
+        self.last_us = 0
+
+    def add(self, ts_us, values, ready):
+        """加入一帧，values为各通道数值（缺失为None）；早于当前1秒桶的迟到帧返回False"""
+        start = ts_us - ts_us % self.res[0]
+        b = self.open[0]
+        if b is None:
+            b = self.open[0] = Bucket(start)
+        elif start > b.start:
+            self._fold(0)
+            b = self.open[0] = Bucket(start)
+        elif start < b.start:
+            return False
+        if ready:
+            b.add(values)
+        else:
+            b.zero += 1
+        self.last_us = ts_us
+        return True
+
+    def _fold(self, level):
+        """结束level级的当前桶：存入该级序列并合并到上一级的当前桶"""
+        b = self.open[level]
+        self.series[level].append(b)
+        up = level + 1
+        if up == len(self.res):
+            return
+        start = b.start - b.start % self.res[up]
+        parent = self.open[up]
+        if parent is None:
+            parent = self.open[up] = Bucket(start)
+        elif start > parent.start:
+            self._fold(up)
+            parent = self.open[up] = Bucket(start)
+        parent.merge(b)
+
+    def partial(self, level):
+        """level级尚未结束的桶：该级当前桶加上更细各级中尚未并入的当前桶，按桶起始时间合并"""
+        res = self.res[level]
+        out = {}
+        for k in range(level + 1):
+            b = self.open[k]
+            if b is None:
+                continue
+            start = b.start - b.start % res
+            m = out.get(start)
+            if m is None:
+                m = out[start] = Bucket(start)
+            m.merge(b)
+        return [out[k] for k in sorted(out)]
+
+class RollupEngine:
+    """接收端的聚合消费者；sink(record)在事件循环中调用，每帧只更新1秒桶"""
+
+    def __init__(self, levels=LEVELS):
+        self.levels = levels
+        self.devices = {}
+        self.frames = 0
+        self.late = 0  # 早于当前1秒桶而被丢弃的帧
+
+    def add(self, device_id, ts_us, values, ready=1):
+        dev = self.devices.get(device_id)
+        if dev is None:
+            dev = self.devices[device_id] = DeviceRollup(self.levels)
+        if dev.add(ts_us, values, ready):
+            self.frames += 1
+        else:
+            self.late += 1
+
+    def sink(self, record):
+        """注册到 Ingest.add_sink"""
+        values = [record.attention, record.meditation]
+        values += record.bands if record.bands is not None else [None] * len(EEG_BANDS)
+        self.add(record.device_id, record.ts_us, values, record.ready)
+
+    def choose_level(self, dev, start_us, end_us, max_points):
+        """选择桶数不超过max_points且保留范围覆盖start_us的最细分辨率，都不满足时用最粗一级"""
+        span = max(end_us - start_us, 1)
+        for i, res in enumerate(dev.res):
+            if span / res > max_points:
+                continue
+            oldest = dev.series[i].oldest()
+            retention = self.levels[i][1]
+            # 该级已经丢弃过旧桶且查询起点更早时，改用更粗的一级
+            if retention and oldest is not None and dev.series[i].size >= retention and start_us < oldest:
+                continue
+            return i
+        return len(dev.res) - 1
+
+    def query(self, device_id, start_us, end_us, max_points=500, channels=None):
+        """返回 [start_us, end_us) 内的聚合数据，包含尚未结束的桶；设备不存在时返回None"""
+        dev = self.devices.get(device_id)
+        if dev is None:
+            return None
+        level = self.choose_level(dev, start_us, end_us, max_points)
+        res = dev.res[level]
+        s = dev.series[level]
+        lo = np.searchsorted(s.ts[:s.size], start_us - start_us % res, side="left")
+        hi = np.searchsorted(s.ts[:s.size], end_us, side="left")
+        ts, n, sm, mn, mx, zero = s.ts[lo:hi], s.n[lo:hi], s.sum[lo:hi], s.min[lo:hi], s.max[lo:hi], s.zero[lo:hi]
+        extra = [b for b in dev.partial(level) if start_us - start_us % res <= b.start < end_us]
+        if extra:
+            ts = np.concatenate([ts, [b.start for b in extra]])
+            n = np.vstack([n, [b.n for b in extra]])
+            sm = np.vstack([sm, [b.sum for b in extra]])
+            mn = np.vstack([mn, [b.min for b in extra]])
+            mx = np.vstack([mx, [b.max for b in extra]])
+            zero = np.concatenate([zero, [b.zero for b in extra]])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sm / n
+        empty = n == 0
+        mean[empty] = np.nan
+        mn = np.where(empty, np.nan, mn)
+        mx = np.where(empty, np.nan, mx)
+        out = {"id": device_id, "resolution_s": res // 1000000, "ts": ts, "zero": zero, "channels": {}}
+        for i, name in enumerate(CHANNELS):
+            if channels is None or name in channels:
+                out["channels"][name] = {"n": n[:, i], "min": mn[:, i], "mean": mean[:, i], "max": mx[:, i]}
+        return out
+
+    def stats(self):
+        return {"devices": len(self.devices), "frames": self.frames, "late": self.late,
+                "buckets": [sum(d.series[i].size for d in self.devices.values()) for i in range(len(self.levels))]}
+
+def _jsonable(a):
+    """NumPy数组转列表，NaN转为null"""
+    return [None if isinstance(v, float) and math.isnan(v) else v for v in a.tolist()]
+
+def add_routes(http, engine):
+    """在接收端注册 GET /rollup?id=&from=&to=&points=&ch=Attention,Delta（时间为Unix微秒，默认最近1小时）"""
+    from receiver import json_response
+
+    def rollup_handler(req):
+        q = req.query
+        if "id" not in q:
+            return 400, "text/plain", b"missing id", None
+        end = int(q["to"]) if "to" in q else time.time_ns() // 1000
+        start = int(q.get("from", end - 3600 * 1000000))
+        channels = q["ch"].split(",") if "ch" in q else None
+        r = engine.query(q["id"], start, end, int(q.get("points", 500)), channels)
+        if r is None:
+            return 404, "text/plain", b"unknown device", None
+        r["ts"] = r["ts"].tolist()
+        r["zero"] = r["zero"].tolist()
+        r["channels"] = {name: {k: _jsonable(v) for k, v in ch.items()} for name, ch in r["channels"].items()}
+        return json_response(r)
+
+    http.route("GET", "/rollup", rollup_handler)
+    http.route("GET", "/rollup/stats", lambda req: json_response(engine.stats()))
+
+def bench(args):
+    """模拟若干设备若干小时的1Hz数据，测量聚合速率和不同时间跨度的查询耗时"""
+    rng = np.random.default_rng(1)
+    engine = RollupEngine()
+    t0_us = (time.time_ns() // 1000 // 3600000000) * 3600000000 - int(args.hours * 3600) * 1000000
+    seconds = int(args.hours * 3600)
+    vals = rng.integers(1, 1 << 20, size=(1024, _C)).tolist()
+    t0 = time.perf_counter()
+    for s in range(seconds):
+        ts = t0_us + s * 1000000
+        for d in range(args.devices):
+            engine.add("BENCH%03d" % d, ts + d, vals[(s + d) & 1023], 1)
+    dt = time.perf_counter() - t0
+    print(f"聚合 {engine.frames} 帧: {dt:.2f} 秒, {engine.frames / dt:.0f} 帧/秒, {engine.stats()['buckets']}")
+    end = t0_us + seconds * 1000000
+    for span_h in (0.1, 1, 6, args.hours):
+        start = end - int(span_h * 3600) * 1000000
+        t1 = time.perf_counter()
+        for _ in range(100):
+            r = engine.query("BENCH000", start, end, args.points)
+        q_ms = (time.perf_counter() - t1) * 10
+        print(f"查询 {span_h:g} 小时: 分辨率 {r['resolution_s']} 秒, {len(r['ts'])} 点, {q_ms:.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="EEG多分辨率预聚合")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("bench", help="聚合和查询性能测试")
+    p.add_argument("--devices", type=int, default=10)
+    p.add_argument("--hours", type=float, default=24)
+    p.add_argument("--points", type=int, default=500, help="查询点数上限")
+    args = parser.parse_args()
+    bench(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""多进程分片接收：N个工作进程以SO_REUSEPORT共同监听9003端口，按设备哈希把数据转交给固定的工作进程
+
+固件每次广播都新建UDP套接字（源端口不同），内核按四元组分配时同一设备的数据报会落到不同进程；
+因此每个进程只从数据报头部取出设备ID（不解析JSON），不属于自己的原样经Unix数据报套接字转给所属进程，
+保证同一设备的数据始终由同一进程按顺序处理。各进程的计数写入共享内存中自己的一行，由主进程汇总。
+
+用法:
+  python receiver.py --workers 4 [--db eeg.db] [--colstore data/] [--ota ..] [--mqtt HOST:PORT]
+  python shard.py bench [--workers 1,2,4] [--senders 4] [--seconds 5]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import tempfile
+import time
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from eegcodec import HUB_MAGIC
+from receiver import HttpServer, Ingest, SyncProtocol, UdpProtocol, json_response
+from tgam import eeg_json, synth_frames
+
+STAT_FIELDS = ("records", "errors", "udp_json", "udp_hub", "http_frame", "http_agg", "forwarded", "received", "mqtt")
+_FWD = struct.Struct("<BqHH")  # 类型, 接收时间us, 字段a长度, 字段b长度；之后为a、b和原始数据
+_KIND_DGRAM, _KIND_UPLOAD, _KIND_BATCH = 1, 2, 3
+_ID_KEY = b'"id": "'
+_FWD_BUFFER = 16 << 20  # 每个目标进程最多缓存的待转交字节数
+
+def shard_of(device_id, n):
+    """设备ID到分片号；使用crc32而不是hash()，各进程结果一致"""
+    return zlib.crc32(device_id.encode("utf-8")) % n
+
+def datagram_device(data, addr):
+    """不解析JSON取出设备ID，规则与 Ingest.handle_datagram 相同：有id字段用id，否则用源IP；多通道数据报用芯片ID"""
+    if data[:2] == HUB_MAGIC:
+        id_len = data[4] if len(data) > 4 else 0
+        return data[5:5 + id_len].decode("utf-8", "replace")
+    i = data.find(_ID_KEY)
+    if i >= 0:
+        j = data.find(b'"', i + len(_ID_KEY))
+        if j > 0:
+            return data[i + len(_ID_KEY):j].decode("utf-8", "replace")
+    return addr[0]
+
+class StatsBlock:
+    """共享内存中的计数表：每个工作进程一行，只写自己的行，无需加锁"""
+
+    def __init__(self, workers, name=None):
+        size = workers * len(STAT_FIELDS) * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.table = np.ndarray((workers, len(STAT_FIELDS)), dtype=np.int64, buffer=self.shm.buf)
+        if name is None:
+            self.table[:] = 0
+
+    def publish(self, worker, ingest):
+        row = self.table[worker]
+        row[0] = ingest.records
+        row[1] = ingest.errors
+        for k, name in enumerate(("udp_json", "udp_hub", "http_frame", "http_agg")):
+            row[2 + k] = ingest.counts[name]
+        row[6] = ingest.forwarded
+        row[7] = ingest.received
+        row[8] = ingest.counts["mqtt"]
+
+    def totals(self):
+        return dict(zip(STAT_FIELDS, (int(v) for v in self.table.sum(axis=0))))
+
+    def rows(self):
+        return [dict(zip(STAT_FIELDS, (int(v) for v in row))) for row in self.table]
+
+    def close(self, unlink=False):
+        del self.table
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+class ShardedIngest(Ingest):
+    """只处理属于本分片的设备，其他设备的数据原样转给所属工作进程"""
+
+    def __init__(self, worker, workers, sock_dir):
+        super().__init__()
+        self.worker = worker
+        self.workers = workers
+        self.peers = [os.path.join(sock_dir, "shard-%d.sock" % i) for i in range(workers)]
+        self.transports = [None] * workers
+        self.forwarded = 0
+        self.received = 0
+
+    async def connect_peers(self, timeout=10):
+        """等待其他工作进程绑定转交套接字后逐个连接；目标暂时忙时由asyncio传输层按顺序缓存"""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        for i, path in enumerate(self.peers):
+            if i == self.worker:
+                continue
+            while not os.path.exists(path) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.connect(path)
+            self.transports[i], _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, sock=sock)
+
+    def _forward(self, owner, kind, recv_us, a, b, payload):
+        t = self.transports[owner]
+        if t is None or t.get_write_buffer_size() > _FWD_BUFFER:
+            self.errors += 1  # 目标进程长时间无法接收，丢弃
+            return
+        a, b = a.encode("utf-8"), b.encode("latin-1")
+        t.sendto(_FWD.pack(kind, recv_us, len(a), len(b)) + a + b + payload)
+        self.forwarded += 1
+
+    def handle_datagram(self, data, addr, recv_us):
+        owner = shard_of(datagram_device(data, addr), self.workers)
+        if owner == self.worker:
+            super().handle_datagram(data, addr, recv_us)
+        else:
+            self._forward(owner, _KIND_DGRAM, recv_us, addr[0], "", data)
+
+    def handle_upload(self, device_id, body, headers, recv_us):
+        owner = shard_of(device_id, self.workers)
+        if owner == self.worker:
+            return super().handle_upload(device_id, body, headers, recv_us)
+        self._forward(owner, _KIND_UPLOAD, recv_us, device_id, headers.get("x-trace", ""), body)
+        return 0
+
+    def handle_agg(self, device_id, body, recv_us):
+        owner = shard_of(device_id, self.workers)
+        if owner == self.worker:
+            super().handle_agg(device_id, body, recv_us)
+        else:
+            self._forward(owner, _KIND_UPLOAD, recv_us, device_id + "/agg", "", body)
+
+    def handle_batch(self, device_id, data, recv_us):
+        owner = shard_of(device_id, self.workers)
+        if owner == self.worker:
+            super().handle_batch(device_id, data, recv_us)
+        else:
+            self._forward(owner, _KIND_BATCH, recv_us, device_id, "", data)
+
+    def handle_forwarded(self, msg):
+        """处理其他工作进程转来的数据，沿用原始接收时间"""
+        kind, recv_us, la, lb = _FWD.unpack_from(msg)
+        off = _FWD.size
+        a = msg[off:off + la].decode("utf-8")
+        b = msg[off + la:off + la + lb].decode("latin-1")
+        payload = msg[off + la + lb:]
+        self.received += 1
+        if kind == _KIND_DGRAM:
+            Ingest.handle_datagram(self, payload, (a, 0), recv_us)
+        elif kind == _KIND_BATCH:
+            Ingest.handle_batch(self, a, payload, recv_us)
+        elif a.endswith("/agg"):
+            try:
+                Ingest.handle_agg(self, a[:-4], payload, recv_us)
+            except (ValueError, KeyError):
+                self.errors += 1
+        else:
+            Ingest.handle_upload(self, a, payload, {"x-trace": b} if b else {}, recv_us)
+
+class ForwardProtocol(asyncio.DatagramProtocol):
+    def __init__(self, ingest):
+        self.ingest = ingest
+
+    def datagram_received(self, data, addr):
+        self.ingest.handle_forwarded(data)
+
+class ShardHttpServer(HttpServer):
+    """/stats 返回全部工作进程的合计，/shards 返回每个进程的计数"""
+
+    def __init__(self, ingest, stats):
+        super().__init__(ingest)
+        self.routes = [r for r in self.routes if r[1] != "/stats"]
+        self.route("GET", "/stats", lambda req: json_response(self._stats(stats)))
+        self.route("GET", "/shards", lambda req: json_response(stats.rows()))
+
+    def _stats(self, stats):
+        """与单进程 /stats 格式相同，数值为全部工作进程的合计"""
+        t = stats.totals()
+        return {"records": t["records"], "errors": t["errors"], "forwarded": t["forwarded"],
+                "counts": {k: t[k] for k in ("udp_json", "udp_hub", "http_frame", "http_agg", "mqtt")}}
+
+async def _worker_main(worker, args, stats_name, sock_dir, ready):
+    loop = asyncio.get_running_loop()
+    ingest = ShardedIngest(worker, args.workers, sock_dir)
+    stats = StatsBlock(args.workers, stats_name)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sock.bind(ingest.peers[worker])
+    await loop.create_datagram_endpoint(lambda: ForwardProtocol(ingest), sock=sock)
+    await ingest.connect_peers()
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    udp.bind((args.host, args.port))
+    await loop.create_datagram_endpoint(lambda: UdpProtocol(ingest), sock=udp)
+    if args.sync_port:
+        await loop.create_datagram_endpoint(SyncProtocol, local_addr=(args.host, args.sync_port), reuse_port=True)
+    if worker == 0 and getattr(args, "discovery_port", 0):
+        # 发现查询只需一个进程应答，设备随后单播到共享的数据端口
+        from discovery import start_announcer
+        try:
+            await start_announcer(args.port, args.sync_port, args.discovery_port, iface=args.discovery_iface)
+        except OSError as e:
+            print(f"设备发现应答未启动（{e}）")
+    http = ShardHttpServer(ingest, stats)
+    if getattr(args, "ota", None):
+        # HTTP连接由内核分给任意进程，每个进程都提供OTA接口；清单版本由文件哈希决定，各进程一致
+        from ota_server import OtaRepo, add_routes as add_ota_routes
+        add_ota_routes(http, OtaRepo(args.ota))
+    await asyncio.start_server(http.handle, args.host, args.port, reuse_port=True)
+    closers = []
+    if worker == 0 and getattr(args, "mqtt", None):
+        # 只由一个进程订阅 eeg/+（同一客户端ID的多个连接会互相踢下线），批次按设备转给所属进程
+        from mqtt_broker import MqttSource
+        host, _, port = args.mqtt.partition(":")
+        mqtt = MqttSource(ingest, host, int(port or 1883))
+        mqtt.start()
+        closers.append(mqtt.close)
+    if args.db:
+        from storage import Storage, add_routes as add_storage_routes
+        storage = Storage(args.db, batch=args.db_batch).start()
+        ingest.add_sink(storage.sink)
+        add_storage_routes(http, storage)
+        closers.append(storage.close)
+    if args.colstore:
+        # 每个设备只由一个进程写入，各进程的段目录互不冲突
+        from colstore import ColumnStore, add_routes as add_colstore_routes
+        colstore = ColumnStore(args.colstore).start()
+        ingest.add_sink(colstore.sink)
+        add_colstore_routes(http, colstore)
+        closers.append(colstore.close)
+    ready.set()
+    try:
+        while True:
+            stats.publish(worker, ingest)
+            await asyncio.sleep(0.2)
+    finally:
+        stats.publish(worker, ingest)
+        for close in closers:
+            close()
+        stats.close()
+
+def _worker(worker, args, stats_name, sock_dir, ready):
+    try:
+        asyncio.run(_worker_main(worker, args, stats_name, sock_dir, ready))
+    except KeyboardInterrupt:
+        pass
+
+class ShardedReceiver:
+    """启动和停止一组工作进程"""
+
+    def __init__(self, args):
+        self.args = args
+        self.stats = StatsBlock(args.workers)
+        self.sock_dir = tempfile.mkdtemp(prefix="eeg-shard-")
+        self.procs = []
+
+    def start(self):
+        ctx = multiprocessing.get_context("fork")
+        events = []
+        for i in range(self.args.workers):
+            ready = ctx.Event()
+            p = ctx.Process(target=_worker, args=(i, self.args, self.stats.shm.name, self.sock_dir, ready),
+                            name="shard-%d" % i, daemon=True)
+            p.start()
+            self.procs.append(p)
+            events.append(ready)
+        for e in events:
+            e.wait(10)
+        return self
+
+    def stop(self):
+        old = signal.signal(signal.SIGTERM, signal.SIG_IGN)  # 停止过程中不再被打断
+        for p in self.procs:
+            p.terminate()
+        for p in self.procs:
+            p.join()
+        signal.signal(signal.SIGTERM, old)
+        for fn in os.listdir(self.sock_dir):
+            os.remove(os.path.join(self.sock_dir, fn))
+        os.rmdir(self.sock_dir)
+        self.stats.close(unlink=True)
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run(args):
+    """receiver.py --workers N 的入口：启动工作进程并定期打印合计"""
+    if args.rollup or args.fanout:
+        raise SystemExit("--rollup 和 --fanout 需要看到全部设备，不能与 --workers 同时使用")
+    recv = ShardedReceiver(args).start()
+    signal.signal(signal.SIGTERM, _interrupt)  # 被终止时也停止工作进程并释放共享内存
+    print(f"接收端已启动: {args.workers} 个工作进程共同监听 UDP/HTTP {args.host}:{args.port}")
+    last = 0
+    try:
+        while True:
+            time.sleep(args.report)
+            t = recv.stats.totals()
+            per = " ".join(str(r["records"]) for r in recv.stats.rows())
+            print(f"[{time.strftime('%H:%M:%S')}] 记录 {t['records']} 条 ({(t['records'] - last) / args.report:.1f}/秒), "
+                  f"错误 {t['errors']}, 转交 {t['forwarded']}, 各进程 [{per}]")
+            last = t["records"]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recv.stop()
+
+def _blast(port, payloads, seconds, rate, out):
+    """压测发送进程：每个数据报使用新的源端口（与固件一致）时开销太大，这里轮换一组套接字"""
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(64)]
+    addr = ("127.0.0.1", port)
+    n = 0
+    t_end = time.perf_counter() + seconds
+    interval = 1.0 / rate if rate else 0
+    next_t = time.perf_counter()
+    while time.perf_counter() < t_end:
+        for i in range(256):
+            try:
+                socks[n & 63].sendto(payloads[n % len(payloads)], addr)
+            except OSError:
+                pass
+            n += 1
+        if interval:
+            next_t += 256 * interval
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    out.put(n)
+
+def bench(args):
+    """对不同工作进程数测量持续处理速率：发送进程以固定总速率发送带id的UDP JSON，统计被处理的记录数"""
+    need = max(int(w) for w in args.workers.split(",")) + args.senders
+    if (os.cpu_count() or 1) < need:
+        print(f"注意: CPU核数 {os.cpu_count()} 少于工作进程数与发送进程数之和 {need}，结果不能反映扩展性")
+    frames = list(synth_frames(500, seed=1))
+    payloads = [eeg_json(frames[i % 500])[:-1] + b', "id": "BENCH%05d"}' % (i % args.devices) for i in range(5000)]
+    results = []
+    for workers in [int(w) for w in args.workers.split(",")]:
+        rargs = argparse.Namespace(workers=workers, host="127.0.0.1", port=args.port, sync_port=0,
+                                   db=None, colstore=None, db_batch=5000)
+        recv = ShardedReceiver(rargs).start()
+        time.sleep(0.3)
+        ctx = multiprocessing.get_context("fork")
+        out = ctx.Queue()
+        senders = [ctx.Process(target=_blast, args=(args.port, payloads, args.seconds, args.rate / args.senders, out))
+                   for _ in range(args.senders)]
+        t0 = time.perf_counter()
+        for p in senders:
+            p.start()
+        sent = sum(out.get() for _ in senders)
+        for p in senders:
+            p.join()
+        time.sleep(0.5)
+        dt = time.perf_counter() - t0
+        t = recv.stats.totals()
+        rate = t["records"] / args.seconds
+        results.append((workers, rate))
+        print(f"{workers} 个工作进程: 发送 {sent}, 处理 {t['records']} ({rate:.0f} 条/秒), "
+              f"转交 {t['forwarded']}, 丢失 {max(0, sent - t['records']) / max(sent, 1):.1%}")
+        recv.stop()
+    base = results[0][1] / results[0][0]
+    for workers, rate in results[1:]:
+        print(f"  {workers} 进程加速比 {rate / results[0][1]:.2f}，线性效率 {rate / (base * workers):.0%}")
+    print(f"CPU核数: {os.cpu_count()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程分片接收")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("bench", help="不同工作进程数下的处理速率")
+    p.add_argument("--workers", default="1,2,4", help="逗号分隔的工作进程数列表")
+    p.add_argument("--senders", type=int, default=4, help="发送进程数")
+    p.add_argument("--rate", type=float, default=0, help="总发送速率（条/秒），0表示尽可能快")
+    p.add_argument("--devices", type=int, default=5000)
+    p.add_argument("--seconds", type=float, default=5)
+    p.add_argument("--port", type=int, default=9203)
+    args = parser.parse_args()
+    bench(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""软件串口发送的时序模型：按各发送方式的边沿误差模拟16倍过采样的UART接收，估算误码率和采样裕量，与 lib/softuart.py 对应
+
+发送方式:
+  sleep     原 UART/io2uart.py：每位 sleep_us(int(1e6/波特率))，每位额外加上函数调用开销，误差逐位累积
+  deadline  按 ticks_us 绝对截止时间忙等翻转，误差为1us取整、忙等循环粒度和翻转耗时，减去自校准的提前量，不累积
+  rmt       RMT外设按 80MHz/clock_div 的tick产生波形，只有每位tick数的取整误差
+
+接收端在起始位下降沿之后的第一个采样时钟检测到起始位，在每位的第8个采样点判决（部分UART取7/8/9三点多数，效果相近）。
+
+用法:
+  python softuart.py ber [--baud 9600,57600,115200] [--bytes 200000] [--overhead-us 4] [--jitter-us 1]
+                         [--loop-us 2.5] [--pin-us 1.2] [--irq-rate 0] [--rx-ppm 0]
+  python softuart.py plan [--baud 1200,9600,57600]       # RMT时钟分频、每位tick数和波特率误差
+"""
+import argparse
+
+import numpy as np
+
+RMT_CLOCK = 80000000
+RMT_MAX_TICKS = 32767
+FRAME_BITS = 10
+OVERSAMPLE = 16
+
+def rmt_plan(baud):
+    """与 SoftUART.__init__ 相同的分频选择，返回 (clock_div, 每位tick数, 实际位时间us)"""
+    div = 1
+    while RMT_CLOCK // (div * baud) > RMT_MAX_TICKS:
+        div += 1
+    ticks = (RMT_CLOCK // div + baud // 2) // baud
+    return div, ticks, ticks * div * 1e6 / RMT_CLOCK
+
+def frame_bits(data):
+    """(n, 10) 电平：起始位0、低位在前的8个数据位、停止位1"""
+    bits = np.zeros((len(data), FRAME_BITS), dtype=np.uint8)
+    bits[:, 1:9] = (data[:, None] >> np.arange(8)) & 1
+    bits[:, 9] = 1
+    return bits
+
+def edges_sleep(n, baud, rng, overhead_us=4.0, jitter_us=1.0):
+    """原实现：第k位的开始时刻 = k*(int(1e6/baud) + 每位开销)，开销逐位累积"""
+    step = int(1000000 / baud) + np.clip(rng.normal(overhead_us, jitter_us, (n, FRAME_BITS)), 0, None)
+    e = np.zeros((n, FRAME_BITS + 1))
+    e[:, 1:] = np.cumsum(step, axis=1)
+    return e
+
+def edges_deadline(n, baud, rng, loop_us=2.5, pin_us=1.2, irq_rate=0.0, irq_us=20.0, lead_us=None):
+    """截止时间忙等：边沿在取整后的截止时刻之后 U(0, 循环耗时) + 翻转耗时，减去提前量；irq_rate 为每个边沿被中断打断的概率"""
+    nominal = (np.arange(FRAME_BITS + 1) * 1000000 + baud // 2) // baud
+    if lead_us is None:
+        lead_us = int(loop_us / 2 + pin_us + 0.5)  # 与 SoftUART.calibrate 相同
+    late = rng.uniform(0, loop_us, (n, FRAME_BITS + 1)) + pin_us - lead_us
+    if irq_rate:
+        late += (rng.random((n, FRAME_BITS + 1)) < irq_rate) * rng.uniform(0, irq_us, (n, FRAME_BITS + 1))
+    e = nominal + late
+    e[:, 0] = 0  # 起始位下降沿作为时间零点
+    return np.maximum.accumulate(e, axis=1)  # 被中断推迟的边沿之后的边沿不可能更早
+
+def edges_rmt(n, baud):
+    _, _, bit_us = rmt_plan(baud)
+    return np.tile(np.arange(FRAME_BITS + 1) * bit_us, (n, 1))
+
+def receive(edges, bits, baud, rng, rx_ppm=0.0):
+    """16倍过采样接收，返回 (位错误数, 帧错误数, 字节错误数, 最小采样裕量占位时间的比例)"""
+    n = len(bits)
+    ts = 1e6 / (baud * OVERSAMPLE) * (1 + rx_ppm * 1e-6)
+    start = rng.uniform(0, ts, n)  # 采样时钟与发送端异步，检测到下降沿的时刻在边沿之后0~1个采样周期
+    t = start[:, None] + (np.arange(FRAME_BITS) * OVERSAMPLE + OVERSAMPLE // 2) * ts
+    # 采样时刻落在第几个位（edges[:, j] <= t < edges[:, j+1]）
+    idx = (t[:, :, None] >= edges[:, None, :FRAME_BITS]).sum(axis=2) - 1
+    idx = np.clip(idx, 0, FRAME_BITS - 1)
+    got = np.take_along_axis(bits, idx, axis=1)
+    # 采样点到所在位两侧边沿的最小距离，负值表示采到了相邻的位
+    bit_us = 1e6 / baud
+    k = np.arange(FRAME_BITS)
+    margin = np.minimum(t - edges[:, k], edges[:, k + 1] - t) / bit_us
+    wrong = got[:, 1:9] != bits[:, 1:9]
+    framing = (got[:, 0] != 0) | (got[:, 9] != 1)
+    return int(wrong.sum()), int(framing.sum()), int((wrong.any(axis=1) | framing).sum()), float(margin.min())
+
+def ber(args):
+    rng = np.random.default_rng(args.seed)
+    data = rng.integers(0, 256, args.bytes)
+    bits = frame_bits(data)
+    print(f"{'波特率':>8} {'方式':<9}{'误码率':>10}{'帧错误':>8}{'字节错误率':>12}{'最小裕量':>10}")
+    for baud in args.baud:
+        models = (("sleep", edges_sleep(args.bytes, baud, rng, args.overhead_us, args.jitter_us)),
+                  ("deadline", edges_deadline(args.bytes, baud, rng, args.loop_us, args.pin_us, args.irq_rate)),
+                  ("rmt", edges_rmt(args.bytes, baud)))
+        for name, edges in models:
+            bit_err, frame_err, byte_err, margin = receive(edges, bits, baud, rng, args.rx_ppm)
+            print(f"{baud:>8} {name:<9}{bit_err / (args.bytes * 8):>10.2e}{frame_err:>8}"
+                  f"{byte_err / args.bytes:>12.2e}{margin * 100:>9.1f}%")
+
+def plan(args):
+    print(f"{'波特率':>8}{'分频':>6}{'tick/位':>9}{'位时间us':>10}{'误差ppm':>9}{'截止时间取整最大误差us':>14}")
+    for baud in args.baud:
+        div, ticks, bit_us = rmt_plan(baud)
+        nominal = np.arange(FRAME_BITS + 1) * 1e6 / baud
+        rounded = (np.arange(FRAME_BITS + 1) * 1000000 + baud // 2) // baud
+        print(f"{baud:>8}{div:>6}{ticks:>9}{bit_us:>10.3f}{(1e6 / (bit_us * baud) - 1) * 1e6:>9.0f}"
+              f"{np.abs(rounded - nominal).max():>14.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="软件串口发送时序模型")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    bauds = lambda s: [int(x) for x in s.split(",")]
+    p = sub.add_parser("ber", help="各发送方式的误码率")
+    p.add_argument("--baud", type=bauds, default=[9600, 57600, 115200])
+    p.add_argument("--bytes", type=int, default=200000)
+    p.add_argument("--overhead-us", type=float, default=4.0, help="sleep方式每位的额外开销（us）")
+    p.add_argument("--jitter-us", type=float, default=1.0, help="sleep方式开销的标准差（us）")
+    p.add_argument("--loop-us", type=float, default=2.5, help="忙等循环一次的耗时（设备上 SoftUART.stats() 的 loop_us）")
+    p.add_argument("--pin-us", type=float, default=1.2, help="翻转引脚的耗时（pin_us）")
+    p.add_argument("--irq-rate", type=float, default=0.0, help="不关中断时每个边沿被打断的概率")
+    p.add_argument("--rx-ppm", type=float, default=0.0, help="接收端时钟误差（ppm）")
+    p.add_argument("--seed", type=int, default=1)
+    p = sub.add_parser("plan", help="RMT分频与波特率误差")
+    p.add_argument("--baud", type=bauds, default=[1200, 9600, 57600, 115200, 230400])
+    args = parser.parse_args()
+    ber(args) if args.cmd == "ber" else plan(args)
+
+if __name__ == "__main__":
+    main()
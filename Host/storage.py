@@ -0,0 +1,277 @@
+"""EEG记录的SQLite持久化：WAL模式，后台线程从有界队列批量写入，按(设备, 时间)聚簇存储
+
+用法:
+  python receiver.py --db eeg.db          # 接收端写入数据库，并提供 /db/range 和 /db/latest 接口
+  python storage.py bench [--db bench.db] [--records 200000] [--devices 100]
+"""
+import argparse
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from receiver import EEGRecord, json_response
+from tgam import EEG_BANDS, synth_frames
+
+_BAND_COLS = ", ".join(b.lower() for b in EEG_BANDS)
+_VALUE_COLS = "ready, attention, meditation, signal, " + _BAND_COLS
+_COLS = "ts_us, " + _VALUE_COLS
+
+# frames 以 (dev, ts_us, seq) 为主键且不带rowid，主键B树本身即覆盖全部列的索引，按设备和时间范围查询只需顺序扫描；
+# seq 为记录在所属请求中的位置（同一次上传的多帧共用接收时间），重传的记录主键相同
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS devices (
+    dev INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL UNIQUE,
+    last_ts_us INTEGER NOT NULL DEFAULT 0,
+    last_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS frames (
+    dev INTEGER NOT NULL,
+    ts_us INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    ready INTEGER NOT NULL,
+    attention INTEGER NOT NULL,
+    meditation INTEGER NOT NULL,
+    signal INTEGER,
+    {", ".join(b.lower() + " INTEGER" for b in EEG_BANDS)},
+    PRIMARY KEY (dev, ts_us, seq)
+) WITHOUT ROWID;
+"""
+
+_INSERT = f"INSERT INTO frames (dev, ts_us, seq, {_VALUE_COLS}) VALUES ({', '.join('?' * (len(EEG_BANDS) + 7))})"
+_EXISTING = f"SELECT {_VALUE_COLS} FROM frames WHERE dev = ? AND ts_us = ? AND seq = ?"
+_NO_BANDS = (None,) * len(EEG_BANDS)
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL下只在检查点时同步，断电最多丢失最后几个事务
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+def _row_dict(device_id, row):
+    d = {"id": device_id, "ts": row[0], "dataReady": row[1], "Attention": row[2], "Meditation": row[3]}
+    if row[4] is not None:
+        d["Signal"] = row[4]
+    if row[5] is not None:
+        for name, value in zip(EEG_BANDS, row[5:]):
+            d[name] = value
+    return d
+
+class Storage:
+    """接收端的数据库消费者：sink(record) 只做入队，写线程每batch条或每flush_ms毫秒提交一个事务"""
+
+    def __init__(self, path, batch=5000, flush_ms=200, queue_size=100000):
+        self.path = path
+        self.batch = batch
+        self.flush_ms = flush_ms
+        self.queue = queue.Queue(queue_size)
+        self.conn = _connect(path)
+        self.conn.executescript(SCHEMA)
+        if "seq" not in [c[1] for c in self.conn.execute("PRAGMA table_info(frames)")]:
+            raise ValueError(f"{path} 是旧版本的数据库（frames 表没有 seq 列），请使用新的数据库文件")
+        # device_id -> [dev, 已写入的最新时间戳, 其序号]，只在事务提交后更新
+        self._devs = {}
+        for dev, device_id, last, seq in self.conn.execute("SELECT dev, device_id, last_ts_us, last_seq FROM devices"):
+            self._devs[device_id] = [dev, last, seq]
+        self._local = threading.local()
+        self._thread = None
+        self._stop = False
+        self.written = 0
+        self.dropped = 0  # 队列满时丢弃的记录数
+        self.commits = 0
+        self.commit_us = 0  # 最近一次提交耗时
+        self.errors = 0  # 写入失败的批次数（整批丢弃）
+        self.late = 0  # 早于该设备最新记录的记录数（突发缓存、批次、重传），按原时间戳写入
+        self.duplicates = 0  # (设备, 时间戳, 序号) 已存在且数值相同的重传记录数，不写入
+        self.conflicts = 0  # (设备, 时间戳, 序号) 已存在但数值不同的记录数，保留先写入的一条
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="storage", daemon=True)
+        self._thread.start()
+        return self
+
+    def sink(self, record):
+        """注册到 Ingest.add_sink，在事件循环中调用，不阻塞"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """写完队列中剩余的记录后关闭"""
+        self._stop = True
+        if self._thread:
+            self._thread.join()
+        self.conn.close()
+
+    def _run(self):
+        pending = []
+        while not (self._stop and self.queue.empty()):
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while len(pending) < self.batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if pending:
+                try:
+                    self._write(pending)
+                except sqlite3.Error as e:
+                    self.errors += 1
+                    print(f"数据库写入失败，丢弃 {len(pending)} 条: {e}")
+                pending = []
+
+    def _write(self, records):
+        t0 = time.perf_counter()
+        try:
+            with self.conn:
+                devs, written, late, dups, conflicts = self._insert(records, True)
+        except sqlite3.IntegrityError:
+            # 批次中有已存在的主键：整个事务（包括新设备）已回滚，逐条重新插入以区分重传和冲突
+            with self.conn:
+                devs, written, late, dups, conflicts = self._insert(records, False)
+        # 提交成功后才更新缓存，事务回滚时缓存不会指向不存在的设备
+        self._devs.update(devs)
+        self.written += written
+        self.late += late
+        self.duplicates += dups
+        self.conflicts += conflicts
+        self.commits += 1
+        self.commit_us = int((time.perf_counter() - t0) * 1e6)
+
+    def _insert(self, records, bulk):
+        """在当前事务中写入一批记录，返回 (本批次设备的新缓存项, 写入数, 迟到数, 重传数, 冲突数)"""
+        devs = {}
+        rows = []
+        late = 0
+        for r in records:
+            entry = devs.get(r.device_id)
+            if entry is None:
+                entry = self._devs.get(r.device_id)
+                if entry is None:
+                    cur = self.conn.execute("INSERT INTO devices (device_id) VALUES (?)", (r.device_id,))
+                    entry = [cur.lastrowid, 0, 0]
+                entry = devs[r.device_id] = list(entry)
+            if (r.ts_us, r.seq) > (entry[1], entry[2]):
+                entry[1], entry[2] = r.ts_us, r.seq
+            elif r.ts_us < entry[1]:
+                late += 1  # 迟到或乱序的记录保留原时间戳，主键B树按时间插入到对应位置
+            rows.append((entry[0], r.ts_us, r.seq, r.ready, r.attention, r.meditation,
+                         r.signal if r.signal >= 0 else None, *(r.bands if r.bands is not None else _NO_BANDS)))
+        dups = conflicts = 0
+        if bulk:
+            self.conn.executemany(_INSERT, rows)
+        else:
+            for row in rows:
+                try:
+                    self.conn.execute(_INSERT, row)
+                except sqlite3.IntegrityError:
+                    if self.conn.execute(_EXISTING, row[:3]).fetchone() == row[3:]:
+                        dups += 1
+                    else:
+                        conflicts += 1
+        self.conn.executemany("UPDATE devices SET last_ts_us = ?, last_seq = ? WHERE dev = ?",
+                              [(e[1], e[2], e[0]) for device_id, e in devs.items()
+                               if self._devs.get(device_id) != e])
+        return devs, len(rows) - dups - conflicts, late, dups, conflicts
+
+    def _reader(self):
+        """每个查询线程使用独立的只读连接，WAL模式下与写线程互不阻塞"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def range(self, device_id, start_us=0, end_us=None, limit=10000):
+        """查询设备在 [start_us, end_us) 内的记录，按时间升序"""
+        conn = self._reader()
+        row = conn.execute("SELECT dev FROM devices WHERE device_id = ?", (device_id,)).fetchone()
+        if row is None:
+            return []
+        end_us = (1 << 62) if end_us is None else end_us
+        cur = conn.execute(f"SELECT {_COLS} FROM frames WHERE dev = ? AND ts_us >= ? AND ts_us < ? "
+                           "ORDER BY ts_us, seq LIMIT ?", (row[0], start_us, end_us, limit))
+        return [_row_dict(device_id, r) for r in cur]
+
+    def latest(self, device_id=None):
+        """返回每个设备（或指定设备）最新的一条记录"""
+        conn = self._reader()
+        sql = f"SELECT d.device_id, {', '.join('f.' + c.strip() for c in _COLS.split(','))} FROM devices d " \
+              "JOIN frames f ON f.dev = d.dev AND f.ts_us = d.last_ts_us AND f.seq = d.last_seq"
+        if device_id is None:
+            cur = conn.execute(sql)
+        else:
+            cur = conn.execute(sql + " WHERE d.device_id = ?", (device_id,))
+        return [_row_dict(r[0], r[1:]) for r in cur]
+
+    def stats(self):
+        return {"written": self.written, "queued": self.queue.qsize(), "dropped": self.dropped,
+                "commits": self.commits, "commit_us": self.commit_us, "errors": self.errors, "late": self.late,
+                "duplicates": self.duplicates, "conflicts": self.conflicts, "devices": len(self._devs)}
+
+def add_routes(http, storage):
+    """在接收端注册 GET /db/range?id=&from=&to=&limit= 和 GET /db/latest[?id=]，查询在线程池中执行"""
+    async def range_handler(req):
+        q = req.query
+        if "id" not in q:
+            return 400, "text/plain", b"missing id", None
+        to = int(q["to"]) if "to" in q else None
+        rows = await asyncio.to_thread(storage.range, q["id"], int(q.get("from", 0)), to, int(q.get("limit", 10000)))
+        return json_response(rows)
+
+    async def latest_handler(req):
+        return json_response(await asyncio.to_thread(storage.latest, req.query.get("id")))
+
+    http.route("GET", "/db/range", range_handler)
+    http.route("GET", "/db/latest", latest_handler)
+    http.route("GET", "/db/stats", lambda req: json_response(storage.stats()))
+
+def bench(args):
+    """生成模拟记录写入数据库，测量持续写入速率和查询耗时"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    frames = list(synth_frames(1000, seed=1, zero_ratio=0.02))
+    storage = Storage(args.db, batch=args.batch, queue_size=args.records + 1).start()
+    base = time.time_ns() // 1000
+    t0 = time.perf_counter()
+    for i in range(args.records):
+        dev, k = i % args.devices, i // args.devices
+        storage.sink(EEGRecord.from_frame(frames[i % len(frames)], "BENCH%04d" % dev, base + k * 1000000))
+    t_enqueue = time.perf_counter() - t0
+    while storage.written < args.records:
+        time.sleep(0.01)
+    t_total = time.perf_counter() - t0
+    print(f"入队 {args.records} 条: {args.records / t_enqueue:.0f} 条/秒（事件循环侧开销）")
+    print(f"写入 {args.records} 条: {t_total:.2f} 秒, {args.records / t_total:.0f} 条/秒, "
+          f"{storage.commits} 个事务, 丢弃 {storage.dropped}")
+    t0 = time.perf_counter()
+    rows = storage.range("BENCH0000", base, base + 600 * 1000000)
+    t1 = time.perf_counter()
+    latest = storage.latest()
+    t2 = time.perf_counter()
+    print(f"范围查询 {len(rows)} 条: {(t1 - t0) * 1000:.2f} ms; 最新记录 {len(latest)} 个设备: {(t2 - t1) * 1000:.2f} ms")
+    storage.close()
+    print(f"数据库大小: {os.path.getsize(args.db) / 1e6:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="EEG记录SQLite存储")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("bench", help="写入和查询性能测试")
+    p.add_argument("--db", default="bench.db")
+    p.add_argument("--records", type=int, default=200000)
+    p.add_argument("--devices", type=int, default=100)
+    p.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+    bench(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""主机端TGAM帧公共定义，与 lib/tgam.py 对应"""
+import json
+import random
+
+# 定义EEG频段名称
+EEG_BANDS = ["Delta", "Theta", "LowAlpha", "HighAlpha", "LowBeta", "HighBeta", "LowGamma", "MiddleGamma"]
+
+# 各频段频率范围（Hz），与TGAM的8个频段定义一致
+BAND_RANGES = ((0.5, 2.75), (3.5, 6.75), (7.5, 9.25), (10.0, 11.75),
+               (13.0, 16.75), (18.0, 29.75), (31.0, 39.75), (41.0, 49.75))
+SAMPLE_RATE = 512  # 原始波形采样率
+
+FRAME_LEN = 36
+START_SEQUENCE = b'\xAA\xAA\x20\x02'
+
+def parse_frame(frame):
+    """检查帧格式是否有效，返回0或1（与固件一致，不校验校验和）"""
+    if len(frame) < 36 or frame[:4] != START_SEQUENCE or frame[31] != 0x04 or frame[33] != 0x05:
+        return 0
+    return 1
+
+def frame_values(frame):
+    """从36字节TGAM帧中取出11个数值：信号质量、8个频段功率、专注度、放松度"""
+    vals = [frame[4]]
+    for i in range(8):
+        j = 7 + i * 3
+        vals.append((frame[j] << 16) | (frame[j + 1] << 8) | frame[j + 2])
+    vals.append(frame[32])
+    vals.append(frame[34])
+    return vals
+
+def build_frame(vals):
+    """由11个数值重建36字节TGAM帧（含校验和）"""
+    payload = bytearray([0x02, vals[0], 0x83, 0x18])
+    for p in vals[1:9]:
+        payload += int(p).to_bytes(3, 'big')
+    payload += bytes([0x04, vals[9], 0x05, vals[10]])
+    return bytes(b'\xAA\xAA\x20' + payload + bytes([~sum(payload) & 0xFF]))
+
+def eeg_json(frame):
+    """生成与固件 broadcast_udp_json 相同的JSON字节串"""
+    if frame[32] == 0x00 and frame[34] == 0x00:
+        data = {"dataReady": 0, "Attention": 0, "Meditation": 0, "Alpha": 0, "Beta": 0, "Gamma": 0}
+    else:
+        data = {"dataReady": 1, "Attention": frame[32], "Meditation": frame[34],
+                "Alpha": min(frame[17], 100), "Beta": min(frame[23], 100), "Gamma": min(frame[29], 100)}
+    return json.dumps(data).encode('utf-8')
+
+def synth_frames(n, seed=None, zero_ratio=0.0):
+    """生成n帧模拟TGAM数据：频段功率随机游走，专注度/放松度缓慢变化，按比例插入零帧"""
+    rng = random.Random(seed)
+    bands = [rng.randint(1 << 12, 1 << 20) for _ in range(8)]
+    att, med = rng.randint(30, 70), rng.randint(30, 70)
+    for _ in range(n):
+        if rng.random() < zero_ratio:
+            yield build_frame([200] + [0] * 10)
+            continue
+        bands = [min(max(b + int(b * rng.gauss(0, 0.15)), 0), (1 << 24) - 1) for b in bands]
+        att = min(max(att + rng.randint(-3, 3), 1), 100)
+        med = min(max(med + rng.randint(-3, 3), 1), 100)
+        yield build_frame([0] + bands + [att, med])
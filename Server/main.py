@@ -5,6 +5,8 @@ import usocket
 import binascii
 import gc
 import ujson  # 用于JSON处理
+from eeg_state import EEGState
+from memctl import MemoryManager
 
 # 定义EEG频段名称
 EEG_BANDS = ["Delta", "Theta", "LowAlpha", "HighAlpha", "LowBeta", "HighBeta", "LowGamma", "MiddleGamma"]
@@ -21,8 +23,11 @@ audio_out = I2S(1, sck=sck_pin, ws=ws_pin, sd=sd_pin, mode=I2S.TX, bits=16, form
 chip_id = binascii.hexlify(unique_id()).decode('utf-8')
 print("ESP32 芯片 ID:", chip_id)
 
-# 全局变量存储最新数据
-latest_eeg_data = {"dataReady": 0, "Attention": 0, "Meditation": 0, "Alpha": 0, "Beta": 0, "Gamma": 0}
+# 最新EEG数据：预分配的双缓冲状态记录，HTTP线程可无锁读取一致快照
+eeg_state = EEGState()
+
+# 内存管理：按阶段统计分配量，只在帧间空闲时回收
+mem = MemoryManager()
 
 def play_audio(filename):
     """播放指定的WAV文件"""
@@ -62,18 +67,8 @@ def parse_frame(frame):
     return 1
 
 def update_eeg_data(frame):
-    """解析frame[32]和frame[34]并更新全局数据"""
-    global latest_eeg_data
-    is_zero_frame = (frame[32] == 0x00 and frame[34] == 0x00)
-    if is_zero_frame:
-        latest_eeg_data = {"dataReady": 0, "Attention": 0, "Meditation": 0, "Alpha": 0, "Beta": 0, "Gamma": 0}
-    else:
-        attention = int(frame[32])  # 解析为十进制
-        meditation = int(frame[34])  # 解析为十进制
-        alpha = min(max(int(frame[17]), 0), 100)
-        beta = min(max(int(frame[23]), 0), 100)
-        gamma = min(max(int(frame[29]), 0), 100)
-        latest_eeg_data = {"dataReady": 1, "Attention": attention, "Meditation": meditation, "Alpha": alpha, "Beta": beta, "Gamma": gamma}
+    """解析frame[17]、frame[23]、frame[29]、frame[32]和frame[34]并发布到eeg_state，不分配新字典"""
+    eeg_state.update(frame)
 
 def http_server():
     """简单的HTTP服务器，提供EEG数据接口"""
@@ -90,8 +85,16 @@ def http_server():
             request = cl.recv(1024).decode('utf-8')
             
             # 简单解析GET请求
-            if "GET /eeg_data" in request:
-                response = ujson.dumps(latest_eeg_data)
+            if "GET /eeg_bin" in request:
+                # 6字节二进制快照：dataReady, Attention, Meditation, Alpha, Beta, Gamma
+                cl.send("HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n\r\n")
+                cl.send(eeg_state.binary())
+            elif "GET /diag" in request:
+                # 内存与GC诊断信息
+                cl.send("HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n")
+                cl.send(ujson.dumps(mem.stats()))
+            elif "GET /eeg_data" in request:
+                response = eeg_state.json()  # 读取一致快照，数据未变化时不重新序列化
                 cl.send("HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n")
                 cl.send(response)
             else:
@@ -125,7 +128,9 @@ def main():
     frame_status_announced = False
     
     while True:
+        mem.begin("uart")
         data = uart.read()
+        mem.end()
         if data:
             print("串口数据:", ' '.join('{:02X}'.format(b) for b in data))
             buffer.extend(data)
@@ -150,7 +155,9 @@ def main():
                     is_zero_frame = (frame[32] == 0x00 and frame[34] == 0x00)
                     
                     # 更新EEG数据
+                    mem.begin("update")
                     update_eeg_data(frame)
+                    mem.end()
                     
                     # 更新最后有效帧时间
                     last_valid_frame_time = time.time()
@@ -174,6 +181,9 @@ def main():
             play_audio("4.wav")
             timeout_notification_sent = True
 
+        # 帧间空闲窗口：按需回收内存
+        mem.idle()
+
         # 无数据时进入低功耗模式
         if not data:
             lightsleep(10)  # 休眠10ms，降低功耗
@@ -1,29 +1,38 @@
-from machine import Pin
+from machine import UART, Pin
 import time
+from softuart import SoftUART  # lib/softuart.py
 
-TX_PIN = Pin(0, Pin.OUT)
-BAUD_RATE = 9600  # 进一步降低
-BIT_TIME = int(1000000 / BAUD_RATE)
+# 用空闲引脚模拟串口发送；原来每位 sleep_us 的方式受函数调用开销影响只能用到9600波特率，且发送时阻塞
+# 现在RMT外设可用时由硬件产生波形，否则按绝对截止时间翻转引脚并自校准，发送队列在主循环中逐块发出
+TX_PIN = 0
+BAUD_RATE = 57600
+USE_RMT = True  # False: 测试截止时间忙等方式
+LOOPBACK_RX = None  # 例如 20：用跳线把TX_PIN接到该引脚，由硬件UART1回读并统计错误字节
+TEST_SECONDS = 60
 
-def soft_uart_write(byte_data):
-    TX_PIN.value(1)
-    TX_PIN.value(0)  # 起始位
-    time.sleep_us(BIT_TIME)
-    for i in range(8):
-        bit = (byte_data >> i) & 1
-        TX_PIN.value(bit)
-        time.sleep_us(BIT_TIME)
-    TX_PIN.value(1)  # 停止位
-    time.sleep_us(BIT_TIME)
+tx = SoftUART(TX_PIN, BAUD_RATE, rmt=USE_RMT)
+rx = UART(1, baudrate=BAUD_RATE, rx=Pin(LOOPBACK_RX), timeout=0) if LOOPBACK_RX is not None else None
+print(f"开始发送: {tx.stats()}")
 
-def send_binary(data):
-    for byte in data:
-        soft_uart_write(byte)
-
-print("开始发送...")
+test_data = bytes(range(256))  # 覆盖所有字节值，回读时每个字节应比上一个大1
+expect = 0
+received = 0
+errors = 0
 start_time = time.time()
-test_data = b'AB'  # 只发送 0x41
-while time.time() - start_time < 60:
-    send_binary(test_data)
-    time.sleep(0.5)
-print("发送完成")
+next_ms = time.ticks_ms()
+while time.time() - start_time < TEST_SECONDS:
+    now = time.ticks_ms()
+    if time.ticks_diff(now, next_ms) >= 0 and tx.pending == 0:
+        tx.write(test_data)
+        next_ms = time.ticks_add(now, 100)
+    tx.poll()
+    if rx and rx.any():
+        for b in rx.read():
+            if b != expect:
+                errors += 1
+            expect = (b + 1) & 0xFF  # 出错后以收到的字节重新同步
+            received += 1
+tx.flush()
+print(f"发送完成: {tx.stats()}")
+if rx:
+    print(f"回读 {received} 字节, 错误 {errors} 字节, 字节错误率 {errors / received if received else 0:.2e}")
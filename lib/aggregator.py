@@ -0,0 +1,145 @@
+from array import array
+import time
+import usocket
+import ujson
+from tgam import EEG_BANDS, band_powers
+
+# 统计通道：专注度、放松度和8个EEG频段
+CHANNELS = ["Attention", "Meditation"] + EEG_BANDS
+_N = len(CHANNELS)
+
+class Aggregator:
+    """在parse_frame与上传之间按时间窗口聚合帧，并抑制未变化帧和零帧，按心跳间隔保底上报"""
+
+    def __init__(self, window_ms=1000, heartbeat_ms=10000, suppress_unchanged=True, suppress_zero=True):
+        self.window_ms = window_ms  # 0 表示不聚合，只做变化抑制
+        self.heartbeat_ms = heartbeat_ms
+        self.suppress_unchanged = suppress_unchanged
+        self.suppress_zero = suppress_zero
+        self._vals = array('l', [0] * _N)
+        self._min = array('l', [0] * _N)
+        self._max = array('l', [0] * _N)
+        self._sum = array('q', [0] * _N)
+        self._n = 0  # 窗口内非零帧数
+        self._zero = 0  # 窗口内零帧数
+        self._window_start = None
+        # 最近一次上报的结果（min/mean/max），用于变化判断和生成上报内容
+        self.out_min = array('l', [0] * _N)
+        self.out_mean = array('l', [0] * _N)
+        self.out_max = array('l', [0] * _N)
+        self.out_n = 0
+        self.out_zero = 0
+        self._last_emit = None
+        self.frames_in = 0
+        self.records_out = 0
+        self.suppressed = 0
+
+    def add(self, frame, now_ms):
+        """加入一帧有效数据，返回True表示应上报，此时可通过record()取得上报内容"""
+        self.frames_in += 1
+        if self._window_start is None:
+            self._window_start = now_ms
+        if frame[32] == 0x00 and frame[34] == 0x00:
+            self._zero += 1
+        else:
+            vals = self._vals
+            vals[0] = frame[32]
+            vals[1] = frame[34]
+            band_powers(frame, vals, 2)
+            mn, mx, sm = self._min, self._max, self._sum
+            first = self._n == 0
+            for i in range(_N):
+                v = vals[i]
+                if first or v < mn[i]:
+                    mn[i] = v
+                if first or v > mx[i]:
+                    mx[i] = v
+                sm[i] = v if first else sm[i] + v
+            self._n += 1
+        if time.ticks_diff(now_ms, self._window_start) < self.window_ms:
+            return False
+        return self._close_window(now_ms)
+
+    def _close_window(self, now_ms):
+        n = self._n
+        changed = n != 0 and self.out_n == 0 or n == 0 and self.out_n != 0
+        if n:
+            for i in range(_N):
+                mean = self._sum[i] // n
+                if (self._min[i] != self.out_min[i] or mean != self.out_mean[i]
+                        or self._max[i] != self.out_max[i]):
+                    changed = True
+                self.out_min[i] = self._min[i]
+                self.out_mean[i] = mean
+                self.out_max[i] = self._max[i]
+        self.out_n = n
+        self.out_zero = self._zero
+        self._n = 0
+        self._zero = 0
+        self._window_start = now_ms
+
+        heartbeat = self._last_emit is None or time.ticks_diff(now_ms, self._last_emit) >= self.heartbeat_ms
+        if not heartbeat:
+            if n == 0 and self.suppress_zero and not changed:
+                self.suppressed += 1
+                return False
+            if n and self.suppress_unchanged and not changed:
+                self.suppressed += 1
+                return False
+        self._last_emit = now_ms
+        self.records_out += 1
+        return True
+
+    def record(self, chip_id):
+        """生成最近一次上报窗口的JSON字节串，保留原有六个字段以兼容旧接收端"""
+        ready = 1 if self.out_n else 0
+        m = self.out_mean
+        rec = {
+            "dataReady": ready,
+            "Attention": m[0] if ready else 0,
+            "Meditation": m[1] if ready else 0,
+            # 与 update_eeg_data 一致，取 frame[17]、frame[23]、frame[29] 对应的中间字节
+            "Alpha": min((m[5] >> 8) & 0xFF, 100) if ready else 0,
+            "Beta": min((m[7] >> 8) & 0xFF, 100) if ready else 0,
+            "Gamma": min((m[9] >> 8) & 0xFF, 100) if ready else 0,
+            "id": chip_id,
+            "n": self.out_n,
+            "zero": self.out_zero,
+            "window": self.window_ms,
+        }
+        if ready:
+            # 各通道 [最小值, 平均值, 最大值]
+            rec["agg"] = {CHANNELS[i]: [self.out_min[i], m[i], self.out_max[i]] for i in range(_N)}
+        return ujson.dumps(rec).encode('utf-8')
+
+    def apply_config(self, cfg):
+        """应用下行配置，未出现的字段保持不变"""
+        self.window_ms = int(cfg.get("window_ms", self.window_ms))
+        self.heartbeat_ms = int(cfg.get("heartbeat_ms", self.heartbeat_ms))
+        self.suppress_unchanged = bool(cfg.get("suppress_unchanged", self.suppress_unchanged))
+        self.suppress_zero = bool(cfg.get("suppress_zero", self.suppress_zero))
+        print(f"聚合配置已更新: 窗口 {self.window_ms}ms, 心跳 {self.heartbeat_ms}ms")
+
+class ConfigListener:
+    """监听UDP下行配置，例如 {"id": "<chip_id>", "window_ms": 5000}，id为"*"时对所有设备生效"""
+
+    def __init__(self, aggregator, chip_id, port=9004):
+        self.aggregator = aggregator
+        self.chip_id = chip_id
+        self.sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+        self.sock.bind(('0.0.0.0', port))
+        self.sock.setblocking(False)
+
+    def poll(self):
+        """非阻塞读取所有待处理的配置报文"""
+        while True:
+            try:
+                data = self.sock.recv(256)
+            except OSError:
+                return
+            try:
+                cfg = ujson.loads(data)
+            except ValueError:
+                continue
+            if cfg.get("id") in (self.chip_id, "*"):
+                self.aggregator.apply_config(cfg)
@@ -0,0 +1,175 @@
+import math
+import time
+from array import array
+import micropython
+from tgam import EEG_BANDS
+
+RAW_SYNC = b'\xAA\xAA\x04\x80\x02'  # TGAM原始波形包: AA AA 04 80 02 高字节 低字节 校验和
+RAW_PACKET_LEN = 8
+SAMPLE_RATE = 512
+
+# 各频段频率范围（Hz），与TGAM的8个频段定义一致
+BAND_RANGES = ((0.5, 2.75), (3.5, 6.75), (7.5, 9.25), (10.0, 11.75),
+               (13.0, 16.75), (18.0, 29.75), (31.0, 39.75), (41.0, 49.75))
+
+class BandPower:
+    """收集0x80原始采样到固定环形缓冲区，每隔hop个采样用定点FFT计算一次8频段功率
+
+    UART_THREAD_MODE 下 feed() 在读取线程、compute() 在主线程中运行，两侧不共享可写状态：
+    只有 feed() 写环形缓冲区和采样计数 samples（先写采样再递增计数），compute() 只写自己的 _done；
+    环形缓冲区为两个窗口长，复制窗口后检查计数，期间新增不超过一个窗口说明读到的采样未被覆盖，否则重新复制
+    """
+
+    def __init__(self, window=256, hop=128):
+        if window & (window - 1) or window < 16:
+            raise ValueError("window 必须是不小于16的2的幂")
+        self.window = window
+        self.hop = hop
+        self._ring = array('h', [0] * (window * 2))
+        self._done = 0  # 上次计算时的采样计数，只由 compute() 修改
+        self.samples = 0  # 累计采样数，只由 feed() 修改
+        self.bad_packets = 0
+        # 原始包解析缓冲区，保留跨块的不完整包
+        self._pbuf = bytearray(512)
+        self._pfill = 0
+        # FFT工作区和查表，全部预分配
+        self._re = array('l', [0] * window)
+        self._im = array('l', [0] * window)
+        bits = window.bit_length() - 1
+        self._rev = array('H', [int('{:0{}b}'.format(i, bits)[::-1], 2) for i in range(window)])
+        self._cos = array('h', [int(16384 * math.cos(2 * math.pi * i / window)) for i in range(window // 2)])
+        self._sin = array('h', [int(-16384 * math.sin(2 * math.pi * i / window)) for i in range(window // 2)])
+        self._hann = array('h', [int(16384 * (0.5 - 0.5 * math.cos(2 * math.pi * i / window))) for i in range(window)])
+        # 每个频段对应的FFT频点范围 [lo, hi)，相邻频段不重叠
+        res = SAMPLE_RATE / window
+        self._bins = array('H')
+        prev = 1
+        for lo, hi in BAND_RANGES:
+            b0 = max(prev, math.ceil(lo / res))
+            b1 = min(max(b0 + 1, math.floor(hi / res) + 1), window // 2)
+            self._bins.append(b0)
+            self._bins.append(b1)
+            prev = b1
+        self.powers = [0] * 8
+        self.version = 0
+        self.compute_us = 0
+        self.compute_max_us = 0
+        self.overruns = 0  # 计算耗时超过一个hop的次数
+        self.retries = 0  # 复制窗口期间采样被覆盖而重新复制的次数
+
+    @property
+    def ready(self):
+        """累积了hop个新采样且窗口已填满时返回True"""
+        n = self.samples
+        return n - self._done >= self.hop and n >= self.window
+
+    def feed(self, data):
+        """解析UART数据块中的原始波形包，每个采样只做O(1)的入队操作"""
+        buf = self._pbuf
+        n = len(data)
+        fill = self._pfill
+        if fill + n > len(buf):
+            fill = 0  # 数据块过大，丢弃残留字节
+            if n > len(buf):
+                data = memoryview(data)[n - len(buf):]
+                n = len(buf)
+        buf[fill:fill + n] = data
+        fill += n
+        pos = 0
+        while True:
+            idx = buf.find(RAW_SYNC, pos, fill)
+            if idx < 0 or fill - idx < RAW_PACKET_LEN:
+                pos = idx if idx >= 0 else max(pos, fill - 4)
+                break
+            hi = buf[idx + 5]
+            lo = buf[idx + 6]
+            if (~(0x80 + 0x02 + hi + lo)) & 0xFF == buf[idx + 7]:
+                v = (hi << 8) | lo
+                self._push(v - 65536 if v & 0x8000 else v)
+            else:
+                self.bad_packets += 1
+            pos = idx + RAW_PACKET_LEN
+        rem = fill - pos
+        for i in range(rem):
+            buf[i] = buf[pos + i]
+        self._pfill = rem
+
+    def _push(self, v):
+        n = self.samples
+        self._ring[n & (2 * self.window - 1)] = v
+        self.samples = n + 1  # 采样写入后才发布
+
+    def compute(self):
+        """对最近window个采样加汉宁窗后做FFT并累加各频段功率，应在主循环空闲时调用"""
+        t0 = time.ticks_us()
+        while True:
+            n = self.samples
+            self._load(n)
+            if self.samples - n <= self.window:
+                break
+            self.retries += 1
+        self._done = n
+        self._fft()
+        re = self._re
+        im = self._im
+        bins = self._bins
+        powers = self.powers
+        for b in range(8):
+            acc = 0
+            for k in range(bins[2 * b], bins[2 * b + 1]):
+                acc += re[k] * re[k] + im[k] * im[k]
+            powers[b] = acc
+        self.version += 1
+        dt = time.ticks_diff(time.ticks_us(), t0)
+        self.compute_us = dt
+        if dt > self.compute_max_us:
+            self.compute_max_us = dt
+        if dt > self.hop * 1000000 // SAMPLE_RATE:
+            self.overruns += 1
+
+    @micropython.native
+    def _load(self, n):
+        """按时间顺序复制第 n-window 到 n-1 个采样并加窗，同时完成位反转重排"""
+        ring = self._ring
+        hann = self._hann
+        rev = self._rev
+        re = self._re
+        im = self._im
+        mask = 2 * self.window - 1
+        start = n - self.window
+        for i in range(self.window):
+            j = rev[i]
+            re[j] = (ring[(start + i) & mask] * hann[i]) >> 14
+            im[j] = 0
+
+    @micropython.native
+    def _fft(self):
+        """原位基2定点FFT，旋转因子为Q14格式，每级右移1位防止溢出"""
+        re = self._re
+        im = self._im
+        cos_t = self._cos
+        sin_t = self._sin
+        n = self.window
+        size = 2
+        while size <= n:
+            half = size >> 1
+            step = n // size
+            for start in range(0, n, size):
+                k = 0
+                for j in range(start, start + half):
+                    wr = cos_t[k]
+                    wi = sin_t[k]
+                    l = j + half
+                    tr = (re[l] * wr - im[l] * wi) >> 14
+                    ti = (re[l] * wi + im[l] * wr) >> 14
+                    ur = re[j]
+                    ui = im[j]
+                    re[j] = (ur + tr) >> 1
+                    im[j] = (ui + ti) >> 1
+                    re[l] = (ur - tr) >> 1
+                    im[l] = (ui - ti) >> 1
+                    k += step
+            size <<= 1
+
+    def as_dict(self):
+        return {EEG_BANDS[i]: self.powers[i] for i in range(8)}
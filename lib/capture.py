@@ -0,0 +1,118 @@
+import struct
+import time
+from array import array
+
+# TGAM串口抓包文件格式（版本1），与 Host/capture.py 对应，所有整数为小端
+# 文件头16字节: 'TGCP' 版本(1B) 标志(1B) 保留(2B) 波特率(4B) 开始时间Unix秒(4B，未知为0)
+# 记录: 与上一条记录的时间差us(4B) 长度(2B) 数据
+# 索引（关闭时写入）: 每条 时间ms(4B) 记录偏移(4B)，从文件开头计
+# 文件尾12字节: 'TGIX' 索引偏移(4B) 索引条数(4B)；缺失时读取端扫描全文件重建索引
+MAGIC = b'TGCP'
+INDEX_MAGIC = b'TGIX'
+VERSION = 1
+HEADER_FMT = '<4sBBHII'
+RECORD_FMT = '<IH'
+HEADER_LEN = 16
+RECORD_LEN = 6
+
+class CaptureWriter:
+    """在设备上把UART数据块连同接收时间写入抓包文件，每隔index_ms毫秒记录一条索引"""
+
+    def __init__(self, path, baud=57600, start_unix=0, index_ms=1000):
+        self.f = open(path, 'wb')
+        self.f.write(struct.pack(HEADER_FMT, MAGIC, VERSION, 0, 0, baud, start_unix))
+        self.index_ms = index_ms
+        self._rec = bytearray(RECORD_LEN)
+        self._index = array('L')
+        self._offset = HEADER_LEN
+        self._t0 = None
+        self._last = None
+        self._elapsed_us = 0
+        self._next_index_ms = 0
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, data, ticks_us=None):
+        """写入一个数据块，ticks_us为读取时间（time.ticks_us），省略时取当前时间"""
+        n = len(data)
+        if n > 0xFFFF:
+            raise ValueError("单条记录最多65535字节")
+        if ticks_us is None:
+            ticks_us = time.ticks_us()
+        if self._t0 is None:
+            self._t0 = self._last = ticks_us
+        delta = time.ticks_diff(ticks_us, self._last)
+        if delta < 0:
+            delta = 0
+        self._last = ticks_us
+        self._elapsed_us += delta
+        t_ms = self._elapsed_us // 1000
+        if t_ms >= self._next_index_ms:
+            self._index.append(t_ms)
+            self._index.append(self._offset)
+            self._next_index_ms = t_ms + self.index_ms
+        struct.pack_into(RECORD_FMT, self._rec, 0, delta, n)
+        self.f.write(self._rec)
+        self.f.write(data)
+        self._offset += RECORD_LEN + n
+        self.records += 1
+        self.bytes += n
+
+    def close(self):
+        """写入索引和文件尾"""
+        index_offset = self._offset
+        self.f.write(self._index)  # array('L') 在ESP32上为4字节小端
+        self.f.write(struct.pack('<4sII', INDEX_MAGIC, index_offset, len(self._index) // 2))
+        self.f.close()
+
+class CaptureQueue:
+    """UART读取线程到主循环的抓包数据交接：单生产者/单消费者，数据和每块的长度、时间都预分配，无需加锁；
+    读取线程只复制数据，闪存写入（扇区擦除可达数十毫秒）和关闭文件都在主循环中进行"""
+
+    def __init__(self, nbytes=16384, slots=1024):
+        if nbytes & (nbytes - 1) or slots & (slots - 1):
+            raise ValueError("nbytes 和 slots 必须是2的幂")
+        self.nbytes = nbytes
+        self.slots = slots
+        self._buf = bytearray(nbytes)
+        self._mv = memoryview(self._buf)
+        self._len = array('H', [0] * slots)
+        self._ts = array('L', [0] * slots)
+        self.head = 0  # 写入的数据块数，仅生产者线程修改
+        self.tail = 0  # 读取的数据块数，仅消费者线程修改
+        self.bytes_in = 0  # 仅生产者线程修改
+        self.bytes_out = 0  # 仅消费者线程修改
+        self.dropped = 0  # 队列满时丢弃的字节数，仅生产者线程修改
+
+    def push(self, data, ts):
+        """生产者：复制一个数据块，空间不足时丢弃并返回False，永不阻塞"""
+        n = len(data)
+        head = self.head
+        if head - self.tail >= self.slots or self.bytes_in - self.bytes_out + n > self.nbytes:
+            self.dropped += n
+            return False
+        pos = self.bytes_in & (self.nbytes - 1)
+        k = min(n, self.nbytes - pos)
+        self._mv[pos:pos + k] = data[:k]
+        if k < n:
+            self._mv[:n - k] = data[k:]
+        i = head & (self.slots - 1)
+        self._len[i] = n
+        self._ts[i] = ts
+        self.bytes_in += n
+        self.head = head + 1  # 数据写完后再发布索引
+        return True
+
+    def drain(self, write):
+        """消费者：依次调用 write(数据, ticks_us)，跨越缓冲区末尾的数据块分两次写入"""
+        while self.tail != self.head:
+            i = self.tail & (self.slots - 1)
+            n = self._len[i]
+            ts = self._ts[i]
+            pos = self.bytes_out & (self.nbytes - 1)
+            k = min(n, self.nbytes - pos)
+            write(self._mv[pos:pos + k], ts)
+            if k < n:
+                write(self._mv[:n - k], ts)
+            self.bytes_out += n
+            self.tail += 1
@@ -0,0 +1,96 @@
+import struct
+import time
+import usocket
+
+# 接收端发现报文（UDP 9006），与 Host/discovery.py 对应
+# 查询: b'TGDQ' + 版本(1B) + 芯片ID长度(1B) + 芯片ID，发往组播地址，多次无应答后也发往广播地址
+# 应答: b'TGDA' + 版本(1B) + 数据端口(2B) + 时钟同步端口(2B) + 租期秒(2B)，单播回复，接收端地址即应答的源地址
+QUERY_MAGIC = b'TGDQ'
+ANNOUNCE_MAGIC = b'TGDA'
+VERSION = 1
+_ANNOUNCE_FMT = '<4sBHHH'
+_ANNOUNCE_SIZE = 11
+GROUP = "239.255.90.3"
+PORT = 9006
+BROADCAST = "255.255.255.255"
+
+class Discovery:
+    """寻找接收端并改为单播发送：找到之前和租期内连续续约失败后回退到广播地址"""
+
+    def __init__(self, chip_id, data_port=9003, group=GROUP, port=PORT, retry_ms=30000, timeout=0.2, max_misses=3):
+        self.fallback = (BROADCAST, data_port)
+        self.addr = self.fallback  # 当前数据发送地址
+        self.sync_port = 0  # 接收端的时钟同步端口，0 表示未知或未开启
+        self.group = (group, port)
+        self.port = port
+        self.retry_ms = retry_ms  # 未找到接收端时的查询间隔
+        self.max_misses = max_misses
+        self.lease_ms = 0
+        self.misses = 0
+        self.queries = 0
+        self.found = 0  # 找到或更换接收端的次数
+        self.fallbacks = 0
+        self._next = time.ticks_ms()
+        self._attempt = 0
+        self._query = QUERY_MAGIC + bytes((VERSION, len(chip_id))) + chip_id.encode()
+        self.sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+        self.sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_BROADCAST, 1)
+        self.sock.settimeout(timeout)  # 等待应答的最长时间，会短暂阻塞主循环
+
+    @property
+    def unicast(self):
+        return self.addr[0] != BROADCAST
+
+    def poll(self, now_ms):
+        """到达查询或续约时间时发送查询并短暂等待应答，发送地址变化时返回True"""
+        if time.ticks_diff(now_ms, self._next) < 0:
+            return False
+        self._attempt += 1
+        reply = self._ask(self.group)
+        if reply is None and (not self.unicast or self.misses) and self._attempt % 2 == 0:
+            reply = self._ask((BROADCAST, self.port))  # 组播被AP过滤时用广播查询
+        if reply is not None:
+            return self._on_reply(now_ms, *reply)
+        if not self.unicast:
+            # 启动后先以1秒间隔快速查询几次
+            self._next = time.ticks_add(now_ms, 1000 if self._attempt < 5 else self.retry_ms)
+            return False
+        self.misses += 1
+        if self.misses < self.max_misses:
+            self._next = time.ticks_add(now_ms, 2000)
+            return False
+        print(f"接收端 {self.addr[0]} 连续 {self.misses} 次未应答，回退到广播")
+        self.addr = self.fallback
+        self.sync_port = 0
+        self.misses = 0
+        self.fallbacks += 1
+        self._attempt = 0
+        self._next = time.ticks_add(now_ms, 1000)
+        return True
+
+    def _ask(self, dest):
+        self.queries += 1
+        try:
+            self.sock.sendto(self._query, dest)
+            while True:
+                data, addr = self.sock.recvfrom(64)
+                if len(data) >= _ANNOUNCE_SIZE and data[:4] == ANNOUNCE_MAGIC:
+                    return addr[0], struct.unpack_from(_ANNOUNCE_FMT, data)
+        except OSError:
+            return None  # 超时或网络错误
+
+    def _on_reply(self, now_ms, ip, announce):
+        _, _, data_port, sync_port, lease_s = announce
+        self.misses = 0
+        self._attempt = 0
+        self.lease_ms = lease_s * 1000
+        # 租期过半时续约
+        self._next = time.ticks_add(now_ms, self.lease_ms // 2 if self.lease_ms else self.retry_ms)
+        self.sync_port = sync_port
+        addr = (ip, data_port)
+        if addr == self.addr:
+            return False
+        print(f"发现接收端 {ip}:{data_port}，改为单播发送")
+        self.addr = addr
+        self.found += 1
+        return True
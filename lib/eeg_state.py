@@ -0,0 +1,80 @@
+from array import array
+
+# 字段顺序与原 latest_eeg_data 保持一致
+FIELDS = ("dataReady", "Attention", "Meditation", "Alpha", "Beta", "Gamma")
+_JSON_TEMPLATE = '{"dataReady": %d, "Attention": %d, "Meditation": %d, "Alpha": %d, "Beta": %d, "Gamma": %d}'
+
+class EEGState:
+    """最新EEG数据的双缓冲状态记录：写入端无内存分配，读取端通过序列号获得一致快照，无需加锁"""
+
+    def __init__(self):
+        self._bufs = (array('B', bytes(6)), array('B', bytes(6)))
+        self._active = 0  # 当前对读取端可见的缓冲区
+        self.seq = 0  # 序列号，奇数表示正在发布
+        self.version = 0  # 内容变化次数，仅在数值改变时递增
+        self._json = (0, (_JSON_TEMPLATE % (0, 0, 0, 0, 0, 0)).encode('utf-8'))
+        self._bin = (0, bytes(6))
+
+    def update(self, frame):
+        """解析frame[17]、frame[23]、frame[29]、frame[32]和frame[34]并发布，数值不变时不递增版本"""
+        nxt = self._bufs[self._active ^ 1]
+        if frame[32] == 0x00 and frame[34] == 0x00:
+            nxt[0] = 0
+            nxt[1] = 0
+            nxt[2] = 0
+            nxt[3] = 0
+            nxt[4] = 0
+            nxt[5] = 0
+        else:
+            nxt[0] = 1
+            nxt[1] = frame[32]
+            nxt[2] = frame[34]
+            nxt[3] = min(frame[17], 100)
+            nxt[4] = min(frame[23], 100)
+            nxt[5] = min(frame[29], 100)
+        if nxt == self._bufs[self._active]:
+            return False
+        self.seq += 1
+        self._active ^= 1
+        self.version += 1
+        self.seq += 1
+        return True
+
+    def snapshot(self, out):
+        """把一致的快照复制到调用方提供的6字节数组中，返回对应版本号"""
+        while True:
+            seq = self.seq
+            if seq & 1:
+                continue
+            cur = self._bufs[self._active]
+            version = self.version
+            for i in range(6):
+                out[i] = cur[i]
+            if self.seq == seq:
+                return version
+
+    def as_dict(self):
+        """返回与原 latest_eeg_data 相同结构的字典"""
+        out = bytearray(6)
+        self.snapshot(out)
+        return {FIELDS[i]: out[i] for i in range(6)}
+
+    def json(self):
+        """返回UTF-8编码的JSON字节串，只在版本变化后重新序列化"""
+        cached = self._json
+        if cached[0] != self.version:
+            out = bytearray(6)
+            version = self.snapshot(out)
+            cached = (version, (_JSON_TEMPLATE % tuple(out)).encode('utf-8'))
+            self._json = cached
+        return cached[1]
+
+    def binary(self):
+        """返回6字节二进制快照（字段顺序同 FIELDS），只在版本变化后重新生成"""
+        cached = self._bin
+        if cached[0] != self.version:
+            out = bytearray(6)
+            version = self.snapshot(out)
+            cached = (version, bytes(out))
+            self._bin = cached
+        return cached[1]
@@ -0,0 +1,84 @@
+from array import array
+
+# 多帧EEG批量紧凑编码（版本1），与 Host/eegcodec.py 的解码器对应
+# 批次头: 'E' 'B' 版本(1B) 标志(1B) 帧数(2B小端) 基准时间戳ms(4B小端)
+# 每帧: [时间戳差值] + 11个值相对上一帧的差值，均为zigzag varint
+# 值顺序: 信号质量 frame[4], 8个频段功率, 专注度 frame[32], 放松度 frame[34]
+MAGIC = b'EB'
+VERSION = 1
+FLAG_TS = 0x01  # 每帧带时间戳差值
+HEADER_LEN = 10
+N_VALUES = 11
+_MAX_FRAME_BYTES = 5 + N_VALUES * 4  # 时间戳最多5字节，每个值差值最多4字节（25位）
+
+class BatchEncoder:
+    """批量编码器：缓冲区和上一帧数值全部预分配，add()不分配内存"""
+
+    def __init__(self, max_frames=32, with_ts=True):
+        self.max_frames = max_frames
+        self.flags = FLAG_TS if with_ts else 0
+        self._buf = bytearray(HEADER_LEN + max_frames * _MAX_FRAME_BYTES)
+        self._mv = memoryview(self._buf)
+        self._prev = array('l', [0] * N_VALUES)
+        self._cur = array('l', [0] * N_VALUES)
+        self.reset()
+
+    def reset(self, base_ts=0):
+        """开始新批次"""
+        buf = self._buf
+        buf[0] = 0x45  # 'E'
+        buf[1] = 0x42  # 'B'
+        buf[2] = VERSION
+        buf[3] = self.flags
+        base_ts &= 0xFFFFFFFF
+        for i in range(4):
+            buf[6 + i] = (base_ts >> (8 * i)) & 0xFF
+        self._prev_ts = base_ts
+        prev = self._prev
+        for i in range(N_VALUES):
+            prev[i] = 0
+        self.count = 0
+        self.pos = HEADER_LEN
+
+    def _put(self, v):
+        """写入一个zigzag varint"""
+        v = (v << 1) if v >= 0 else ((-v << 1) - 1)
+        buf = self._buf
+        pos = self.pos
+        while v >= 0x80:
+            buf[pos] = (v & 0x7F) | 0x80
+            v >>= 7
+            pos += 1
+        buf[pos] = v
+        self.pos = pos + 1
+
+    def add(self, frame, ts_ms=0):
+        """加入一帧36字节TGAM帧，批次已满时返回False"""
+        if self.count >= self.max_frames:
+            return False
+        cur = self._cur
+        cur[0] = frame[4]
+        for i in range(8):
+            j = 7 + i * 3
+            cur[1 + i] = (frame[j] << 16) | (frame[j + 1] << 8) | frame[j + 2]
+        cur[9] = frame[32]
+        cur[10] = frame[34]
+        if self.flags & FLAG_TS:
+            ts_ms &= 0xFFFFFFFF
+            self._put((ts_ms - self._prev_ts) & 0xFFFFFFFF)
+            self._prev_ts = ts_ms
+        prev = self._prev
+        for i in range(N_VALUES):
+            self._put(cur[i] - prev[i])
+            prev[i] = cur[i]
+        self.count += 1
+        return True
+
+    def full(self):
+        return self.count >= self.max_frames
+
+    def payload(self):
+        """写入帧数并返回编码结果的内存视图，在下次reset()前有效"""
+        self._buf[4] = self.count & 0xFF
+        self._buf[5] = self.count >> 8
+        return self._mv[:self.pos]
@@ -0,0 +1,50 @@
+from array import array
+from tgam import FRAME_LEN
+
+class FrameRing:
+    """单生产者/单消费者帧环形队列，槽位预分配，读写两端各自只修改自己的索引，无需加锁"""
+
+    def __init__(self, slots=32, frame_len=FRAME_LEN):
+        if slots & (slots - 1):
+            raise ValueError("slots 必须是2的幂")
+        self.slots = slots
+        self.frame_len = frame_len
+        self._mask = slots - 1
+        self._buf = bytearray(slots * frame_len)
+        self._mv = memoryview(self._buf)
+        self._ts = array('L', [0] * slots)  # 每个槽位的接收时间（ticks_us），用于延迟追踪
+        self.head = 0  # 写入计数，仅生产者线程修改
+        self.tail = 0  # 读取计数，仅消费者线程修改
+        self.dropped = 0  # 队列满时丢弃的帧数，仅生产者线程修改
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def push(self, src, off=0, ts=0):
+        """生产者：复制一帧到空闲槽位，队列满时丢弃新帧并返回False，永不阻塞"""
+        head = self.head
+        if head - self.tail >= self.slots:
+            self.dropped += 1
+            return False
+        start = (head & self._mask) * self.frame_len
+        self._mv[start:start + self.frame_len] = src[off:off + self.frame_len]
+        self._ts[head & self._mask] = ts
+        self.head = head + 1  # 数据写完后再发布索引
+        return True
+
+    def peek(self):
+        """消费者：返回最旧一帧的内存视图，队列为空时返回None；处理完后调用pop()"""
+        tail = self.tail
+        if tail == self.head:
+            return None
+        start = (tail & self._mask) * self.frame_len
+        return self._mv[start:start + self.frame_len]
+
+    def peek_ts(self):
+        """消费者：返回最旧一帧的接收时间"""
+        return self._ts[self.tail & self._mask]
+
+    def pop(self):
+        """消费者：释放peek()返回的槽位"""
+        if self.tail != self.head:
+            self.tail += 1
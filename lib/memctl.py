@@ -0,0 +1,137 @@
+import gc
+import time
+
+class MemoryManager:
+    """按主循环阶段记录堆分配，根据分配速率设置gc.threshold，并只在帧间空闲时执行垃圾回收"""
+
+    def __init__(self, min_threshold=4096, max_threshold=65536, headroom=4):
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.headroom = headroom  # 阈值 = 每次空闲间隔的分配量 × headroom
+        self.phases = {}  # 阶段名 -> [次数, 累计分配字节, 单次最大分配字节]
+        self._phase = None
+        self._free0 = 0
+        self._iter_free0 = gc.mem_free()
+        self.iterations = 0
+        self.alloc_rate = 0  # 每轮循环分配字节数（指数滑动平均）
+        self.alloc_since_gc = 0
+        self.threshold = min_threshold
+        self.gc_count = 0
+        self.auto_gc = 0  # 在阶段内部被触发的自动回收次数
+        self.pause_last_us = 0
+        self.pause_max_us = 0
+        self.pause_total_us = 0
+        self.largest_block = 0
+        gc.collect()
+        self._alloc_after_gc = gc.mem_alloc()
+        gc.threshold(self.threshold)
+
+    def begin(self, phase):
+        """开始记录一个阶段，阶段之间不嵌套"""
+        self._phase = phase
+        self._free0 = gc.mem_free()
+
+    def end(self):
+        """结束当前阶段并累计该阶段的分配量"""
+        delta = self._free0 - gc.mem_free()
+        if delta < 0:
+            self.auto_gc += 1  # 可用内存变多说明阶段内发生了自动回收
+            delta = 0
+        rec = self.phases.get(self._phase)
+        if rec is None:
+            rec = [0, 0, 0]
+            self.phases[self._phase] = rec
+        rec[0] += 1
+        rec[1] += delta
+        if delta > rec[2]:
+            rec[2] = delta
+        self._phase = None
+
+    def end_iteration(self):
+        """一轮主循环结束，更新分配速率"""
+        free = gc.mem_free()
+        delta = self._iter_free0 - free
+        if delta > 0:
+            self.alloc_since_gc += delta
+            self.alloc_rate += (delta - self.alloc_rate) >> 3
+        self._iter_free0 = free
+        self.iterations += 1
+
+    def idle(self, force=False):
+        """在帧间空闲窗口调用：分配量接近阈值时主动回收，并按测得的分配量重新设置阈值"""
+        self.end_iteration()
+        if not force and gc.mem_alloc() - self._alloc_after_gc < (self.threshold >> 1):
+            return False
+        t0 = time.ticks_us()
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), t0)
+        self.gc_count += 1
+        self.pause_last_us = pause
+        self.pause_total_us += pause
+        if pause > self.pause_max_us:
+            self.pause_max_us = pause
+        self._alloc_after_gc = gc.mem_alloc()
+        self._iter_free0 = gc.mem_free()
+        self._retune()
+        self.alloc_since_gc = 0
+        return True
+
+    def _retune(self):
+        """阈值取两次空闲回收之间分配量的若干倍，保证自动回收不会在帧处理中途触发"""
+        target = self.alloc_since_gc * self.headroom
+        limit = gc.mem_free() >> 1
+        if target > limit:
+            target = limit
+        if target > self.max_threshold:
+            target = self.max_threshold
+        if target < self.min_threshold:
+            target = self.min_threshold
+        if target != self.threshold:
+            self.threshold = target
+            gc.threshold(target)
+
+    def probe_largest_block(self):
+        """二分探测可分配的最大连续内存块，用于估算碎片率；探测会分配内存，只应在空闲时调用"""
+        lo, hi = 0, gc.mem_free()
+        while hi - lo > 64:
+            mid = (lo + hi) >> 1
+            try:
+                b = bytearray(mid)
+                del b
+                lo = mid
+            except MemoryError:
+                hi = mid
+        gc.collect()
+        self._alloc_after_gc = gc.mem_alloc()
+        self.largest_block = lo
+        return lo
+
+    def stats(self):
+        """返回诊断信息字典"""
+        free = gc.mem_free()
+        frag = 0
+        if free and self.largest_block:
+            frag = 100 - self.largest_block * 100 // free
+        return {
+            "free": free,
+            "alloc": gc.mem_alloc(),
+            "threshold": self.threshold,
+            "alloc_rate": self.alloc_rate,
+            "gc_count": self.gc_count,
+            "auto_gc": self.auto_gc,
+            "pause_last_us": self.pause_last_us,
+            "pause_max_us": self.pause_max_us,
+            "pause_avg_us": self.pause_total_us // self.gc_count if self.gc_count else 0,
+            "largest_block": self.largest_block,
+            "fragmentation": frag,
+            "phases": self.phases,
+        }
+
+    def report(self):
+        """通过串口打印诊断信息"""
+        self.probe_largest_block()
+        s = self.stats()
+        print(f"内存: 可用 {s['free']} 字节, 已分配 {s['alloc']} 字节, 阈值 {s['threshold']} 字节, 碎片率 {s['fragmentation']}%")
+        print(f"GC: {s['gc_count']} 次, 阶段内自动回收 {s['auto_gc']} 次, 停顿 最近 {s['pause_last_us']}us / 平均 {s['pause_avg_us']}us / 最大 {s['pause_max_us']}us")
+        for name, rec in self.phases.items():
+            print(f"  阶段 {name}: {rec[0]} 次, 平均分配 {rec[1] // rec[0] if rec[0] else 0} 字节, 最大 {rec[2]} 字节")
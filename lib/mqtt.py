@@ -0,0 +1,192 @@
+from array import array
+import time
+import uselect
+import usocket
+
+# MQTT 3.1.1 QoS1 发布客户端，测试用代理见 Host/mqtt_broker.py
+# 持久会话（clean_session=0）：断线重连后按原顺序重发所有未确认的PUBLISH（置DUP标志）
+
+class MQTTClient:
+    """在途窗口中每个槽位预先分配完整PUBLISH报文的缓冲区，发布时只复制负载，重发时直接使用原报文"""
+
+    def __init__(self, client_id, host, port=1883, keepalive=60, window=8, max_packet=1024, timeout=5,
+                 ack_timeout_ms=10000):
+        self.client_id = client_id
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.window = window
+        self.timeout = timeout
+        self.ack_timeout_ms = ack_timeout_ms  # 最旧的消息超过该时间未确认时视为连接失效并重连
+        self._slots = [bytearray(max_packet) for _ in range(window)]
+        self._len = array('H', [0] * window)
+        self._pid = array('H', [0] * window)  # 0 表示已确认
+        self._sent = array('L', [0] * window)
+        self.head = 0  # 发布计数
+        self.tail = 0  # 最旧的未确认消息
+        self._next_pid = 1
+        self._rx = bytearray(64)
+        self._rx_len = 0
+        self.sock = None
+        self._poll = None
+        self._last_tx = 0
+        self._retry_at = 0
+        self.connects = 0
+        self.published = 0
+        self.acked = 0
+        self.redelivered = 0
+        self.errors = 0
+
+    @property
+    def inflight(self):
+        return self.head - self.tail
+
+    def connected(self):
+        return self.sock is not None
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self._poll = None
+        self._rx_len = 0
+
+    def connect(self):
+        """建立连接并发送CONNECT（clean_session=0），随后按顺序重发在途消息"""
+        self.close()
+        cid = self.client_id.encode()
+        var = b'\x00\x04MQTT\x04\x00' + bytes((self.keepalive >> 8, self.keepalive & 0xFF))
+        body = var + bytes((len(cid) >> 8, len(cid) & 0xFF)) + cid
+        sock = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(usocket.getaddrinfo(self.host, self.port)[0][-1])
+            sock.write(bytes((0x10, len(body))) + body)
+            ack = sock.read(4)
+        except OSError:
+            sock.close()
+            raise
+        if not ack or len(ack) < 4 or ack[0] != 0x20 or ack[3] != 0:
+            sock.close()
+            raise OSError("CONNACK错误: %s" % ack)
+        self.sock = sock
+        self._poll = uselect.poll()
+        self._poll.register(sock, uselect.POLLIN)
+        self.connects += 1
+        now = time.ticks_ms()
+        self._last_tx = now
+        for i in range(self.tail, self.head):
+            k = i % self.window
+            if self._pid[k]:
+                self._slots[k][0] |= 0x08  # DUP
+                sock.write(memoryview(self._slots[k])[:self._len[k]])
+                self._sent[k] = now
+                self.redelivered += 1
+        return ack[2] & 1  # 服务端是否保留了会话
+
+    def publish(self, topic, payload):
+        """以QoS1发布，窗口已满或未连接时返回False，调用方保留数据稍后再试"""
+        if self.sock is None or self.head - self.tail >= self.window:
+            return False
+        k = self.head % self.window
+        buf = self._slots[k]
+        t = topic.encode() if isinstance(topic, str) else topic
+        n = len(payload)
+        remaining = 2 + len(t) + 2 + n
+        pid = self._next_pid
+        self._next_pid = pid % 65535 + 1
+        buf[0] = 0x32  # PUBLISH, QoS1
+        pos = 1
+        while True:
+            b = remaining & 0x7F
+            remaining >>= 7
+            buf[pos] = b | 0x80 if remaining else b
+            pos += 1
+            if not remaining:
+                break
+        buf[pos] = len(t) >> 8
+        buf[pos + 1] = len(t) & 0xFF
+        pos += 2
+        buf[pos:pos + len(t)] = t
+        pos += len(t)
+        buf[pos] = pid >> 8
+        buf[pos + 1] = pid & 0xFF
+        pos += 2
+        if pos + n > len(buf):
+            raise ValueError("报文超过 max_packet")
+        buf[pos:pos + n] = payload
+        self._len[k] = pos + n
+        self._pid[k] = pid
+        self.head += 1
+        self.published += 1
+        try:
+            self.sock.write(memoryview(buf)[:pos + n])
+            self._sent[k] = self._last_tx = time.ticks_ms()
+        except OSError:
+            self.errors += 1
+            self.close()  # 消息留在窗口中，重连后重发
+        return True
+
+    def poll(self, now_ms=None):
+        """主循环中调用：读取PUBACK、按需发送PINGREQ，连接断开或确认超时时按间隔重连"""
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        if self.sock is None:
+            if time.ticks_diff(now_ms, self._retry_at) >= 0:
+                self._retry_at = time.ticks_add(now_ms, 5000)
+                try:
+                    self.connect()
+                except OSError as e:
+                    self.errors += 1
+                    print(f"MQTT连接失败: {e}")
+            return
+        try:
+            while self._poll.poll(0):
+                data = self.sock.recv(len(self._rx) - self._rx_len)
+                if not data:
+                    raise OSError("连接已关闭")
+                self._rx[self._rx_len:self._rx_len + len(data)] = data
+                self._rx_len += len(data)
+                self._parse()
+            if self.inflight and time.ticks_diff(now_ms, self._sent[self.tail % self.window]) > self.ack_timeout_ms:
+                raise OSError("PUBACK超时")
+            if time.ticks_diff(now_ms, self._last_tx) >= self.keepalive * 500:
+                self.sock.write(b'\xc0\x00')  # PINGREQ
+                self._last_tx = now_ms
+        except OSError as e:
+            print(f"MQTT连接断开: {e}")
+            self.errors += 1
+            self.close()
+
+    def _parse(self):
+        """处理接收缓冲区中完整的报文（PUBACK、PINGRESP，其他类型跳过）"""
+        rx = self._rx
+        pos = 0
+        while self._rx_len - pos >= 2:
+            kind = rx[pos] & 0xF0
+            n = rx[pos + 1]
+            if n & 0x80 or self._rx_len - pos < 2 + n:
+                break  # 不完整（客户端不订阅，不会收到长报文）
+            if kind == 0x40 and n == 2:
+                self._ack((rx[pos + 2] << 8) | rx[pos + 3])
+            pos += 2 + n
+        if pos:
+            rx[:self._rx_len - pos] = rx[pos:self._rx_len]
+            self._rx_len -= pos
+
+    def _ack(self, pid):
+        for i in range(self.tail, self.head):
+            k = i % self.window
+            if self._pid[k] == pid:
+                self._pid[k] = 0
+                self.acked += 1
+                break
+        # 按顺序释放已确认的槽位
+        while self.tail < self.head and self._pid[self.tail % self.window] == 0:
+            self.tail += 1
+
+    def stats(self):
+        return {"connects": self.connects, "published": self.published, "acked": self.acked,
+                "inflight": self.inflight, "redelivered": self.redelivered, "errors": self.errors}
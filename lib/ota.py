@@ -0,0 +1,274 @@
+import os
+import ubinascii
+import uhashlib
+import ujson
+import usocket
+
+# 局域网OTA更新，服务端见 Host/ota_server.py
+# 1. GET /ota/manifest（带上次版本的 If-None-Match，未变化时304）: 各文件的大小和sha256
+# 2. 对内容变化的文件 GET /ota/blocks?path=: 每块（4096字节）sha256前8字节
+# 3. 本地旧文件中哈希相同的块直接复制，其余块合并成若干 Range 请求下载，边下载边写入 <路径>.ota 并计算sha256
+# 4. 全部文件校验通过后写入日志 /ota.pending，逐个重命名覆盖，最后更新 /ota.json 并删除日志；
+#    重命名过程中断电时，下次启动调用 recover() 完成剩余的重命名
+STATE_FILE = "/ota.json"
+JOURNAL = "/ota.pending"
+TMP_SUFFIX = ".ota"
+DIGEST = 8
+
+def _size(path):
+    try:
+        return os.stat(path)[6]
+    except OSError:
+        return -1
+
+def _replace(src, dst):
+    """重命名覆盖；LittleFS可直接覆盖，FAT需先删除目标文件"""
+    try:
+        os.rename(src, dst)
+    except OSError:
+        os.remove(dst)
+        os.rename(src, dst)
+
+def _write_atomic(path, data):
+    with open(path + TMP_SUFFIX, "w") as f:
+        f.write(data)
+    _replace(path + TMP_SUFFIX, path)
+
+def _makedirs(path):
+    d = path[:path.rfind("/")]
+    if d and _size(d) < 0:
+        _makedirs(d)
+        os.mkdir(d)
+
+def recover():
+    """完成上次中断的提交：日志中列出的文件若仍有 .ota 临时文件则重命名，返回完成的文件数"""
+    try:
+        with open(JOURNAL) as f:
+            paths = f.read().split("\n")
+    except OSError:
+        return 0
+    n = 0
+    for path in paths:
+        if path and _size(path + TMP_SUFFIX) >= 0:
+            _replace(path + TMP_SUFFIX, path)
+            n += 1
+    os.remove(JOURNAL)
+    print(f"OTA: 完成上次中断的更新 {n} 个文件")
+    return n
+
+def load_state():
+    try:
+        with open(STATE_FILE) as f:
+            return ujson.load(f)
+    except (OSError, ValueError):
+        return {"version": None, "files": {}}
+
+class OtaClient:
+    """增量更新客户端：HTTP/1.1长连接，固定大小的缓冲区流式写入flash，不需要把文件读入内存"""
+
+    def __init__(self, host, port=9003, chunk=2048, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._buf = bytearray(chunk)
+        self._mv = memoryview(self._buf)
+        self.sock = None
+        self.requests = 0
+        self.downloaded = 0  # 响应体字节数（清单、块哈希和文件内容）
+        self.copied = 0  # 从本地旧文件复制的字节数
+        self.updated = []
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _open(self, path, rng=None, etag=None):
+        """发送GET请求并读取响应头，返回 (状态码, Content-Length)；复用连接失败时重连一次"""
+        req = "GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n" % (path, self.host)
+        if rng:
+            req += "Range: bytes=%d-%d\r\n" % rng
+        if etag:
+            req += "If-None-Match: \"%s\"\r\n" % etag
+        req = (req + "\r\n").encode()
+        for attempt in (0, 1):
+            try:
+                if self.sock is None:
+                    sock = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
+                    sock.settimeout(self.timeout)
+                    sock.connect(usocket.getaddrinfo(self.host, self.port)[0][-1])
+                    self.sock = sock
+                self.sock.write(req)
+                status = int(self.sock.readline().split(None, 2)[1])
+                length = 0
+                while True:
+                    line = self.sock.readline()
+                    if not line or line == b"\r\n":
+                        break
+                    if line[:15].lower() == b"content-length:":
+                        length = int(line[15:])
+                self.requests += 1
+                return status, length
+            except (OSError, ValueError, IndexError):
+                self.close()
+                if attempt:
+                    raise OSError("OTA请求失败: " + path)
+
+    def _read(self, n):
+        """读取整个响应体（清单、块哈希这类小内容）"""
+        out = bytearray(n)
+        mv = memoryview(out)
+        got = 0
+        while got < n:
+            k = self.sock.readinto(mv[got:])
+            if not k:
+                raise OSError("连接中断")
+            got += k
+        self.downloaded += n
+        return out
+
+    def _stream(self, n, out, h):
+        """把响应体分块写入文件并更新哈希"""
+        buf, mv = self._buf, self._mv
+        while n > 0:
+            k = self.sock.readinto(mv[:min(n, len(buf))])
+            if not k:
+                raise OSError("连接中断")
+            out.write(mv[:k])
+            h.update(mv[:k])
+            n -= k
+            self.downloaded += k
+
+    def _copy(self, src, off, n, out, h):
+        buf, mv = self._buf, self._mv
+        src.seek(off)
+        while n > 0:
+            k = src.readinto(mv[:min(n, len(buf))])
+            if not k:
+                raise OSError("旧文件长度不足")
+            out.write(mv[:k])
+            h.update(mv[:k])
+            n -= k
+            self.copied += k
+
+    def _block_digest(self, f, n):
+        """从文件当前位置读取n字节，返回sha256前8字节"""
+        h = uhashlib.sha256()
+        mv = self._mv
+        while n > 0:
+            k = f.readinto(mv[:min(n, len(mv))])
+            if not k:
+                break
+            h.update(mv[:k])
+            n -= k
+        return h.digest()[:DIGEST]
+
+    def _file_sha256(self, path):
+        h = uhashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                k = f.readinto(self._buf)
+                if not k:
+                    break
+                h.update(self._mv[:k])
+        return ubinascii.hexlify(h.digest()).decode()
+
+    def check(self, state):
+        """获取清单，返回 (清单, [(路径, 大小, sha256)] 需要更新的文件)；版本未变化时清单为None"""
+        status, n = self._open("/ota/manifest", etag=state["version"])
+        if status == 304:
+            self._read(n)
+            return None, []
+        if status != 200:
+            self._read(n)
+            raise OSError("清单请求失败: %d" % status)
+        manifest = ujson.loads(self._read(n))
+        changed = []
+        for path, (size, sha) in manifest["files"].items():
+            if _size(path) == size and (state["files"].get(path) == sha or self._file_sha256(path) == sha):
+                state["files"][path] = sha  # 首次运行时记录已有文件的哈希，以后不再读取
+                continue
+            changed.append((path, size, sha))
+        return manifest, changed
+
+    def fetch(self, path, size, sha, block):
+        """下载一个文件到 <路径>.ota：旧文件中相同的块直接复制，其余块按连续区间发出Range请求"""
+        status, n = self._open("/ota/blocks?path=" + path)
+        if status != 200:
+            self._read(n)
+            raise OSError("块哈希请求失败: %s" % path)
+        remote = self._read(n)
+        old = None
+        local = {}
+        old_size = _size(path)
+        if old_size > 0:
+            # 旧文件的块哈希 -> 偏移，块整体移动时也能复用
+            old = open(path, "rb")
+            for off in range(0, old_size, block):
+                d = self._block_digest(old, block)
+                if d not in local:
+                    local[d] = off
+        h = uhashlib.sha256()
+        _makedirs(path)
+        try:
+            with open(path + TMP_SUFFIX, "wb") as out:
+                nblocks = len(remote) // DIGEST
+                i = 0
+                while i < nblocks:
+                    src = local.get(bytes(remote[i * DIGEST:(i + 1) * DIGEST]))
+                    start = i * block
+                    if src is not None:
+                        self._copy(old, src, min(block, size - start), out, h)
+                        i += 1
+                        continue
+                    # 合并连续的需要下载的块
+                    j = i + 1
+                    while j < nblocks and bytes(remote[j * DIGEST:(j + 1) * DIGEST]) not in local:
+                        j += 1
+                    end = min(j * block, size) - 1
+                    status, n = self._open("/ota/file?path=" + path, rng=(start, end))
+                    if status != 206 or n != end - start + 1:
+                        self._read(n)
+                        raise OSError("Range请求失败: %s %d" % (path, status))
+                    self._stream(n, out, h)
+                    i = j
+        finally:
+            if old:
+                old.close()
+        if ubinascii.hexlify(h.digest()).decode() != sha:
+            os.remove(path + TMP_SUFFIX)
+            raise OSError("校验失败: " + path)
+
+    def update(self):
+        """检查并应用更新，返回更新的文件列表；任何文件下载或校验失败时不替换任何文件"""
+        state = load_state()
+        manifest, changed = self.check(state)
+        if manifest is None:
+            return []
+        staged = []
+        try:
+            for path, size, sha in changed:
+                staged.append(path)
+                self.fetch(path, size, sha, manifest["block"])
+        except OSError:
+            for path in staged:
+                if _size(path + TMP_SUFFIX) >= 0:
+                    os.remove(path + TMP_SUFFIX)
+            raise
+        finally:
+            self.close()
+        if staged:
+            _write_atomic(JOURNAL, "\n".join(staged))
+            for path in staged:
+                _replace(path + TMP_SUFFIX, path)
+        for path, size, sha in changed:
+            state["files"][path] = sha
+        state["version"] = manifest["version"]
+        _write_atomic(STATE_FILE, ujson.dumps(state))
+        if staged:
+            os.remove(JOURNAL)
+        self.updated = staged
+        return staged
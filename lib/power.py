@@ -0,0 +1,270 @@
+from array import array
+import time
+import network
+import usocket
+
+# 电流模型（mA），与 Host/battery.py 对应；数值取自ESP32-S3数据手册典型值和本板实测量级，用于估算而非计量
+CURRENT_BASE = 30  # CPU 160MHz运行主循环
+CURRENT_BOARD = 30  # TGAM约15mA、常亮蓝灯约12mA、功放静态约3mA
+CURRENT_RADIO = {"none": 70, "performance": 12, "powersave": 3, "connect": 90, "off": 0}  # 射频各状态的平均附加电流
+CURRENT_TX = 250  # 发射期间的附加电流
+TX_TAIL_MS = 20  # 每次发送后射频保持接收的时间
+BCAST_MBPS = 1  # 广播帧以基本速率发送
+UCAST_MBPS = 54  # 单播帧的典型速率
+MAC_OVERHEAD = 70  # 802.11 MAC/LLC + IP/UDP 头部字节数
+
+_PM = {"none": getattr(network.WLAN, "PM_NONE", 0), "performance": getattr(network.WLAN, "PM_PERFORMANCE", 1),
+       "powersave": getattr(network.WLAN, "PM_POWERSAVE", 2)}
+
+def airtime_us(nbytes, broadcast=True):
+    """一个UDP数据报的空口时间估算：前导码、帧间隔和退避，单播另加ACK"""
+    if broadcast:
+        return 192 + 50 + (nbytes + MAC_OVERHEAD) * 8 // BCAST_MBPS
+    return 20 + 34 + 67 + (nbytes + MAC_OVERHEAD) * 8 // UCAST_MBPS + 10 + 44
+
+class PowerModel:
+    """按射频状态累计时间和发射空口时间，估算平均电流和电池续航"""
+
+    def __init__(self, battery_mah=1000, radio="performance"):
+        self.battery_mah = battery_mah
+        self.radio = radio  # 当前射频状态，见 CURRENT_RADIO
+        self.state_ms = {k: 0 for k in CURRENT_RADIO}
+        self._since = time.ticks_ms()
+        self.tx_us = 0
+        self.tail_ms = 0
+        self.tx_packets = 0
+        self.tx_bytes = 0
+
+    def set_radio(self, state, now_ms=None):
+        """切换射频状态，之前状态的时间计入统计"""
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        self.state_ms[self.radio] += time.ticks_diff(now_ms, self._since)
+        self._since = now_ms
+        self.radio = state
+
+    def tx(self, nbytes, broadcast=True):
+        """记录一次发送"""
+        self.tx_us += airtime_us(nbytes, broadcast)
+        if self.radio != "none":
+            self.tail_ms += TX_TAIL_MS  # 省电状态下发送后射频短暂保持接收
+        self.tx_packets += 1
+        self.tx_bytes += nbytes
+
+    def totals(self):
+        """返回 (总时间ms, 射频开启时间ms, 平均电流mA)"""
+        self.set_radio(self.radio)
+        total = sum(self.state_ms.values())
+        if total <= 0:
+            return 0, 0, 0.0
+        charge = total * (CURRENT_BASE + CURRENT_BOARD) + self.tx_us * CURRENT_TX / 1000
+        charge += self.tail_ms * CURRENT_RADIO["none"]
+        for k, ms in self.state_ms.items():
+            charge += ms * CURRENT_RADIO[k]
+        on = self.state_ms["none"] + self.state_ms["connect"] + self.tail_ms + self.tx_us // 1000
+        return total, on, charge / total
+
+    def stats(self):
+        total, on, avg_ma = self.totals()
+        return {"ms": total, "radio_on_ms": on, "state_ms": self.state_ms, "tx_us": self.tx_us, "tail_ms": self.tail_ms,
+                "tx_packets": self.tx_packets, "tx_bytes": self.tx_bytes, "avg_ma": round(avg_ma, 1),
+                "hours": round(self.battery_mah / avg_ma, 1) if avg_ma else 0}
+
+class BurstUplink:
+    """突发上行：记录先存入预分配缓冲区，每隔interval_ms开启射频一次性发出，其余时间射频处于modem sleep或关闭"""
+
+    def __init__(self, interval_ms=10000, capacity=16384, max_records=256, addr=("255.255.255.255", 9003),
+                 radio_off=False, power=None, mtu=1400):
+        self.interval_ms = interval_ms
+        self.addr = addr
+        self.radio_off = radio_off  # True: 两次突发之间关闭WiFi，适合分钟级间隔
+        self.power = power
+        self._buf = bytearray(capacity)
+        self._mv = memoryview(self._buf)
+        self._len = array('H', [0] * max_records)
+        self._ticks = array('L', [0] * max_records)  # 每条记录存入时的 ticks_ms，发送时换算为age
+        self._n = 0
+        self._used = 0
+        self._dgram = bytearray(mtu)
+        self._last = time.ticks_ms()
+        self.wlan = network.WLAN(network.STA_IF)
+        self.records = 0
+        self.bursts = 0
+        self.datagrams = 0
+        self.bytes = 0
+        self.last_burst_bytes = 0
+        self.max_burst_bytes = 0
+        self.radio_on_ms = 0  # 每次突发从开启射频到发送完成的时间
+        self.last_burst_ms = 0
+        self.early = 0  # 缓冲区满而提前发送的次数
+        self.dropped = 0
+        self.failures = 0
+        self._failed = False  # 上次发送失败：到下一次突发间隔前缓冲区满时直接丢弃新记录，不再开启射频
+        self._done = 0  # 本次发送中已发出的记录数和字节数，失败时只保留之后的记录
+        self._done_off = 0
+        self._sleep()
+
+    def _sleep(self):
+        if self.radio_off:
+            self.wlan.active(False)
+            state = "off"
+        else:
+            self.wlan.config(pm=_PM["powersave"])
+            state = "powersave"
+        if self.power:
+            self.power.set_radio(state)
+
+    def _wake(self, timeout_ms=8000):
+        """开启射频，关闭模式下重新连接上次的热点，返回是否可发送"""
+        if not self.radio_off:
+            self.wlan.config(pm=_PM["none"])
+            if self.power:
+                self.power.set_radio("none")
+            return True
+        if self.power:
+            self.power.set_radio("connect")
+        self.wlan.active(True)
+        self.wlan.connect()
+        t0 = time.ticks_ms()
+        while not self.wlan.isconnected():
+            if time.ticks_diff(time.ticks_ms(), t0) > timeout_ms:
+                return False
+            time.sleep_ms(20)
+        if self.power:
+            self.power.set_radio("none")
+        return True
+
+    def add(self, payload, now_ms=None):
+        """存入一条JSON记录（以 } 结尾），缓冲区满时先发送已有记录；上次发送失败后到下一次突发间隔前直接丢弃"""
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        n = len(payload)
+        if self._used + n > len(self._buf) or self._n == len(self._len):
+            if self._failed and not self.due(now_ms):
+                self.dropped += 1  # 例如热点不可用：每帧都重试会让主循环每次等待连接超时
+                return False
+            self.early += 1
+            self.flush(now_ms)
+            if self._used + n > len(self._buf) or self._n == len(self._len):
+                self.dropped += 1  # 发送失败且缓冲区仍满
+                return False
+        self._mv[self._used:self._used + n] = payload
+        self._len[self._n] = n
+        self._ticks[self._n] = now_ms
+        self._n += 1
+        self._used += n
+        self.records += 1
+        return True
+
+    def due(self, now_ms):
+        return self._n and time.ticks_diff(now_ms, self._last) >= self.interval_ms
+
+    def poll(self, now_ms=None):
+        """主循环中调用，到达突发间隔时发送"""
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        if self.due(now_ms):
+            self.flush(now_ms)
+
+    def flush(self, now_ms=None):
+        """开启射频，把缓冲的记录按换行分隔打包成不超过MTU的数据报发出，每条记录末尾追加age（毫秒）"""
+        now_ms = time.ticks_ms() if now_ms is None else now_ms
+        self._last = now_ms
+        if not self._n:
+            return True
+        t0 = time.ticks_ms()
+        ok = False
+        sock = None
+        sent = 0
+        self._done = self._done_off = 0
+        try:
+            if self._wake():
+                sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+                if self.addr[0] == "255.255.255.255":
+                    sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_BROADCAST, 1)
+                sent = self._send_all(sock, now_ms)
+                ok = True
+        except OSError as e:
+            print(f"突发发送失败: {e}")
+        finally:
+            if sock:
+                sock.close()
+            self._sleep()
+        on = time.ticks_diff(time.ticks_ms(), t0)
+        self.radio_on_ms += on
+        self.last_burst_ms = on
+        self._discard(self._done, self._done_off)  # 已发出的数据报中的记录不再重发
+        self._failed = not ok
+        if not ok:
+            self.failures += 1
+            return False
+        self.bursts += 1
+        self.bytes += sent
+        self.last_burst_bytes = sent
+        if sent > self.max_burst_bytes:
+            self.max_burst_bytes = sent
+        return True
+
+    def _discard(self, k, off):
+        """丢弃前k条记录（共off字节），其余记录移到缓冲区开头"""
+        if not k:
+            return
+        if k == self._n:
+            self._n = 0
+            self._used = 0
+            return
+        rest = self._used - off
+        pos = 0
+        while pos < rest:
+            m = min(off, rest - pos)  # 每段不超过off字节，源和目标不重叠
+            self._mv[pos:pos + m] = self._mv[off + pos:off + pos + m]
+            pos += m
+        for i in range(k, self._n):
+            self._len[i - k] = self._len[i]
+            self._ticks[i - k] = self._ticks[i]
+        self._n -= k
+        self._used = rest
+
+    def _send_all(self, sock, now_ms):
+        d = self._dgram
+        mtu = len(d)
+        fill = 0
+        off = 0
+        sent = 0
+        broadcast = self.addr[0] == "255.255.255.255"
+        for i in range(self._n):
+            n = self._len[i]
+            suffix = (', "age": %d}' % time.ticks_diff(now_ms, self._ticks[i])).encode()
+            size = n - 1 + len(suffix)
+            if fill and fill + 1 + size > mtu:
+                sock.sendto(memoryview(d)[:fill], self.addr)
+                self._done, self._done_off = i, off
+                sent += fill
+                self.datagrams += 1
+                if self.power:
+                    self.power.tx(fill, broadcast)
+                fill = 0
+            if size > mtu:
+                off += n  # 单条超过MTU的记录直接跳过（此时数据报为空）
+                self._done, self._done_off = i + 1, off
+                self.dropped += 1
+                continue
+            if fill:
+                d[fill] = 0x0A  # 换行分隔
+                fill += 1
+            d[fill:fill + n - 1] = self._mv[off:off + n - 1]
+            fill += n - 1
+            d[fill:fill + len(suffix)] = suffix
+            fill += len(suffix)
+            off += n
+        if fill:
+            sock.sendto(memoryview(d)[:fill], self.addr)
+            self._done, self._done_off = self._n, off
+            sent += fill
+            self.datagrams += 1
+            if self.power:
+                self.power.tx(fill, broadcast)
+        return sent
+
+    def stats(self):
+        return {"records": self.records, "bursts": self.bursts, "datagrams": self.datagrams, "bytes": self.bytes,
+                "last_burst_bytes": self.last_burst_bytes, "max_burst_bytes": self.max_burst_bytes,
+                "radio_on_ms": self.radio_on_ms, "last_burst_ms": self.last_burst_ms, "early": self.early,
+                "dropped": self.dropped, "failures": self.failures, "buffered": self._n}
@@ -0,0 +1,198 @@
+import time
+import ujson
+import usocket
+from array import array
+
+# 主循环分阶段耗时统计与看门狗，与 Client/main.py 的 LOOP_BUDGET_MS、WDT_TIMEOUT_MS、PROFILE_PORT 对应
+# 直方图为固定的2的幂桶：第0桶 <64us，第k桶 [64<<(k-1), 64<<k)us，最后一桶为 >=64<<(BUCKETS-2)us（约4.2秒）
+BUCKETS = 18
+BASE_US = 64
+
+def bucket(us):
+    """耗时所在的桶号，只用移位，不分配内存"""
+    d = us // BASE_US
+    b = 0
+    while d and b < BUCKETS - 1:
+        d >>= 1
+        b += 1
+    return b
+
+def bucket_upper_us(b):
+    """第b桶的上界（us），最后一桶没有上界，返回 -1"""
+    return BASE_US << b if b < BUCKETS - 1 else -1
+
+class Profiler:
+    """t = start(); ...; stop("阶段", t) 记录一段耗时，阶段可以嵌套；end_iteration() 在每轮主循环末尾调用，
+    整轮耗时不超过预算时才喂硬件看门狗，连续超预算（主循环卡死或长时间阻塞）达到看门狗超时后复位"""
+
+    def __init__(self, budget_ms=5000):
+        self.budget_us = budget_ms * 1000
+        self.phases = {}  # 阶段名 -> [次数, 累计us, 最大us, 直方图]
+        self.loop = [0, 0, 0, array('I', [0] * BUCKETS)]  # 整轮循环
+        self.overruns = 0  # 超过预算（未喂狗）的轮数
+        self.max_stall_us = 0  # 最长的一轮
+        self.stall_phase = None  # 最长一轮中耗时最长的非外层阶段
+        self.stall_phase_us = 0
+        self.stall_ms = 0  # 最长一轮结束时的 ticks_ms
+        self._iter_t0 = time.ticks_us()
+        self._iter_worst = None
+        self._iter_worst_us = 0
+        self.wdt = None
+        self.feeds = 0
+
+    def watchdog(self, timeout_ms):
+        """启动硬件看门狗（启动后不能停止），应在进入主循环前、启动阶段的阻塞操作之后调用"""
+        from machine import WDT
+        self.wdt = WDT(timeout=timeout_ms)
+        self.wdt.feed()
+
+    def start(self):
+        return time.ticks_us()
+
+    def stop(self, name, t0, outer=False):
+        """记录从 t0 到现在的耗时；outer=True 表示包含其他阶段的外层阶段，不参与卡顿归因"""
+        us = time.ticks_diff(time.ticks_us(), t0)
+        rec = self.phases.get(name)
+        if rec is None:
+            rec = [0, 0, 0, array('I', [0] * BUCKETS)]
+            self.phases[name] = rec
+        self._add(rec, us)
+        if not outer and us > self._iter_worst_us:
+            self._iter_worst = name
+            self._iter_worst_us = us
+        return us
+
+    def _add(self, rec, us):
+        rec[0] += 1
+        rec[1] += us
+        if us > rec[2]:
+            rec[2] = us
+        rec[3][bucket(us)] += 1
+
+    def end_iteration(self):
+        """一轮主循环结束：记录整轮耗时，不超过预算时喂狗；返回本轮耗时"""
+        now = time.ticks_us()
+        us = time.ticks_diff(now, self._iter_t0)
+        self._iter_t0 = now
+        self._add(self.loop, us)
+        if us > self.max_stall_us:
+            self.max_stall_us = us
+            self.stall_phase = self._iter_worst
+            self.stall_phase_us = self._iter_worst_us
+            self.stall_ms = time.ticks_ms()
+        self._iter_worst = None
+        self._iter_worst_us = 0
+        if us > self.budget_us:
+            self.overruns += 1
+        elif self.wdt is not None:
+            self.wdt.feed()
+            self.feeds += 1
+        return us
+
+    def reset(self):
+        """清零统计并从现在开始计算本轮耗时（看门狗状态不变）"""
+        for rec in self.phases.values():
+            self._clear(rec)
+        self._clear(self.loop)
+        self.overruns = 0
+        self.max_stall_us = 0
+        self.stall_phase = None
+        self.stall_phase_us = 0
+        self._iter_t0 = time.ticks_us()
+        self._iter_worst = None
+        self._iter_worst_us = 0
+
+    def _clear(self, rec):
+        rec[0] = rec[1] = rec[2] = 0
+        h = rec[3]
+        for i in range(BUCKETS):
+            h[i] = 0
+
+    @staticmethod
+    def percentile(hist, count, q):
+        """按直方图估算分位数，返回所在桶的上界（us），落在最后一桶时返回 -1"""
+        if not count:
+            return 0
+        need = count * q
+        acc = 0
+        for b in range(BUCKETS):
+            acc += hist[b]
+            if acc >= need:
+                return bucket_upper_us(b)
+        return -1
+
+    def _summary(self, rec):
+        n, total, mx, h = rec
+        return {"n": n, "avg_us": total // n if n else 0, "max_us": mx,
+                "p50_us": self.percentile(h, n, 0.5), "p99_us": self.percentile(h, n, 0.99), "hist": list(h)}
+
+    def stats(self):
+        """返回诊断信息字典（分配内存，只在转储时调用）"""
+        return {
+            "budget_us": self.budget_us,
+            "bucket_base_us": BASE_US,
+            "loop": self._summary(self.loop),
+            "overruns": self.overruns,
+            "max_stall_us": self.max_stall_us,
+            "stall_phase": self.stall_phase,
+            "stall_phase_us": self.stall_phase_us,
+            "stall_age_ms": time.ticks_diff(time.ticks_ms(), self.stall_ms) if self.max_stall_us else 0,
+            "wdt": self.wdt is not None,
+            "feeds": self.feeds,
+            "phases": {name: self._summary(rec) for name, rec in self.phases.items()},
+        }
+
+    def json(self):
+        return ujson.dumps(self.stats()).encode('utf-8')
+
+    def report(self):
+        """通过串口打印各阶段耗时和直方图（直方图只打印到最后一个非空桶）"""
+        s = self.stats()
+        lp = s["loop"]
+        print(f"主循环: {lp['n']} 轮, 平均 {lp['avg_us']}us, p99 <{lp['p99_us']}us, 最大 {lp['max_us']}us, "
+              f"超预算 {s['overruns']} 轮, 看门狗{'已启用' if s['wdt'] else '未启用'}")
+        if s["max_stall_us"]:
+            print(f"最长卡顿: {s['max_stall_us']}us（{s['stall_age_ms'] // 1000} 秒前）, 其中 {s['stall_phase']} {s['stall_phase_us']}us")
+        for name, p in s["phases"].items():
+            h = p["hist"]
+            last = max((i for i in range(BUCKETS) if h[i]), default=0)
+            print(f"  阶段 {name}: {p['n']} 次, 平均 {p['avg_us']}us, p50 <{p['p50_us']}us, p99 <{p['p99_us']}us, "
+                  f"最大 {p['max_us']}us, 直方图 {h[:last + 1]}")
+
+class ProfileServer:
+    """非阻塞的HTTP诊断接口：GET /profile 返回JSON，GET /profile?reset=1 返回后清零；由主循环在空闲时 poll()"""
+
+    def __init__(self, profiler, port=9007):
+        self.profiler = profiler
+        self.sock = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
+        self.sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_REUSEADDR, 1)
+        self.sock.bind(('0.0.0.0', port))
+        self.sock.listen(2)
+        self.sock.setblocking(False)
+        self.requests = 0
+
+    def poll(self):
+        """处理一个待接受的连接，没有连接时立即返回"""
+        try:
+            cl, _ = self.sock.accept()
+        except OSError:
+            return False
+        try:
+            cl.settimeout(1)
+            req = cl.recv(256)
+            line = req.split(b'\r\n', 1)[0]
+            if line.startswith(b'GET /profile'):
+                body = self.profiler.json()
+                cl.write(("HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                          "Content-Length: %d\r\n\r\n" % len(body)).encode('utf-8'))
+                cl.write(body)
+                if b'reset=1' in line:
+                    self.profiler.reset()
+            else:
+                cl.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            self.requests += 1
+        except OSError as e:
+            print(f"诊断接口错误: {e}")
+        finally:
+            cl.close()
+        return True
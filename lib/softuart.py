@@ -0,0 +1,192 @@
+import time
+import micropython
+from machine import Pin, disable_irq, enable_irq
+
+try:
+    import esp32
+except ImportError:
+    esp32 = None
+
+# 软件串口发送（8N1），用空闲引脚向TGAM或另一台设备发送数据，与 Host/softuart.py 的时序模型对应
+# RMT: 外设按 APB时钟/clock_div 的精度产生整块波形，CPU只需填写电平表，发送期间不占用CPU
+# 截止时间: 每个位边沿的时刻按 ticks_us 绝对时间计算（小数部分不累积），忙等到达后翻转引脚；
+#           自校准测得的翻转延迟作为提前量，发送一个字节期间关中断
+RMT_CLOCK = 80000000
+RMT_MAX_TICKS = 32767
+FRAME_BITS = 10  # 起始位 + 8数据位 + 停止位
+
+class SoftUART:
+    """字节先写入环形发送队列，主循环中调用 poll() 逐块发出，write() 不阻塞"""
+
+    def __init__(self, pin, baud=57600, queue=256, rmt=True, rmt_channel=0, chunk=8, irq_off=True):
+        self.baud = baud
+        self.pin = Pin(pin, Pin.OUT, value=1) if isinstance(pin, int) else pin
+        self.pin.value(1)  # 空闲为高电平
+        self._q = bytearray(queue)
+        self._mask = queue - 1
+        if queue & self._mask:
+            raise ValueError("queue 必须是2的幂")
+        self.head = 0  # 写入计数
+        self.tail = 0  # 发送计数
+        self.irq_off = irq_off
+        self.dropped = 0
+        self.sent = 0
+        self.bursts = 0
+        self.rmt = None
+        if rmt and esp32 is not None:
+            # 每位一个脉冲，每位的tick数不能超过RMT_MAX_TICKS；chunk=8 时80个脉冲（40项）放得下一个通道的64项RAM
+            div = 1
+            while RMT_CLOCK // (div * baud) > RMT_MAX_TICKS:
+                div += 1
+            self.rmt = esp32.RMT(rmt_channel, pin=self.pin, clock_div=div, idle_level=True)
+            self.clock_div = div
+            self.bit_ticks = (RMT_CLOCK // div + baud // 2) // baud
+            self.chunk = chunk
+            # 电平表长度固定，不足一块时用高电平（空闲）补齐，发送时不分配内存
+            self._levels = [1] * (chunk * FRAME_BITS)
+        # 截止时间模式：第k个边沿相对起始位的微秒数
+        self._edge_us = [(k * 1000000 + baud // 2) // baud for k in range(FRAME_BITS + 1)]
+        self._next_us = time.ticks_us()
+        self.lead_us = 0
+        self.late_us = 0  # 最近一个字节各边沿从截止时刻到引脚翻转完成的平均微秒数，用于在线修正提前量
+        self.max_late_us = 0
+        if self.rmt is None:
+            self.calibrate()
+
+    @property
+    def pending(self):
+        return self.head - self.tail
+
+    def write(self, data):
+        """写入发送队列，返回接受的字节数；队列满时多余的字节计入 dropped"""
+        n = min(len(data), len(self._q) - (self.head - self.tail))
+        q, mask, h = self._q, self._mask, self.head
+        for i in range(n):
+            q[(h + i) & mask] = data[i]
+        self.head = h + n
+        self.dropped += len(data) - n
+        return n
+
+    def poll(self, budget_us=500):
+        """发送队列中的数据：RMT模式在上一块发完后启动下一块；截止时间模式最多忙等 budget_us 微秒"""
+        if self.head == self.tail:
+            return 0
+        if self.rmt is not None:
+            return self._poll_rmt()
+        start = time.ticks_us()
+        n = 0
+        frame_us = self._edge_us[FRAME_BITS]
+        while self.head != self.tail:
+            now = time.ticks_us()
+            if time.ticks_diff(now, start) + frame_us > budget_us and n:
+                break
+            wait = time.ticks_diff(self._next_us, now)
+            if wait > budget_us:
+                break  # 上一个字节的停止位还没结束
+            self._send_byte(self._q[self.tail & self._mask])
+            self.tail += 1
+            n += 1
+        self.sent += n
+        return n
+
+    def flush(self, timeout_ms=1000):
+        """阻塞直到队列发完（测试和关机前使用）"""
+        t0 = time.ticks_ms()
+        while self.head != self.tail or (self.rmt is not None and not self.rmt.wait_done()):
+            if time.ticks_diff(time.ticks_ms(), t0) > timeout_ms:
+                return False
+            self.poll()
+        return True
+
+    def _poll_rmt(self):
+        if not self.rmt.wait_done():
+            return 0
+        levels = self._levels
+        n = min(self.head - self.tail, self.chunk)
+        q, mask, t = self._q, self._mask, self.tail
+        pos = 0
+        for i in range(self.chunk):
+            if i < n:
+                b = q[(t + i) & mask]
+                levels[pos] = 0
+                for k in range(8):
+                    levels[pos + 1 + k] = (b >> k) & 1
+                levels[pos + 9] = 1
+            else:
+                for k in range(FRAME_BITS):
+                    levels[pos + k] = 1
+            pos += FRAME_BITS
+        # 所有位等长：write_pulses 的单一时长+电平表形式，不需要合并同电平段
+        self.rmt.write_pulses(self.bit_ticks, levels)
+        self.tail = t + n
+        self.sent += n
+        self.bursts += 1
+        return n
+
+    @micropython.native
+    def _send_byte(self, b):
+        value = self.pin.value
+        edges = self._edge_us
+        frame = (b << 1) | 0x200  # 第0位为起始位，第9位为停止位
+        lead = self.lead_us
+        t0 = time.ticks_us()
+        if time.ticks_diff(self._next_us, t0) > 0:
+            t0 = self._next_us
+            w = time.ticks_add(t0, -lead)
+            while time.ticks_diff(time.ticks_us(), w) < 0:
+                pass
+        state = disable_irq() if self.irq_off else 0
+        value(0)
+        late = 0
+        level = 0
+        n = 0
+        for k in range(1, FRAME_BITS):
+            bit = (frame >> k) & 1
+            if bit == level:
+                continue  # 电平不变，无需翻转
+            d = time.ticks_add(t0, edges[k] - lead)
+            while time.ticks_diff(time.ticks_us(), d) < 0:
+                pass
+            value(bit)
+            late += time.ticks_diff(time.ticks_us(), d)
+            level = bit
+            n += 1
+        if self.irq_off:
+            enable_irq(state)
+        self._next_us = time.ticks_add(t0, edges[FRAME_BITS])
+        late //= n  # 停止位总是高电平，至少有一个边沿
+        self.late_us = late
+        if late > self.max_late_us:
+            self.max_late_us = late
+        # 自校准：提前量每个字节最多调整1us，逐渐趋近实测的平均翻转延迟
+        if late > lead:
+            self.lead_us = lead + 1
+        elif late < lead:
+            self.lead_us = lead - 1
+
+    def calibrate(self, n=200):
+        """测量忙等循环一次和翻转引脚的耗时，以半个循环加一次翻转作为初始提前量，之后由 _send_byte 在线修正"""
+        value = self.pin.value
+        t0 = time.ticks_us()
+        d = time.ticks_add(t0, 1000000)
+        for _ in range(n):
+            time.ticks_diff(time.ticks_us(), d) < 0
+        loop_us = time.ticks_diff(time.ticks_us(), t0) / n
+        t0 = time.ticks_us()
+        for _ in range(n):
+            value(1)
+        pin_us = time.ticks_diff(time.ticks_us(), t0) / n
+        self.loop_us = loop_us
+        self.pin_us = pin_us
+        self.lead_us = int(loop_us / 2 + pin_us + 0.5)
+        return loop_us, pin_us
+
+    def stats(self):
+        s = {"baud": self.baud, "sent": self.sent, "pending": self.head - self.tail, "dropped": self.dropped}
+        if self.rmt is not None:
+            s.update({"mode": "rmt", "clock_div": self.clock_div, "bit_ticks": self.bit_ticks, "bursts": self.bursts,
+                      "baud_error_ppm": int((RMT_CLOCK / self.clock_div / self.bit_ticks / self.baud - 1) * 1e6)})
+        else:
+            s.update({"mode": "deadline", "lead_us": self.lead_us, "loop_us": self.loop_us, "pin_us": self.pin_us,
+                      "max_late_us": self.max_late_us})
+        return s
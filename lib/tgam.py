@@ -0,0 +1,23 @@
+# TGAM 数据帧公共定义，供 lib 下各固件模块共享
+
+# 定义EEG频段名称
+EEG_BANDS = ["Delta", "Theta", "LowAlpha", "HighAlpha", "LowBeta", "HighBeta", "LowGamma", "MiddleGamma"]
+
+FRAME_LEN = 36  # 大包帧长度：AA AA 20 + 32字节负载 + 校验和
+START_SEQUENCE = b'\xAA\xAA\x20\x02'  # 帧起始标记
+
+def frame_valid(buf, off=0):
+    """在不分配内存的前提下检查 buf[off:off+36] 是否为有效帧"""
+    return (buf[off] == 0xAA and buf[off + 1] == 0xAA and buf[off + 2] == 0x20 and buf[off + 3] == 0x02
+            and buf[off + 31] == 0x04 and buf[off + 33] == 0x05)
+
+def is_zero_frame(frame):
+    """专注度和放松度均为0视为零帧（未佩戴）"""
+    return frame[32] == 0x00 and frame[34] == 0x00
+
+def band_powers(frame, out, off=0):
+    """把frame[7:31]中8组3字节大端功率值解码到out[off:off+8]，不分配内存"""
+    for i in range(8):
+        j = 7 + i * 3
+        out[off + i] = (frame[j] << 16) | (frame[j + 1] << 8) | frame[j + 2]
+    return out
@@ -0,0 +1,123 @@
+import struct
+import time
+import usocket
+
+# 时钟同步报文（UDP），与 Host/receiver.py 对应
+# 请求: b'SYNC' + t0(8B)，设备发送时间
+# 应答: b'SYNC' + t0(8B) + t1(8B) + t2(8B)，服务器收到和发出的时间（Unix微秒）
+SYNC_MAGIC = b'SYNC'
+_REQ_FMT = '<4sq'
+_RESP_FMT = '<4sqqq'
+_REQ_SIZE = 12
+_RESP_SIZE = 28
+
+class Clock:
+    """把会回绕的 ticks_us 展开成单调递增的微秒计数，需至少每几分钟调用一次"""
+
+    def __init__(self):
+        self._last = time.ticks_us()
+        self._base = 0
+
+    def now_us(self):
+        t = time.ticks_us()
+        self._base += time.ticks_diff(t, self._last)
+        self._last = t
+        return self._base
+
+    def from_ticks(self, ticks):
+        """把过去某个 ticks_us 值换算到展开后的时间轴"""
+        return self.now_us() - time.ticks_diff(self._last, ticks)
+
+class ClockSync:
+    """与接收端做NTP式时间交换，往返时延明显变差的样本不用于更新设备时钟偏移"""
+
+    def __init__(self, clock, addr=("255.255.255.255", 9005), interval_ms=30000, warmup=5, timeout=0.1):
+        self.clock = clock
+        self.addr = addr
+        self.interval_ms = interval_ms
+        self.warmup = warmup  # 启动后以1秒间隔快速同步的次数
+        self.offset_us = 0  # 服务器时间 = 设备时间 + offset_us
+        self.rtt_us = -1  # 当前偏移对应的往返时延，-1 表示尚未同步
+        self.samples = 0
+        self._req = bytearray(_REQ_SIZE)
+        self._last_req = None
+        self.sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+        if addr[0] == "255.255.255.255":
+            self.sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_BROADCAST, 1)
+        self.sock.settimeout(timeout)  # 等待应答的最长时间，会短暂阻塞主循环
+
+    @property
+    def synced(self):
+        return self.rtt_us >= 0
+
+    def to_server(self, dev_us):
+        return dev_us + self.offset_us
+
+    def poll(self, now_ms):
+        """到达同步间隔时发出请求并短暂等待应答，应答立即处理以保证t3准确"""
+        interval = 1000 if self.samples < self.warmup else self.interval_ms
+        if self._last_req is not None and time.ticks_diff(now_ms, self._last_req) < interval:
+            return
+        self._last_req = now_ms
+        t0 = self.clock.now_us()
+        struct.pack_into(_REQ_FMT, self._req, 0, SYNC_MAGIC, t0)
+        try:
+            self.sock.sendto(self._req, self.addr)
+            while True:
+                data, addr = self.sock.recvfrom(64)
+                # 跳过之前超时请求迟到的应答
+                if len(data) == _RESP_SIZE and data[:4] == SYNC_MAGIC and struct.unpack_from('<q', data, 4)[0] == t0:
+                    self._on_reply(data, addr)
+                    return
+        except OSError:
+            pass  # 超时或网络错误，下个间隔重试
+
+    def _on_reply(self, data, addr):
+        t3 = self.clock.now_us()
+        _, t0, t1, t2 = struct.unpack(_RESP_FMT, data)
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return
+        self.samples += 1
+        # 偏移会随时钟漂移变化，每次都接受新样本，但往返时延明显更差时保留旧值
+        if self.rtt_us < 0 or rtt <= self.rtt_us * 2 or self.samples % 10 == 0:
+            self.offset_us = ((t1 - t0) + (t2 - t3)) // 2
+            self.rtt_us = rtt
+        if self.addr[0] == "255.255.255.255":
+            # 找到接收端后改为单播同步
+            self.addr = (addr[0], self.addr[1])
+            self.sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_BROADCAST, 0)
+
+class FrameTrace:
+    """一帧的追踪时间戳（设备展开后的微秒）：UART读取、解析、发送"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.seq = 0
+        self.t_uart = 0
+        self.t_parse = 0
+        self.t_send = 0
+
+    def stamp_uart(self, ticks=None):
+        self.t_uart = self.clock.now_us() if ticks is None else self.clock.from_ticks(ticks)
+
+    def stamp_parse(self):
+        self.t_parse = self.clock.now_us()
+
+    def stamp_send(self):
+        self.t_send = self.clock.now_us()
+        self.seq += 1
+
+    def json_suffix(self, sync, chip_id=None):
+        """生成追加到JSON对象末尾的追踪字段（已换算为服务器时间），以 ', ' 开头；JSON中已有id时不传chip_id"""
+        off = sync.offset_us
+        s = ', "seq": %d, "tr": [%d, %d, %d], "rtt": %d' % (
+            self.seq, self.t_uart + off, self.t_parse + off, self.t_send + off, sync.rtt_us)
+        if chip_id:
+            s = ', "id": "%s"' % chip_id + s
+        return s
+
+    def header_value(self, sync):
+        """生成HTTP X-Trace 头的值: seq,uart,parse,send,rtt（服务器时间微秒）"""
+        off = sync.offset_us
+        return '%d,%d,%d,%d,%d' % (self.seq, self.t_uart + off, self.t_parse + off, self.t_send + off, sync.rtt_us)
@@ -0,0 +1,114 @@
+import time
+import usocket
+from frame_ring import FrameRing
+from uart_reader import FrameScanner
+from eegcodec import BatchEncoder
+
+# 多通道上行数据报（版本1），与 Host/eegcodec.py 的 decode_hub_packet 对应
+# 'E' 'H' 版本(1B) 段数(1B) 芯片ID长度(1B) 芯片ID
+# 每段: 通道号(1B) 长度(2B小端) 一个批量编码批次（见 eegcodec.py）
+HUB_MAGIC = b'EH'
+HUB_VERSION = 1
+
+class HubChannel:
+    """一个TGAM通道：独立的UART、帧同步状态和帧队列"""
+
+    def __init__(self, ch, uart, slots=16, rxbuf=2048):
+        self.ch = ch
+        self.uart = uart
+        self.rxbuf = rxbuf
+        self.ring = FrameRing(slots)
+        self.scanner = FrameScanner(self.ring)
+        self.last_frame_ms = time.ticks_ms()
+        self.overflows = 0  # 读取前UART接收缓冲区已满的次数（期间到达的数据已丢失）
+        self.max_backlog = 0  # 读取前UART接收缓冲区中的最大字节数
+
+    def poll(self):
+        """读取并解析该通道所有可用数据"""
+        backlog = self.uart.any()
+        if backlog > self.max_backlog:
+            self.max_backlog = backlog
+        if backlog >= self.rxbuf - 1:  # 环形缓冲区最多存放 rxbuf-1 字节
+            self.overflows += 1
+        while self.scanner.read_from(self.uart):
+            pass
+
+class HubSender:
+    """所有通道共用的批量发送器：按通道分别做增量编码，合并成一个UDP数据报发送"""
+
+    def __init__(self, chip_id, channels, addr, max_frames=16, flush_ms=1000):
+        self.addr = addr
+        self.flush_ms = flush_ms
+        self._encoders = {}
+        for ch in channels:
+            self._encoders[ch] = BatchEncoder(max_frames)
+        cid = chip_id.encode('utf-8')
+        head = bytearray(5 + len(cid))
+        head[0:2] = HUB_MAGIC
+        head[2] = HUB_VERSION
+        head[4] = len(cid)
+        head[5:] = cid
+        self._head_len = len(head)
+        enc_size = max(len(e._buf) for e in self._encoders.values())
+        self._out = bytearray(self._head_len + len(channels) * (3 + enc_size))
+        self._out[:self._head_len] = head
+        self._out_mv = memoryview(self._out)
+        self._last_flush = time.ticks_ms()
+        self.pending = 0
+        self.datagrams = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.send_errors = 0
+        self.sock = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+        if addr[0] == "255.255.255.255":
+            self.sock.setsockopt(usocket.SOL_SOCKET, usocket.SO_BROADCAST, 1)
+
+    def add(self, ch, frame, ts_ms):
+        """加入一帧，某通道批次已满时先整体发送"""
+        enc = self._encoders[ch]
+        if enc.count == 0:
+            enc.reset(ts_ms)
+        elif enc.full():
+            self.flush(ts_ms)
+            enc.reset(ts_ms)
+        enc.add(frame, ts_ms)
+        self.pending += 1
+
+    def due(self, now_ms):
+        return self.pending and time.ticks_diff(now_ms, self._last_flush) >= self.flush_ms
+
+    def flush(self, now_ms):
+        """把所有通道的待发批次合并为一个数据报发送"""
+        out = self._out
+        mv = self._out_mv
+        pos = self._head_len
+        sections = 0
+        frames = 0
+        for ch, enc in self._encoders.items():
+            if enc.count == 0:
+                continue
+            payload = enc.payload()
+            n = len(payload)
+            out[pos] = ch
+            out[pos + 1] = n & 0xFF
+            out[pos + 2] = n >> 8
+            mv[pos + 3:pos + 3 + n] = payload
+            pos += 3 + n
+            sections += 1
+            frames += enc.count
+            enc.reset()
+        self._last_flush = now_ms
+        self.pending = 0
+        if not sections:
+            return True
+        out[3] = sections
+        try:
+            self.sock.sendto(mv[:pos], self.addr)
+            self.frames_sent += frames  # 发送成功后才计入
+            self.datagrams += 1
+            self.bytes_sent += pos
+            return True
+        except OSError as e:
+            self.send_errors += 1
+            print(f"多通道数据发送失败: {e}")
+            return False
@@ -0,0 +1,76 @@
+import _thread
+import time
+from tgam import FRAME_LEN, START_SEQUENCE, frame_valid
+
+class FrameScanner:
+    """从UART读取数据、同步帧头，并把有效帧写入FrameRing；每个UART通道一个实例，状态互不影响"""
+
+    def __init__(self, ring, buf_size=512, raw_sink=None):
+        self.ring = ring
+        self.raw_sink = raw_sink  # 可选：接收每个原始数据块，例如 BandPower.feed
+        self._buf = bytearray(buf_size)
+        self._mv = memoryview(self._buf)
+        self._fill = 0
+        self._read_us = 0  # 最近一次读到数据的时间，作为该批帧的接收时间
+        self.bytes_read = 0
+        self.frames = 0  # 写入队列的有效帧数
+        self.bad_frames = 0  # 帧头正确但格式错误的帧数
+
+    def read_from(self, uart):
+        """读取一次UART并解析，返回读取的字节数"""
+        n = uart.readinto(self._mv[self._fill:])
+        if n:
+            self._read_us = time.ticks_us()
+            self.bytes_read += n
+            if self.raw_sink:
+                self.raw_sink(self._mv[self._fill:self._fill + n])
+            self._fill += n
+            self._scan()
+        return n or 0
+
+    def _scan(self):
+        """在缓冲区中查找并提取完整帧，剩余字节移到缓冲区开头"""
+        buf = self._buf
+        fill = self._fill
+        pos = 0
+        while fill - pos >= FRAME_LEN:
+            idx = buf.find(START_SEQUENCE, pos, fill)
+            if idx == -1:
+                pos = fill - 3  # 保留最后3个字节以防分割序列
+                break
+            pos = idx
+            if fill - pos < FRAME_LEN:
+                break
+            if frame_valid(buf, pos):
+                self.ring.push(self._mv, pos, self._read_us)
+                self.frames += 1
+            else:
+                self.bad_frames += 1
+            pos += FRAME_LEN
+        if fill == len(buf) and pos == 0:
+            pos = fill - 3  # 缓冲区写满仍无帧头，丢弃旧数据
+        rem = fill - pos
+        for i in range(rem):
+            buf[i] = buf[pos + i]
+        self._fill = rem
+
+class UartReader(FrameScanner):
+    """在独立线程中读取UART、同步帧头，并把有效帧写入FrameRing"""
+
+    def __init__(self, uart, ring, buf_size=512, raw_sink=None):
+        super().__init__(ring, buf_size, raw_sink)
+        self.uart = uart
+        self.running = False
+
+    def start(self):
+        """启动读取线程"""
+        self.running = True
+        _thread.start_new_thread(self._run, ())
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            if not self.read_from(self.uart):
+                time.sleep_ms(2)  # 无数据时让出CPU，57600波特率下2ms约11字节
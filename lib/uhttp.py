@@ -0,0 +1,146 @@
+import usocket
+
+_LEN_WIDTH = 6  # Content-Length 预留的位数，不足部分用空格填充（HTTP允许字段值后跟空白）
+_HEADER_END = b'\r\n\r\n'
+_CLOSED = "连接已关闭"
+_STALE_ERRNO = (32, 104)  # EPIPE、ECONNRESET
+
+class KeepAliveClient:
+    """精简的HTTP/1.1长连接POST客户端：请求头预先生成，每次只修改Content-Length"""
+
+    def __init__(self, host, port, path, content_type='application/octet-stream', timeout=5, trace_width=0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        head = "POST %s HTTP/1.1\r\nHost: %s:%d\r\nContent-Type: %s\r\nConnection: keep-alive\r\n" % (path, host, port, content_type)
+        # 可选的 X-Trace 头，同样预留固定宽度，每次只改写内容
+        self._trace_width = trace_width
+        if trace_width:
+            head += "X-Trace: "
+            self._trace_off = len(head)
+            head += " " * trace_width + "\r\n"
+        head += "Content-Length: "
+        self._len_off = len(head)
+        self._header = bytearray(head.encode('utf-8') + b' ' * _LEN_WIDTH + _HEADER_END)
+        self._header_mv = memoryview(self._header)
+        self._resp = bytearray(512)  # 响应头缓冲区，也用于丢弃响应体
+        self._resp_mv = memoryview(self._resp)
+        self._resp_n = 0  # 本次请求已收到的响应字节数
+        self._addr = None
+        self.sock = None
+        self.connects = 0
+        self.requests = 0
+
+    def _connect(self):
+        if self._addr is None:
+            self._addr = usocket.getaddrinfo(self.host, self.port)[0][-1]
+        sock = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self._addr)
+        except OSError:
+            sock.close()
+            self._addr = None  # 下次重新解析地址
+            raise
+        if hasattr(usocket, 'TCP_NODELAY'):
+            # 请求头和请求体分两次写入，关闭Nagle避免等待延迟ACK
+            sock.setsockopt(usocket.IPPROTO_TCP, usocket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.connects += 1
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _set_length(self, n):
+        """把长度写入请求头预留位置，不生成新的请求头"""
+        hdr = self._header
+        off = self._len_off
+        digits = str(n)
+        if len(digits) > _LEN_WIDTH:
+            raise ValueError("请求体过大")
+        for i in range(_LEN_WIDTH):
+            hdr[off + i] = ord(digits[i]) if i < len(digits) else 0x20
+
+    def set_trace(self, value):
+        """写入 X-Trace 头的值，超出预留宽度时截断"""
+        hdr = self._header
+        off = self._trace_off
+        n = len(value)
+        for i in range(self._trace_width):
+            hdr[off + i] = ord(value[i]) if i < n else 0x20
+
+    def post(self, body):
+        """发送请求体（bytes/bytearray/memoryview），返回状态码；请求体写出前失败，或复用的长连接已失效时自动重连重发一次，
+        请求体写出后读取响应超时等情况下服务器可能已处理了请求，不重发以免重复上传"""
+        self._set_length(len(body))
+        for attempt in range(2):
+            reused = self.sock is not None
+            sent = False
+            try:
+                if self.sock is None:
+                    self._connect()
+                self.sock.write(self._header_mv)
+                self.sock.write(body)
+                sent = True
+                status = self._read_response()
+                self.requests += 1
+                return status
+            except OSError as e:
+                self.close()
+                if attempt or sent and not (reused and self._stale(e)):
+                    raise
+
+    def _stale(self, e):
+        """复用的长连接在收到任何响应字节前被关闭或重置：服务器已因空闲超时关闭连接，请求未被处理"""
+        return self._resp_n == 0 and bool(e.args) and (e.args[0] == _CLOSED or e.args[0] in _STALE_ERRNO)
+
+    def _read_response(self):
+        """只解析状态行和Content-Length，丢弃其余响应头和响应体"""
+        buf = self._resp
+        mv = self._resp_mv
+        n = 0
+        self._resp_n = 0
+        end = -1
+        while end < 0:
+            if n == len(buf):
+                raise OSError("响应头过长")
+            r = self.sock.readinto(mv[n:])
+            if not r:
+                raise OSError(_CLOSED)
+            n += r
+            self._resp_n = n
+            end = buf.find(_HEADER_END, 0, n)
+        if buf[0:5] != b'HTTP/':
+            raise OSError("响应格式错误")
+        status = (buf[9] - 48) * 100 + (buf[10] - 48) * 10 + (buf[11] - 48)
+
+        length = -1
+        idx = buf.find(b'ontent-Length:', 0, end)
+        if idx < 0:
+            idx = buf.find(b'ontent-length:', 0, end)
+        if idx >= 0:
+            idx += 14
+            length = 0
+            while buf[idx] == 0x20:
+                idx += 1
+            while 48 <= buf[idx] <= 57:
+                length = length * 10 + buf[idx] - 48
+                idx += 1
+        keep = length >= 0 and buf.find(b'onnection: close', 0, end) < 0
+
+        # 丢弃响应体，保证下一次请求从干净的连接开始
+        remaining = length - (n - end - 4)
+        while keep and remaining > 0:
+            r = self.sock.readinto(mv[:min(remaining, len(buf))])
+            if not r:
+                keep = False
+                break
+            remaining -= r
+        if not keep:
+            self.close()  # 无法确定响应体边界时不复用连接
+        return status